@@ -9,23 +9,85 @@ from functools import wraps
 import time
 import decimal
 import json
+import random
 import boto3
 from collections.abc import MutableMapping
 from itertools import islice
-from concurrent.futures import ThreadPoolExecutor
 
 secret_mngr = boto3.client('secretsmanager')
 API_TOKEN = os.getenv('API_TOKEN') or secret_mngr.get_secret_value(SecretId=f'iextoken-{os.getenv("ENV")}')['SecretString']
-BASE_API_URL: str = 'https://cloud.iexapis.com/v1/'
-MAX_RETRIEVAL_THREADS = 16
-MAX_PERSISTENCE_THREADS = 16
+BASE_API_URL: str = os.getenv('IEX_BASE_API_URL', 'https://cloud.iexapis.com/v1/')
+# directory to save every IEX response into, see datawell.recorder
+IEX_RECORD_DIR = os.getenv('IEX_RECORD_DIR', None)
+MAX_RETRIEVAL_THREADS = int(os.getenv('MAX_RETRIEVAL_THREADS', 16))
+MAX_PERSISTENCE_THREADS = int(os.getenv('MAX_PERSISTENCE_THREADS', 16))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', MAX_RETRIEVAL_THREADS))
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 4))
+HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'true') == 'true'
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+ASYNC_RETRIEVAL = os.getenv('ASYNC_RETRIEVAL', 'false') == 'true'
+ASYNC_RETRIEVAL_CONCURRENCY = int(os.getenv('ASYNC_RETRIEVAL_CONCURRENCY', 200))
+IEX_RATE_LIMIT = float(os.getenv('IEX_RATE_LIMIT', 100))
+IEX_RATE_BURST = int(os.getenv('IEX_RATE_BURST', 10))
+# full jitter backoff of retries after IEX server errors, see app.backoff_delay
+IEX_BACKOFF_BASE = float(os.getenv('IEX_BACKOFF_BASE', 0.1))
+IEX_BACKOFF_CAP = float(os.getenv('IEX_BACKOFF_CAP', 5))
+STREAMING_PIPELINE = os.getenv('STREAMING_PIPELINE', 'false') == 'true'
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+PIPELINE_SINK_WORKERS = int(os.getenv('PIPELINE_SINK_WORKERS', 2))
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+DATAPOINT_CACHE = os.getenv('DATAPOINT_CACHE', None)
+# seconds each IEX datapoint is reused from DATAPOINT_CACHE, datapoints missing here are always retrieved
+DATAPOINT_TTL = {
+    'company': 7 * 24 * 3600,
+    'financials': 24 * 3600,
+    'cash-flow': 24 * 3600,
+    'dividends': 24 * 3600,
+    **json.loads(os.getenv('DATAPOINT_TTL', '{}'))
+}
+# attempts and full jitter backoff in seconds of DynamoDB batch writes and reads, see backoff_delay
+DYNAMO_WRITE_TRIES = int(os.getenv('DYNAMO_WRITE_TRIES', 8))
+DYNAMO_READ_TRIES = int(os.getenv('DYNAMO_READ_TRIES', 8))
+DYNAMO_BACKOFF_BASE = float(os.getenv('DYNAMO_BACKOFF_BASE', 0.05))
+DYNAMO_BACKOFF_CAP = float(os.getenv('DYNAMO_BACKOFF_CAP', 5))
+# write capacity units provisioned for the table and its indexes, writes are paced to
+# DYNAMO_WRITE_UTILIZATION share of them when set, see persistence.governor
+DYNAMO_WCU = float(os.getenv('DYNAMO_WCU', 0))
+DYNAMO_INDEX_WCU = float(os.getenv('DYNAMO_INDEX_WCU', 0))
+DYNAMO_WRITE_UTILIZATION = float(os.getenv('DYNAMO_WRITE_UTILIZATION', 0.9))
+# partition key values every date is spread over in DynamoDB, 0 keeps date itself as partition key
+DYNAMO_SHARDS = int(os.getenv('DYNAMO_SHARDS', 0))
+# days DynamoDB items expire after they are written, 0 keeps them forever
+DYNAMO_TTL_DAYS = float(os.getenv('DYNAMO_TTL_DAYS', 0))
+# DynamoDB attributes stored as compressed binary when over threshold bytes, see persistence.compression
+DYNAMO_COMPRESS = [a for a in os.getenv('DYNAMO_COMPRESS', '').split(',') if a]
+DYNAMO_COMPRESS_THRESHOLD = int(os.getenv('DYNAMO_COMPRESS_THRESHOLD', 1024))
+DYNAMO_COMPRESS_CODEC = os.getenv('DYNAMO_COMPRESS_CODEC', 'zlib')
+# parallel segments of DynamoDB full table scans
+DYNAMO_SCAN_SEGMENTS = int(os.getenv('DYNAMO_SCAN_SEGMENTS', 8))
 S3_URI = os.getenv('S3_URI', None)
 SQS_URI = os.getenv('SQS_URI', None)
+# 'objects' or 'snapshot', see persistence.s3store
+S3_LAYOUT = os.getenv('S3_LAYOUT', 'objects')
+# persistence.serialization spec of stored documents e.g. 'binary+zlib',
+# 'pickle' keeps S3 objects headerless pickles and 'json' keeps SQS bodies plain json
+S3_SERIALIZER = os.getenv('S3_SERIALIZER', 'pickle')
+SQS_SERIALIZER = os.getenv('SQS_SERIALIZER', 'json')
+# persistence.cachingstore: results kept in memory, seconds they're fresh in memory and on disk,
+# sqlite file of disk tier (none when not set)
+STORE_CACHE_ENTRIES = int(os.getenv('STORE_CACHE_ENTRIES', 256))
+STORE_CACHE_TTL = float(os.getenv('STORE_CACHE_TTL', 300))
+STORE_CACHE_DISK_TTL = float(os.getenv('STORE_CACHE_DISK_TTL', 86400))
+STORE_CACHE_PATH = os.getenv('STORE_CACHE_PATH', None)
+# snapshot multipart upload: bytes per part and parts kept in memory at once
+S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', 8 * 1024 * 1024))
+S3_PARTS_IN_FLIGHT = int(os.getenv('S3_PARTS_IN_FLIGHT', 4))
 DYNAMO_URI = os.getenv('DYNAMO_URI', None)
 STOCKS = {}
 ENVIRONMENT = os.getenv('ENV')
 
-if os.getenv('TEST_ENVIRONMENT') == 'true':
+if os.getenv('TEST_ENVIRONMENT') == 'true' and not os.getenv('IEX_BASE_API_URL'):
     BASE_API_URL: str = 'https://sandbox.iexapis.com/stable/'
 
 if os.getenv('TEST_STOCKS', 'false') == 'true':
@@ -116,51 +178,96 @@ def get_logger(module_name: str, level: str = logging.INFO):
     return logger
 
 
-def check_func(val):
-    if val in [[], {}]:
-        return False
-    elif remove_empty_strings(val) not in [None, [], {}]:
-        return True
+_EMPTY_VALUES = (None, [], {})
 
 
 # Function to search in nested dict:
 def remove_empty_strings(dictionary):
+    """
+    Drops empty strings, Nones, empty lists and dicts (including ones which become
+    empty after cleanup) from nested dicts and lists, keeps zeros and False.
+    Every value is visited once.
+    """
     if type(dictionary) == list:
-        return [
-            remove_empty_strings(val)
-            for val in dictionary
-            if check_func(val)]
+        cleaned = (remove_empty_strings(val) for val in dictionary)
+        return [val for val in cleaned if val not in _EMPTY_VALUES]
     elif type(dictionary) == dict:
-        return {
-            key: remove_empty_strings(val)
-            for key, val in dictionary.items()
-            if check_func(val)}
+        cleaned = ((key, remove_empty_strings(val)) for key, val in dictionary.items())
+        return {key: val for key, val in cleaned if val not in _EMPTY_VALUES}
     elif dictionary or dictionary is False or dictionary == 0:
         return dictionary
 
-def dict_cleanup(f):
-    #@wraps(f)
-    def f_dict_cleanup(*args, **kwargs):
-        return remove_empty_strings(f(*args, **kwargs))
-    return f_dict_cleanup
+
+def _remove_empty_decoded(value):
+    """
+    remove_empty_strings for values decoded with cleanup_hook: their dicts are clean already.
+    """
+    if type(value) == list:
+        cleaned = (_remove_empty_decoded(val) for val in value)
+        return [val for val in cleaned if val not in _EMPTY_VALUES]
+    elif type(value) == dict:
+        return value
+    elif value or value is False or value == 0:
+        return value
+
+
+def cleanup_hook(pairs):
+    """
+    object_pairs_hook for json.loads which drops empty values while decoding,
+    see loads_clean.
+    """
+    cleaned = ((key, _remove_empty_decoded(val)) for key, val in dict(pairs).items())
+    return {key: val for key, val in cleaned if val not in _EMPTY_VALUES}
+
+
+def loads_clean(data, parse_float=decimal.Decimal):
+    """
+    Decodes json and drops empty values in the same pass,
+    result is the same as of remove_empty_strings(json.loads(data)).
+    :param data: json as str or bytes
+    :param parse_float: type to decode floats into, Decimal by default
+    """
+    return _remove_empty_decoded(
+        json.loads(data, parse_float=parse_float, object_pairs_hook=cleanup_hook))
+
+
+def split(data, size: int):
+    """
+    Slices dict or list into chunks of given size.
+    :param data: dict or list to slice
+    :param size: max number of elements in a chunk
+    :return: generator of dicts or lists, AppException for other types
+    """
+    if type(data) == dict:
+        it = iter(data)
+        for i in range(0, len(data), size):
+            yield {k: data[k] for k in islice(it, size)}
+    elif type(data) == list:
+        for i in range(0, len(data), size):
+            yield data[i:i+size]
+    else:
+        message = f'Can not slice over {type(data)}'
+        raise AppException(TypeError, message)
 
 def batchify(
         param_to_slice: str, size: int,
         multiprocess: bool = False,
-        workers: int = os.cpu_count()
+        workers: int = os.cpu_count(),
+        stage: str = None,
+        splitter=None
     ):
-    def split(data, size: int):
-        if type(data) == dict:
-            it = iter(data)
-            for i in range(0, len(data), size):
-                yield {k: data[k] for k in islice(it, size)}
-        elif type(data) == list:
-            for i in range(0, len(data), size):
-                yield data[i:i+size]
-        else:
-            message = f'Can not slice over {type(data)}'
-            raise AppException(TypeError, message)
-
+    """
+    Decorator. Calls decorated function once per slice of kwargs[param_to_slice].
+    With multiprocess slices run in BatchExecutor shared by the stage, otherwise
+    one by one in the calling thread.
+    :param param_to_slice: name of dict or list kwarg to slice
+    :param size: max number of elements in a slice
+    :param multiprocess: run slices concurrently
+    :param workers: threads in stage executor if it has to be created
+    :param stage: stage executor name, decorated function name by default
+    :param splitter: function(data, size) returning slices, split by default
+    :return: BatchResults with value or exception and elapsed time per slice
+    """
     def deco_batchify(f):
         #@wraps(f)
         def f_batchify(*args, **kwargs):
@@ -168,11 +275,15 @@ def batchify(
                 message = f"Can not find param {param_to_slice} in kwargs"
                 raise AppException(Exception, message)
             data = kwargs[param_to_slice]
-            max_workes = workers if multiprocess else 1
-            with ThreadPoolExecutor(max_workers=max_workes) as executor:
-                for d in split(data,size):
-                    kwargs[param_to_slice] = d
-                    executor.submit(f ,*args, **kwargs)
+
+            def call(chunk):
+                return f(*args, **{**kwargs, param_to_slice: chunk})
+
+            slices = (splitter or split)(data, size)
+            if not multiprocess:
+                return run_batches(call, slices)
+            executor = get_executor(stage or f.__qualname__, workers)
+            return executor.map(call, slices)
         return f_batchify
     return deco_batchify
 
@@ -208,13 +319,25 @@ def retry(exceptions, tries: int = 4,
                     time.sleep(mdelay)
                     mtries -= 1
                     mdelay *= backoff
-            return f(*args, **kwargs)
+            return f(self, *args, **kwargs)
 
         return f_retry  # true decorator
 
     return deco_retry
 
 
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Exponential backoff with full jitter: random delay up to base * 2 ** attempt, never over cap.
+    Spreads retries of concurrent writers instead of sending them in waves.
+    :param attempt: number of retries made so far, starting at 0
+    :param base: delay limit of the first retry in seconds
+    :param cap: biggest delay limit in seconds
+    :return: seconds to sleep before the retry
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
 def func_time(logger=None):
     """
     Decorator. Measures function execution time.
@@ -234,3 +357,7 @@ def func_time(logger=None):
         return time_measure
 
     return deco_func_time
+
+
+from app.scheduler import scheduler  # noqa: E402
+from app.batch import BatchResult, BatchResults, get_executor, run_batches  # noqa: E402
@@ -0,0 +1,167 @@
+"""
+Contains batch execution API: shared executors per stage returning results, errors and timings per batch
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures import as_completed as futures_completed
+
+import app
+from app.scheduler import WorkerPool, scheduler
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class BatchResult(object):
+    def __init__(self, index: int, value=None, error: Exception = None, elapsed: float = 0.0):
+        self.index = index
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        outcome = f'error={self.error!r}' if self.error else f'value={self.value!r}'
+        return f'BatchResult(index={self.index}, {outcome}, elapsed={self.elapsed:.3f})'
+
+
+class BatchResults(list):
+    """
+    List of BatchResult with helpers to get values, errors and timings out of it.
+    """
+
+    @property
+    def values(self) -> list:
+        return [r.value for r in self if r.ok]
+
+    @property
+    def errors(self) -> list:
+        return [r.error for r in self if not r.ok]
+
+    def raise_for_errors(self, message: str = 'Batch execution failed!'):
+        """
+        :return: self when all batches succeeded, raises AppException with the first error otherwise
+        """
+        errors = self.errors
+        if errors:
+            raise app.AppException(errors[0], f'{message} {len(errors)} of {len(self)} batches failed.')
+        return self
+
+    def stats(self) -> dict:
+        """
+        :return: dict with batches count, errors count and batch latency percentiles in ms
+        """
+        timings = sorted(r.elapsed for r in self)
+
+        def percentile(p: float) -> float:
+            if not timings:
+                return 0.0
+            return round(timings[min(len(timings) - 1, int(p * len(timings)))] * 1000, 1)
+
+        return {
+            'batches': len(self),
+            'errors': len(self.errors),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': percentile(1.0),
+            'total_ms': round(sum(timings) * 1000, 1)
+        }
+
+
+def run_batch(fn, index: int, batch) -> BatchResult:
+    """
+    Calls fn(batch) and wraps its value or exception along with elapsed time into BatchResult.
+    """
+    start = time.perf_counter()
+    try:
+        return BatchResult(index, value=fn(batch), elapsed=time.perf_counter() - start)
+    except Exception as e:
+        return BatchResult(index, error=e, elapsed=time.perf_counter() - start)
+
+
+def run_batches(fn, batches) -> BatchResults:
+    """
+    Runs batches one by one in the calling thread.
+    """
+    return BatchResults(run_batch(fn, i, b) for i, b in enumerate(batches))
+
+
+class BatchExecutor(object):
+    """
+    Runs batch jobs on a worker pool shared by one stage (e.g. retrieval or persistence),
+    so threads are created once instead of per call. Each job keeps at most
+    max_in_flight of its batches submitted at a time, pulling more from its batches
+    iterable only when one completes.
+    Do not run a job from inside batch of the same executor: outer batches
+    would hold the workers inner ones are waiting for.
+    """
+
+    def __init__(self, name: str, max_workers: int = None, max_in_flight: int = None,
+                 pool: WorkerPool = None, log_level=logging.INFO):
+        """
+        :param name: stage name used for thread names and logs
+        :param max_workers: threads in own pool if no pool given, os.cpu_count() by default
+        :param max_in_flight: batches submitted at once per job, 2 x pool size by default
+        :param pool: WorkerPool to run batches on, e.g. one owned by app.scheduler
+        """
+        self.name = name
+        self.pool = pool or WorkerPool(name, max_workers or os.cpu_count())
+        self._max_in_flight = max_in_flight
+        self.Logger = app.get_logger(__name__, level=log_level)
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight or max(1, 2 * self.pool.size)
+
+    def as_completed(self, fn, batches):
+        """
+        Runs fn(batch) for every batch.
+        :return: generator of BatchResult in order of completion
+        """
+        pending = set()
+        for index, batch in enumerate(batches):
+            pending.add(self.pool.submit(run_batch, fn, index, batch))
+            if len(pending) < self.max_in_flight:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in futures_completed(pending):
+            yield future.result()
+
+    def map(self, fn, batches, ordered: bool = True) -> BatchResults:
+        """
+        Runs fn(batch) for every batch and waits for all of them.
+        :param ordered: sort results in order of batches, otherwise in order of completion
+        :return: BatchResults
+        """
+        results = BatchResults(self.as_completed(fn, batches))
+        if ordered:
+            results.sort(key=lambda r: r.index)
+        stats = results.stats()
+        self.Logger.info(
+            f'{self.name}: {stats}',
+            extra={"message_info": {"Type": "Batch execution", "Stage": self.name, **stats}}
+        )
+        return results
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait)
+
+
+def get_executor(stage: str, max_workers: int = None) -> BatchExecutor:
+    """
+    Returns executor shared by the stage, running on the stage pool of app.scheduler.
+    :param stage: stage name, e.g. 'retrieval' or 'persistence'
+    :param max_workers: pool size if stage has no configured size
+    """
+    with _executors_lock:
+        if stage not in _executors:
+            _executors[stage] = BatchExecutor(stage, pool=scheduler.pool(stage, max_workers))
+        return _executors[stage]
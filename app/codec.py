@@ -0,0 +1,90 @@
+"""
+Contains json codec with selectable backend: stdlib json, or orjson when it is installed.
+Numbers are decoded into plain ints and floats; DynamoDB needs Decimals instead,
+so to_dynamo/from_dynamo convert them at the persistence boundary only.
+"""
+import json
+from decimal import Decimal
+
+import app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('stdlib', 'orjson')
+
+
+def get_backend() -> str:
+    """
+    :return: backend set by app.JSON_BACKEND, orjson for 'auto' when it is installed, stdlib otherwise
+    """
+    backend = app.JSON_BACKEND
+    if backend == 'auto':
+        return 'orjson' if orjson else 'stdlib'
+    if backend not in BACKENDS:
+        raise app.AppException(ValueError, f'Unknown json backend {backend}, use one of {BACKENDS}')
+    if backend == 'orjson' and orjson is None:
+        raise app.AppException(ImportError, 'orjson json backend is selected, but not installed')
+    return backend
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def loads(data, cleanup: bool = True, backend: str = None):
+    """
+    Decodes json into dicts and lists with ints and floats.
+    :param data: json as str or bytes
+    :param cleanup: drop empty values the way app.remove_empty_strings does
+    :param backend: one of BACKENDS, get_backend() by default
+    """
+    backend = backend or get_backend()
+    if backend == 'orjson':
+        obj = orjson.loads(data)
+        return app.remove_empty_strings(obj) if cleanup else obj
+    if cleanup:
+        return app.loads_clean(data, parse_float=float)
+    return json.loads(data)
+
+
+def dumps(obj, backend: str = None) -> str:
+    """
+    Encodes object into compact json, Decimals are written as numbers.
+    :param obj: dicts, lists and scalars, Decimals included
+    :param backend: one of BACKENDS, get_backend() by default
+    """
+    backend = backend or get_backend()
+    if backend == 'orjson':
+        return orjson.dumps(obj, default=_default).decode('utf-8')
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+
+def to_dynamo(obj):
+    """
+    Converts floats in nested dicts and lists into Decimals DynamoDB accepts.
+    """
+    if type(obj) == float:
+        return Decimal(repr(obj))
+    if type(obj) == dict:
+        return {key: to_dynamo(val) for key, val in obj.items()}
+    if type(obj) == list:
+        return [to_dynamo(val) for val in obj]
+    return obj
+
+
+def from_dynamo(obj):
+    """
+    Converts Decimals DynamoDB returns in nested dicts and lists into ints and floats.
+    """
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if type(obj) == dict:
+        return {key: from_dynamo(val) for key, val in obj.items()}
+    if type(obj) == list:
+        return [from_dynamo(val) for val in obj]
+    return obj
@@ -0,0 +1,91 @@
+"""
+Contains streaming pipeline which overlaps data retrieval with persistence
+"""
+import logging
+import queue
+import threading
+import time
+
+import app
+
+_DONE = object()
+
+
+class Pipeline(object):
+    """
+    Hands every item produced by a source over a bounded queue to sink workers as soon
+    as it is produced. When sink is slower than source the queue fills up and the
+    producer blocks (backpressure), so only queue_size items are held in memory at once.
+    Both stages run at the same time: total time is close to the slower one.
+    """
+
+    def __init__(self, sink, queue_size: int = None, sink_workers: int = None,
+                 name: str = 'pipeline', log_level=logging.INFO):
+        """
+        :param sink: callable persisting one item, e.g. list of documents
+        :param queue_size: max items waiting for sink, app.PIPELINE_QUEUE_SIZE by default
+        :param sink_workers: threads calling sink, app.PIPELINE_SINK_WORKERS by default
+        :param name: pipeline name used in logs
+        """
+        self.sink = sink
+        self.queue_size = queue_size or app.PIPELINE_QUEUE_SIZE
+        self.sink_workers = sink_workers or app.PIPELINE_SINK_WORKERS
+        self.name = name
+        self.Logger = app.get_logger(__name__, level=log_level)
+        self.errors = []
+        self.stats = {}
+
+    def run(self, source) -> dict:
+        """
+        Pulls items from source in current thread and feeds them to sink workers.
+        :param source: iterable of items, e.g. generator of document batches
+        :return: dict with items count, seconds spent per stage and blocked on backpressure,
+            AppException if any sink call failed
+        """
+        items = queue.Queue(maxsize=self.queue_size)
+        lock = threading.Lock()
+        self.errors = []
+        self.stats = {'produced': 0, 'consumed': 0, 'sink_seconds': 0.0, 'blocked_seconds': 0.0}
+
+        def consume():
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                start = time.perf_counter()
+                try:
+                    self.sink(item)
+                except Exception as e:
+                    self.Logger.error(f'{self.name}: sink failed: {e}')
+                    with lock:
+                        self.errors.append(e)
+                finally:
+                    with lock:
+                        self.stats['consumed'] += 1
+                        self.stats['sink_seconds'] += time.perf_counter() - start
+
+        workers = [
+            threading.Thread(target=consume, name=f'{self.name}-sink-{i}', daemon=True)
+            for i in range(self.sink_workers)
+        ]
+        [w.start() for w in workers]
+        start = time.perf_counter()
+        try:
+            for item in source:
+                put_at = time.perf_counter()
+                items.put(item)
+                self.stats['blocked_seconds'] += time.perf_counter() - put_at
+                self.stats['produced'] += 1
+        finally:
+            for _ in workers:
+                items.put(_DONE)
+            [w.join() for w in workers]
+        self.stats['total_seconds'] = time.perf_counter() - start
+        self.stats = {k: round(v, 3) if type(v) == float else v for k, v in self.stats.items()}
+        self.Logger.info(
+            f'{self.name}: {self.stats}',
+            extra={"message_info": {"Type": "Pipeline", "Name": self.name, **self.stats}}
+        )
+        if self.errors:
+            raise app.AppException(self.errors[0], f'{self.name}: {len(self.errors)} sink calls failed')
+        return self.stats
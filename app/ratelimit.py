@@ -0,0 +1,121 @@
+"""
+Contains process wide rate limiting primitives shared by worker threads and asyncio tasks
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting requests per second of all threads and tasks using it.
+    Rate adapts in AIMD manner: throttle() multiplies it by `decrease` (at most once
+    per `cooldown` seconds, so a burst of 429s counts as one signal), then it grows back
+    by `increase` requests/sec every second until it reaches `max_rate` again.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 1.0,
+                 max_rate: float = None, decrease: float = 0.5,
+                 increase: float = 1.0, cooldown: float = 1.0, clock=time.monotonic):
+        """
+        :param rate: initial requests per second
+        :param burst: max requests which can be sent at once after idle period
+        :param min_rate: rate never goes below this one on throttling
+        :param max_rate: rate never recovers above this one, initial rate by default
+        :param decrease: multiplier applied to rate on throttling
+        :param increase: requests per second added to rate each second without throttling
+        :param cooldown: seconds during which repeated throttle() calls are ignored
+        :param clock: monotonic time source in seconds
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = float(max_rate or rate)
+        self.decrease = decrease
+        self.increase = increase
+        self.cooldown = cooldown
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._throttled_at = None
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def __refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed <= 0:
+            return
+        self.rate = min(self.max_rate, self.rate + self.increase * elapsed)
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: int = 1) -> float:
+        """
+        Takes tokens from the bucket, going into debt if there are not enough of them.
+        :return: seconds caller has to wait before sending its request
+        """
+        with self._lock:
+            self.__refill(self.clock())
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += tokens
+            self.waited += wait
+            return wait
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Blocks current thread until request may be sent.
+        :return: seconds waited
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 1) -> float:
+        """
+        Suspends current task until request may be sent.
+        :return: seconds waited
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def release(self, tokens: float):
+        """
+        Gives back tokens reserved in excess, e.g. when request turned out cheaper
+        than estimated. Bucket never holds more than `burst` tokens.
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+            self.acquired -= tokens
+
+    def throttle(self):
+        """
+        Signals the remote side refused a request for exceeding its rate:
+        decreases rate and drains the bucket, so all callers slow down at once.
+        """
+        with self._lock:
+            now = self.clock()
+            self.__refill(now)
+            if self._throttled_at is not None and now - self._throttled_at < self.cooldown:
+                return
+            self._throttled_at = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            self.throttled += 1
+
+    def stats(self) -> dict:
+        """
+        :return: dict with current rate and counters since creation
+        """
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2),
+                'acquired': self.acquired,
+                'throttled': self.throttled,
+                'waited': round(self.waited, 3)
+            }
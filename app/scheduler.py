@@ -0,0 +1,212 @@
+"""
+Contains central scheduler owning named worker pools, one per stage (retrieval, persistence etc.)
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import app
+
+_WAKE = object()
+# queued behind pending tasks by shutdown(), a thread exits when it reads one
+_STOP = object()
+
+
+class WorkerPool(object):
+    """
+    Thread pool which can be resized at runtime and reports its queue depth and utilization.
+    Shrinking lets busy threads finish their current task before they exit.
+    Pool shrunk to 0 or shut down refuses new tasks.
+    """
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._retire = 0
+        self._closed = False
+        self._active = 0
+        self._created = time.perf_counter()
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.resize(size)
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._threads) - self._retire
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs) to be run by one of the pool threads.
+        :return: concurrent.futures.Future, AppException if pool is shut down or has no threads
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise app.AppException(RuntimeError, f'Pool {self.name} is shut down')
+            if len(self._threads) - self._retire <= 0:
+                raise app.AppException(RuntimeError, f'Pool {self.name} has no threads to run tasks')
+            self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def resize(self, size: int):
+        """
+        Sets number of pool threads. New threads pick up queued tasks right away,
+        retired ones exit once they're done with their current task.
+        """
+        if size < 0:
+            raise app.AppException(ValueError, f'Pool {self.name} size can not be negative')
+        with self._lock:
+            if self._closed:
+                raise app.AppException(RuntimeError, f'Pool {self.name} is shut down')
+            delta = size - (len(self._threads) - self._retire)
+            if delta > 0:
+                cancel = min(delta, self._retire)
+                self._retire -= cancel
+                for _ in range(delta - cancel):
+                    thread = threading.Thread(
+                        target=self.__work, name=f'{self.name}-{len(self._threads)}', daemon=True)
+                    self._threads.add(thread)
+                    thread.start()
+            elif delta < 0:
+                self._retire -= delta
+                for _ in range(-delta):
+                    self._tasks.put(_WAKE)
+
+    def __work(self):
+        current = threading.current_thread()
+        while True:
+            with self._lock:
+                if self._retire > 0:
+                    self._retire -= 1
+                    self._threads.discard(current)
+                    return
+            item = self._tasks.get()
+            if item is _WAKE:
+                continue
+            if item is _STOP:
+                with self._lock:
+                    self._threads.discard(current)
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._active += 1
+            start = time.perf_counter()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """
+        :return: dict with pool size, running and queued tasks, current utilization
+            and average utilization since pool creation
+        """
+        with self._lock:
+            size = len(self._threads) - self._retire
+            elapsed = time.perf_counter() - self._created
+            return {
+                'size': size,
+                'active': self._active,
+                'queued': self._tasks.qsize(),
+                'completed': self.completed,
+                'utilization': round(self._active / size, 2) if size else 0.0,
+                'avg_utilization': round(self.busy_seconds / (size * elapsed), 2) if size and elapsed else 0.0
+            }
+
+    def __cancel_queued(self):
+        while True:
+            try:
+                item = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _WAKE and item is not _STOP:
+                item[0].cancel()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops all threads once queued tasks are done, new tasks are refused right away.
+        Tasks queued to a pool without threads are cancelled.
+        """
+        with self._lock:
+            self._closed = True
+            # threads waiting to retire stay to drain the queue
+            self._retire = 0
+            threads = list(self._threads)
+            for _ in threads:
+                self._tasks.put(_STOP)
+            if not threads:
+                self.__cancel_queued()
+        if wait:
+            [t.join() for t in threads if t is not threading.current_thread()]
+
+
+class Scheduler(object):
+    """
+    Owns one WorkerPool per stage name, so each stage has its own concurrency knob
+    independent from number of cores.
+    """
+
+    def __init__(self, sizes: dict, log_level=logging.INFO):
+        """
+        :param sizes: dict of default pool size per stage name
+        """
+        self.sizes = dict(sizes)
+        self.pools = {}
+        self._lock = threading.Lock()
+        self.Logger = app.get_logger(__name__, level=log_level)
+
+    def pool(self, name: str, size: int = None) -> WorkerPool:
+        """
+        Returns pool of the stage, creating it on the first call.
+        :param name: stage name
+        :param size: pool size if stage has no configured size, os.cpu_count() by default
+        """
+        with self._lock:
+            if name not in self.pools:
+                self.pools[name] = WorkerPool(name, self.sizes.get(name) or size or os.cpu_count())
+            return self.pools[name]
+
+    def resize(self, name: str, size: int):
+        """
+        Changes pool size of the stage, future pools of the stage get this size as well.
+        """
+        with self._lock:
+            self.sizes[name] = size
+            pool = self.pools.get(name)
+        if pool:
+            pool.resize(size)
+        self.Logger.info(f'Pool {name} resized to {size}')
+
+    def stats(self) -> dict:
+        """
+        :return: dict of WorkerPool.stats() per stage
+        """
+        with self._lock:
+            pools = dict(self.pools)
+        return {name: pool.stats() for name, pool in pools.items()}
+
+    def log_stats(self):
+        for name, stats in self.stats().items():
+            self.Logger.info(
+                f'Pool {name}: {stats}',
+                extra={"message_info": {"Type": "Worker pool", "Pool": name, **stats}}
+            )
+
+
+scheduler = Scheduler({
+    'retrieval': app.MAX_RETRIEVAL_THREADS,
+    'persistence': app.MAX_PERSISTENCE_THREADS
+})
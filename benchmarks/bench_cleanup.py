@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of empty values cleanup on IEX payloads from tests/fixtures.
+Compares recursive cleanup the app used before (check_func cleaned every child twice),
+single traversal remove_empty_strings after decode, and cleanup during decode (loads_clean).
+Run from repo root: API_TOKEN=dummy python -m benchmarks.bench_cleanup --repeat 200
+"""
+import argparse
+import decimal
+import glob
+import json
+import timeit
+
+import app
+
+FIXTURES = 'tests/fixtures/*.json'
+
+
+def legacy_check_func(val):
+    if val in [[], {}]:
+        return False
+    elif legacy_remove_empty_strings(val) not in [None, [], {}]:
+        return True
+
+
+def legacy_remove_empty_strings(dictionary):
+    if type(dictionary) == list:
+        return [
+            legacy_remove_empty_strings(val)
+            for val in dictionary
+            if legacy_check_func(val)]
+    elif type(dictionary) == dict:
+        return {
+            key: legacy_remove_empty_strings(val)
+            for key, val in dictionary.items()
+            if legacy_check_func(val)}
+    elif dictionary or dictionary is False or dictionary == 0:
+        return dictionary
+
+
+def nested_payload(depth: int) -> bytes:
+    payload = {'value': 1, 'empty': ''}
+    for _ in range(depth):
+        payload = {'child': payload, 'list': [{'item': i, 'empty': ''} for i in range(3)], 'empty': []}
+    return json.dumps(payload).encode('utf-8')
+
+
+def measure(name: str, raw: bytes, repeat: int) -> dict:
+    def legacy():
+        return legacy_remove_empty_strings(json.loads(raw, parse_float=decimal.Decimal))
+
+    def single_pass():
+        return app.remove_empty_strings(json.loads(raw, parse_float=decimal.Decimal))
+
+    def during_decode():
+        return app.loads_clean(raw)
+
+    expected = legacy()
+    assert single_pass() == expected, f'{name}: remove_empty_strings output differs'
+    assert during_decode() == expected, f'{name}: loads_clean output differs'
+    result = {'payload': name, 'bytes': len(raw)}
+    for label, fn in (('legacy', legacy), ('single_pass', single_pass), ('during_decode', during_decode)):
+        result[f'{label}_us'] = round(min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1e6, 1)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Empty values cleanup benchmark')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=8,
+                        help='nesting depth of synthetic payload')
+    args = parser.parse_args()
+
+    payloads = []
+    for file in sorted(glob.glob(FIXTURES)):
+        with open(file, mode='rb') as fixture:
+            payloads.append((file, fixture.read()))
+    payloads.append((f'synthetic depth {args.depth}', nested_payload(args.depth)))
+    print(json.dumps({
+        'benchmark': 'cleanup',
+        'results': [measure(name, raw, args.repeat) for name, raw in payloads]
+    }, indent=2))
@@ -0,0 +1,60 @@
+"""
+Benchmark of json backends on IEX payloads: fixtures and a synthetic market batch response.
+Decoding includes empty values cleanup, like Iex.load_from_iex does.
+Run from repo root: API_TOKEN=dummy python -m benchmarks.bench_codec --symbols 400
+"""
+import argparse
+import glob
+import json
+import timeit
+
+import app
+from app import codec
+from datawell.fakeiex import DATAPOINTS, FakeIex
+
+FIXTURES = 'tests/fixtures/*.response.json'
+
+
+def market_batch(symbols: int) -> bytes:
+    fake_iex = FakeIex(symbols_count=symbols)
+    fake_iex.server.server_close()
+    return json.dumps(fake_iex.batch(list(fake_iex.documents), DATAPOINTS)).encode('utf-8')
+
+
+def timed(fn, repeat: int) -> float:
+    return round(min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1000, 3)
+
+
+def measure(name: str, raw: bytes, repeat: int) -> dict:
+    result = {
+        'payload': name,
+        'bytes': len(raw),
+        'decode_decimal_ms': timed(lambda: app.loads_clean(raw), repeat)
+    }
+    backends = ['stdlib'] + (['orjson'] if codec.orjson else [])
+    for backend in backends:
+        decoded = codec.loads(raw, backend=backend)
+        with_decimals = app.loads_clean(raw)
+        result[f'decode_{backend}_ms'] = timed(lambda: codec.loads(raw, backend=backend), repeat)
+        result[f'encode_{backend}_ms'] = timed(lambda: codec.dumps(decoded, backend=backend), repeat)
+        result[f'encode_decimal_{backend}_ms'] = timed(lambda: codec.dumps(with_decimals, backend=backend), repeat)
+    result['to_dynamo_ms'] = timed(lambda: codec.to_dynamo(codec.loads(raw, backend='stdlib')), repeat)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Json backends benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--symbols', type=int, default=400,
+                        help='symbols in synthetic market batch response')
+    args = parser.parse_args()
+
+    payloads = []
+    for file in sorted(glob.glob(FIXTURES)):
+        with open(file, mode='rb') as fixture:
+            payloads.append((file, fixture.read()))
+    payloads.append((f'market batch of {args.symbols}', market_batch(args.symbols)))
+    print(json.dumps({
+        'benchmark': 'codec',
+        'results': [measure(name, raw, args.repeat) for name, raw in payloads]
+    }, indent=2))
@@ -0,0 +1,99 @@
+"""
+Benchmark of DynamoStore attribute compression on fixture documents: item bytes,
+write capacity units of table and ALL-projected Reverse_index, and codec time per codec.
+Run from repo root: API_TOKEN=dummy python -m benchmarks.bench_compression --threshold 1024
+"""
+import argparse
+import glob
+import json
+import math
+import timeit
+
+from persistence import compression, itemsize
+from datawell.fakeiex import DATAPOINTS
+
+FIXTURES = ['tests/fixtures/companies_dump.json']
+RESPONSES = 'tests/fixtures/*.response.json'
+
+
+def load_documents() -> list:
+    documents = []
+    for file in FIXTURES:
+        with open(file, mode='r') as fixture:
+            documents.extend(json.load(fixture).values())
+    for file in sorted(glob.glob(RESPONSES)):
+        with open(file, mode='r') as fixture:
+            documents.append(json.load(fixture))
+    return documents
+
+
+def compressed(document: dict, attributes: list, threshold: int, codec_name: str) -> dict:
+    # same rule as DynamoStore.to_item
+    return {
+        **document,
+        **{
+            name: compression.compress_value(document[name], codec_name)
+            for name in attributes
+            if name in document and itemsize.value_size(document[name]) > threshold
+        }
+    }
+
+
+def capacity(items: list) -> dict:
+    sizes = [itemsize.item_size(item) for item in items]
+    wcu = sum(math.ceil(size / 1024) for size in sizes)
+    return {
+        'bytes': sum(sizes),
+        'max_item_bytes': max(sizes),
+        # Reverse_index projects ALL attributes, so every write is paid twice
+        'wcu': 2 * wcu,
+        # eventually consistent read of 4 KB costs half RCU
+        'rcu': sum(math.ceil(size / 4096) for size in sizes) / 2
+    }
+
+
+def measure(documents: list, attributes: list, threshold: int, codec_name: str, repeat: int) -> dict:
+    items = [compressed(d, attributes, threshold, codec_name) for d in documents]
+    blobs = [v for item in items for v in item.values() if compression.is_compressed(v)]
+    compress_ms = min(timeit.repeat(
+        lambda: [compressed(d, attributes, threshold, codec_name) for d in documents],
+        number=repeat, repeat=3)) / repeat * 1000
+    decompress_ms = min(timeit.repeat(
+        lambda: [compression.decompress_value(b) for b in blobs],
+        number=repeat, repeat=3)) / repeat * 1000
+    return {
+        'codec': codec_name,
+        'compressed_attributes': len(blobs),
+        **capacity(items),
+        'compress_ms': round(compress_ms, 3),
+        'decompress_ms': round(decompress_ms, 3)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DynamoDB attribute compression benchmark')
+    parser.add_argument('--attributes', default=','.join(DATAPOINTS),
+                        help='comma separated attributes to compress')
+    parser.add_argument('--threshold', type=int, default=1024,
+                        help='bytes an attribute has to be over to get compressed')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    documents = load_documents()
+    attributes = [a for a in args.attributes.split(',') if a]
+    baseline = capacity(documents)
+    results = [
+        measure(documents, attributes, args.threshold, codec_name, args.repeat)
+        for codec_name in compression.CODECS
+    ]
+    for result in results:
+        result['bytes_saved'] = baseline['bytes'] - result['bytes']
+        result['wcu_saved'] = baseline['wcu'] - result['wcu']
+    print(json.dumps({
+        'benchmark': 'compression',
+        'documents': len(documents),
+        'attributes': attributes,
+        'threshold': args.threshold,
+        'uncompressed': baseline,
+        'results': results
+    }, indent=2))
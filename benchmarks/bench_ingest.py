@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark of the ingest path: Iex retrieval from local fake IEX, then storing
+retrieved documents into DynamoStore, S3Store and sqsStore, then one whole handler.lambda_handler run.
+AWS is mocked with moto when it is installed, otherwise stores go to localstack at DYNAMO_URI,
+S3_URI and SQS_URI.
+Run from repo root: API_TOKEN=dummy REGION=us-east-1 python -m benchmarks.bench_ingest --symbols 2000
+Prints json with throughput, batch latency percentiles and peak RSS per stage.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from unittest import mock
+
+import app
+import handler
+from datawell import iex
+from datawell.fakeiex import DATAPOINTS, FakeIex
+from persistence.dynamostore import DynamoStore
+from persistence.s3store import S3Store
+from persistence.sqsstore import sqsStore
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+STORES = ('dynamodb', 's3', 'sqs')
+SQS_BATCH_SIZE = 10
+
+
+def rss_bytes() -> int:
+    """
+    :return: current resident set size, process peak where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in kilobytes on linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(object):
+    """
+    Samples RSS from a thread while a stage runs, so every stage gets its own peak
+    instead of the process-wide ru_maxrss, which never goes down.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start = self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.__sample, name='rss-sampler', daemon=True)
+
+    def __sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+    def stats(self) -> dict:
+        return {
+            'peak_rss_mb': round(self.peak / 1024 / 1024, 1),
+            'rss_growth_mb': round((self.peak - self.start) / 1024 / 1024, 1)
+        }
+
+
+def measure(stage: str, documents: int, fn) -> dict:
+    """
+    Runs fn, which returns app.BatchResults, and reports its timings.
+    """
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        results = fn()
+        seconds = time.perf_counter() - start
+    return {
+        'stage': stage,
+        'documents': documents,
+        'seconds': round(seconds, 3),
+        'documents_per_second': round(documents / seconds, 1) if seconds else None,
+        **results.stats(),
+        **rss.stats()
+    }
+
+
+def retrieval_stage(fake_iex: FakeIex, datapoints: list):
+    datasource = iex.Iex(
+        symbols=fake_iex.ref_data_dict(), log_level=logging.WARNING, fetch=False)
+    stage = measure(
+        'retrieval', len(datasource.Symbols),
+        lambda: datasource.get_symbols_batch(symbols=datasource.Symbols, datapoints=datapoints))
+    stage['requests'] = fake_iex.requests_count
+    return stage, datasource.get_symbols()
+
+
+def store_stage(name: str, documents: list) -> dict:
+    if name == 'dynamodb':
+        store = DynamoStore(app.TABLE, log_level=logging.WARNING)
+        return measure(name, len(documents), lambda: store.store_documents(documents=documents))
+    if name == 's3':
+        store = S3Store(app.TABLE.lower(), log_level=logging.WARNING)
+        return measure(name, len(documents), lambda: store.store_documents(documents=documents))
+    store = sqsStore(app.TABLE, log_level=logging.WARNING)
+    return measure(name, len(documents), lambda: app.get_executor('persistence').map(
+        lambda chunk: store.store_documents(chunk), app.split(documents, SQS_BATCH_SIZE)))
+
+
+def handler_stage(fake_iex: FakeIex) -> dict:
+    """
+    Runs lambda_handler end to end: fetching symbols list and datapoints from fake IEX
+    and storing them into DynamoStore, the way the deployed function does.
+    """
+    stored = []
+    store_documents = DynamoStore.store_documents
+
+    def counted(self, documents: list):
+        stored.append(len(documents))
+        return store_documents(self, documents=documents)
+
+    requests_before = fake_iex.requests_count
+    with RssSampler() as rss, \
+            mock.patch.object(app, 'STOCKS', {}), \
+            mock.patch.object(DynamoStore, 'store_documents', counted), \
+            mock.patch.object(os, '_exit', side_effect=SystemExit('lambda_handler failed')):
+        start = time.perf_counter()
+        handler.lambda_handler()
+        seconds = time.perf_counter() - start
+    documents = sum(stored)
+    return {
+        'stage': 'lambda_handler',
+        'documents': documents,
+        'seconds': round(seconds, 3),
+        'documents_per_second': round(documents / seconds, 1) if seconds else None,
+        'requests': fake_iex.requests_count - requests_before,
+        **rss.stats()
+    }
+
+
+def create_resources(stores: list):
+    """
+    Creates bucket and queue the stores expect to exist, DynamoStore creates its table itself.
+    """
+    import boto3
+    if 's3' in stores:
+        s3 = boto3.client('s3', region_name=app.REGION, endpoint_url=app.S3_URI)
+        with contextlib.suppress(s3.exceptions.BucketAlreadyOwnedByYou):
+            s3.create_bucket(Bucket=app.TABLE.lower())
+    if 'sqs' in stores:
+        boto3.client('sqs', region_name=app.REGION, endpoint_url=app.SQS_URI).create_queue(
+            QueueName=app.TABLE)
+
+
+def aws(backend: str):
+    if backend == 'moto':
+        if mock_aws is None:
+            raise SystemExit('moto is not installed, use --aws localstack')
+        return mock_aws()
+    return contextlib.nullcontext()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest path benchmark')
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--datapoints', default=','.join(DATAPOINTS),
+                        help='comma separated IEX datapoints to retrieve')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds fake IEX waits before each answer')
+    parser.add_argument('--symbols-batch', type=int, default=iex.SYMBOLS_BATCH_SIZE)
+    parser.add_argument('--datapoints-batch', type=int, default=iex.DATAPOINTS_BATCH_SIZE)
+    parser.add_argument('--retrieval-threads', type=int, default=app.MAX_RETRIEVAL_THREADS)
+    parser.add_argument('--persistence-threads', type=int, default=app.MAX_PERSISTENCE_THREADS)
+    parser.add_argument('--stores', default=','.join(STORES),
+                        help=f'comma separated stores to write into, any of {STORES}')
+    parser.add_argument('--skip-handler', action='store_true',
+                        help='do not run lambda_handler end to end after the stages')
+    parser.add_argument('--aws', choices=('moto', 'localstack'),
+                        default='moto' if mock_aws else 'localstack')
+    args = parser.parse_args()
+    stores = [s for s in args.stores.split(',') if s]
+    datapoints = [d for d in args.datapoints.split(',') if d]
+
+    app.scheduler.resize('retrieval', args.retrieval_threads)
+    app.scheduler.resize('persistence', args.persistence_threads)
+    iex.get_session(pool_size=args.retrieval_threads)
+    with FakeIex(symbols_count=args.symbols, latency=args.latency) as fake_iex, \
+            mock.patch.object(app, 'BASE_API_URL', fake_iex.url), \
+            mock.patch.object(app, 'REGION', app.REGION or 'us-east-1'), \
+            mock.patch.object(iex, 'SYMBOLS_BATCH_SIZE', args.symbols_batch), \
+            mock.patch.object(iex, 'DATAPOINTS_BATCH_SIZE', args.datapoints_batch), \
+            aws(args.aws):
+        create_resources(stores)
+        stage, documents = retrieval_stage(fake_iex, datapoints)
+        stages = [stage] + [store_stage(store, documents) for store in stores]
+        if not args.skip_handler:
+            stages.append(handler_stage(fake_iex))
+
+    print(json.dumps({
+        'benchmark': 'ingest',
+        'aws': args.aws,
+        'parameters': {
+            'symbols': args.symbols,
+            'datapoints': datapoints,
+            'latency': args.latency,
+            'symbols_batch': args.symbols_batch,
+            'datapoints_batch': args.datapoints_batch,
+            'retrieval_threads': args.retrieval_threads,
+            'persistence_threads': args.persistence_threads
+        },
+        'stages': stages,
+        'scheduler': app.scheduler.stats()
+    }, indent=2))
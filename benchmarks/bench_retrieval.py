@@ -0,0 +1,56 @@
+"""
+Compares thread and asyncio retrieval paths of Iex against local fake IEX.
+Run from repo root: API_TOKEN=dummy python -m benchmarks.bench_retrieval --symbols 2000 --latency 0.2
+Prints json with wall time and requests sent per retrieval mode.
+"""
+import argparse
+import json
+import logging
+import time
+from unittest import mock
+
+import app
+from datawell.fakeiex import FakeIex
+from datawell.iex import Iex
+
+
+def run(fake_iex: FakeIex, async_retrieval: bool, concurrency: int) -> dict:
+    requests_before = fake_iex.requests_count
+    with mock.patch.object(app, 'ASYNC_RETRIEVAL_CONCURRENCY', concurrency):
+        start = time.perf_counter()
+        datasource = Iex(
+            symbols=fake_iex.ref_data_dict(),
+            log_level=logging.WARNING,
+            async_retrieval=async_retrieval
+        )
+        elapsed = time.perf_counter() - start
+    return {
+        'mode': 'async' if async_retrieval else 'threads',
+        'symbols': len(datasource.Symbols),
+        'requests': fake_iex.requests_count - requests_before,
+        'seconds': round(elapsed, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Iex retrieval benchmark')
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='seconds fake IEX waits before each answer')
+    parser.add_argument('--concurrency', type=int, default=app.ASYNC_RETRIEVAL_CONCURRENCY)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with FakeIex(symbols_count=args.symbols, latency=args.latency) as fake_iex, \
+            mock.patch.object(app, 'BASE_API_URL', fake_iex.url):
+        results = [
+            run(fake_iex, async_retrieval, args.concurrency)
+            for _ in range(args.repeat)
+            for async_retrieval in (False, True)
+        ]
+    print(json.dumps({
+        'benchmark': 'retrieval',
+        'latency': args.latency,
+        'concurrency': args.concurrency,
+        'results': results
+    }, indent=2))
@@ -0,0 +1,63 @@
+"""
+Benchmark of document serializers stores can use on fixture documents: encoded bytes,
+encode and decode time per persistence.serialization spec, against S3Store pickles.
+Run from repo root: API_TOKEN=dummy python -m benchmarks.bench_serialization --repeat 20
+"""
+import argparse
+import decimal
+import glob
+import json
+import pickle
+import timeit
+
+from persistence import compression, serialization
+from persistence.serialization import Serializer
+
+FIXTURES = ['tests/fixtures/companies_dump.json']
+RESPONSES = 'tests/fixtures/*.response.json'
+
+
+def load_documents() -> list:
+    # Decimals, as documents come out of IEX responses
+    documents = []
+    for file in FIXTURES:
+        with open(file, mode='r') as fixture:
+            documents.extend(json.load(fixture, parse_float=decimal.Decimal).values())
+    for file in sorted(glob.glob(RESPONSES)):
+        with open(file, mode='r') as fixture:
+            documents.append(json.load(fixture, parse_float=decimal.Decimal))
+    return documents
+
+
+def timed(fn, repeat: int) -> float:
+    return round(min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1000, 3)
+
+
+def measure(name: str, dumps, loads, documents: list, repeat: int) -> dict:
+    blobs = [dumps(d) for d in documents]
+    return {
+        'serializer': name,
+        'bytes': sum(len(b) for b in blobs),
+        'encode_ms': timed(lambda: [dumps(d) for d in documents], repeat),
+        'decode_ms': timed(lambda: [loads(b) for b in blobs], repeat),
+        'round_trip_exact': all(loads(b) == d for b, d in zip(blobs, documents))
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Document serialization benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    documents = load_documents()
+    results = [measure('pickle', pickle.dumps, pickle.loads, documents, args.repeat)]
+    for format_name in serialization.FORMATS:
+        for compression_name in (serialization.NO_COMPRESSION, *compression.CODECS):
+            serializer = Serializer(format_name, compression_name)
+            results.append(measure(serializer.spec, serializer.dumps, serialization.loads,
+                                   documents, args.repeat))
+    print(json.dumps({
+        'benchmark': 'serialization',
+        'documents': len(documents),
+        'results': results
+    }, indent=2))
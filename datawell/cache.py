@@ -0,0 +1,95 @@
+"""
+Contains local disk cache of IEX datapoints, so slow changing ones are not retrieved on every run
+"""
+import sqlite3
+import threading
+import time
+
+import app
+from app import codec
+
+
+class DatapointCache(object):
+    """
+    sqlite backed cache of datapoint values keyed by (symbol, datapoint).
+    Every datapoint has its own TTL in seconds, datapoints without TTL are never cached.
+    Datapoints IEX returned nothing for are cached as well, so they are not requested again
+    until they expire.
+    """
+
+    def __init__(self, path: str, ttls: dict = None, clock=time.time):
+        """
+        :param path: sqlite database file, ':memory:' keeps cache in memory only
+        :param ttls: dict of TTL in seconds per datapoint, app.DATAPOINT_TTL by default
+        :param clock: time source in seconds
+        """
+        self.path = path
+        self.ttls = app.DATAPOINT_TTL if ttls is None else ttls
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS datapoints ('
+            'symbol TEXT, datapoint TEXT, fetched REAL, value TEXT, '
+            'PRIMARY KEY (symbol, datapoint))'
+        )
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls):
+        """
+        :return: DatapointCache at app.DATAPOINT_CACHE path, None when it's not set
+        """
+        return cls(app.DATAPOINT_CACHE) if app.DATAPOINT_CACHE else None
+
+    def cacheable(self, datapoint: str) -> bool:
+        return self.ttls.get(datapoint, 0) > 0
+
+    def get_fresh(self, symbols: list, datapoints: list) -> dict:
+        """
+        :return: dict of {datapoint: value} per symbol with values which have not expired yet,
+            value is None if IEX returned nothing for the datapoint
+        """
+        datapoints = [d for d in datapoints if self.cacheable(d)]
+        fresh = {}
+        if not symbols or not datapoints:
+            return fresh
+        now = self.clock()
+        with self._lock:
+            for i in range(0, len(symbols), 500):
+                chunk = symbols[i:i + 500]
+                rows = self._db.execute(
+                    f'SELECT symbol, datapoint, fetched, value FROM datapoints '
+                    f'WHERE symbol IN ({",".join("?" * len(chunk))}) '
+                    f'AND datapoint IN ({",".join("?" * len(datapoints))})',
+                    [*chunk, *datapoints]
+                ).fetchall()
+                for symbol, datapoint, fetched, value in rows:
+                    if now - fetched < self.ttls[datapoint]:
+                        fresh.setdefault(symbol, {})[datapoint] = (
+                            None if value is None else codec.loads(value, cleanup=False))
+        return fresh
+
+    def put(self, values: dict):
+        """
+        Caches datapoints of every symbol.
+        :param values: dict of {datapoint: value or None} per symbol
+        """
+        now = self.clock()
+        rows = [
+            (symbol, datapoint, now, None if value is None else codec.dumps(value))
+            for symbol, datapoints in values.items()
+            for datapoint, value in datapoints.items()
+            if self.cacheable(datapoint)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO datapoints (symbol, datapoint, fetched, value) '
+                'VALUES (?, ?, ?, ?)', rows)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
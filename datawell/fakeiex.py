@@ -0,0 +1,208 @@
+"""
+Local stand-in for IEX cloud API. Serves symbols list and market batch endpoints
+from test fixtures, or replays responses saved by datawell.recorder, so retrieval
+can be tested and benchmarked without token and network. Latency, 429 and 5xx
+responses can be injected to see how retrieval copes with them.
+Point app.BASE_API_URL (IEX_BASE_API_URL env) to FakeIex.url to use it.
+Run standalone: python -m datawell.fakeiex --port 8080 --symbols 9000 --latency 0.05
+Replay a recording: python -m datawell.fakeiex --replay recordings/ --throttle-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+from datawell.recorder import Recorder
+
+DATAPOINTS = ['advanced-stats', 'cash-flow', 'book', 'dividends', 'company', 'financials']
+FIXTURE = 'tests/fixtures/companies_dump.json'
+
+
+class FakeIex(object):
+
+    def __init__(self, fixture: str = FIXTURE, symbols_count: int = None,
+                 latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 replay_dir: str = None, throttle_rate: float = 0.0,
+                 error_rate: float = 0.0, seed: int = None):
+        """
+        :param fixture: json file with dict of documents per symbol, like companies_dump.json,
+            None to serve no documents
+        :param symbols_count: number of symbols to serve, fixture documents are cloned
+            under synthetic tickers when it's bigger than fixture
+        :param latency: seconds to wait before answering each request
+        :param host: interface to listen on
+        :param port: port to listen on, any free one if 0
+        :param replay_dir: directory with IEX responses saved by Recorder, recorded
+            requests are answered from it before fixture
+        :param throttle_rate: share of requests answered with 429 Too Many Requests
+        :param error_rate: share of requests answered with 503 Service Unavailable
+        :param seed: seed of random faults, so they can be repeated
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.requests_count = 0
+        self.faults_count = 0
+        self.replayed_count = 0
+        self.batch_requests = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.replay = Recorder(replay_dir) if replay_dir else None
+        self.documents = self.__load_documents(fixture, symbols_count) if fixture else {}
+        self.server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def ref_data(self) -> list:
+        """
+        :return: list of documents without datapoints, like /ref-data/Iex/symbols/ returns
+        """
+        return [
+            {k: v for k, v in doc.items() if k not in DATAPOINTS}
+            for doc in self.documents.values()
+        ]
+
+    def ref_data_dict(self) -> dict:
+        """
+        :return: ref_data as dict by symbol, the way Iex keeps its Symbols
+        """
+        return {doc['symbol']: doc for doc in self.ref_data()}
+
+    def batch(self, tickers: list, types: list) -> dict:
+        """
+        :return: dict like /stock/market/batch returns, unknown tickers are skipped
+        """
+        result = {}
+        for ticker in tickers:
+            doc = self.documents.get(ticker.upper())
+            if doc is None:
+                continue
+            result[doc['symbol']] = {t: doc[t] for t in types if t in doc}
+        return result
+
+    @staticmethod
+    def __load_documents(fixture: str, symbols_count: int) -> dict:
+        with open(fixture, mode='r') as fixture_file:
+            documents = json.load(fixture_file)
+        if not symbols_count or symbols_count == len(documents):
+            return documents
+        templates = list(documents.values())
+        result = {}
+        for i in range(symbols_count):
+            doc = deepcopy(templates[i % len(templates)])
+            if i >= len(templates):
+                doc['symbol'] = f'{doc["symbol"]}{i}'
+            result[doc['symbol']] = doc
+        return result
+
+    def fault(self):
+        """
+        :return: status code of injected fault, None if request should be answered
+        """
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.throttle_rate:
+                status = 429
+            elif draw < self.throttle_rate + self.error_rate:
+                status = 503
+            else:
+                return None
+            self.faults_count += 1
+            return status
+
+    def __make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests_count += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = parse.urlparse(self.path)
+                query = parse.parse_qs(url.query)
+                status = fake.fault()
+                if status == 429:
+                    self.reply(status, 'Too Many Requests')
+                    return
+                if status:
+                    self.reply(status, 'Service Unavailable')
+                    return
+                recorded = fake.replay and fake.replay.load(
+                    url.path, {k: v[0] for k, v in query.items()})
+                path = url.path.lower().rstrip('/')
+                if recorded:
+                    with fake._lock:
+                        fake.replayed_count += 1
+                    self.reply(*recorded)
+                elif path.endswith('/ref-data/iex/symbols'):
+                    self.reply(200, json.dumps(fake.ref_data()))
+                elif path.endswith('/stock/market/batch'):
+                    tickers = query.get('symbols', [''])[0].split(',')
+                    types = query.get('types', [''])[0].split(',')
+                    with fake._lock:
+                        fake.batch_requests.append((tickers, types))
+                    self.reply(200, json.dumps(fake.batch(tickers, types)))
+                else:
+                    self.reply(404, 'Not found')
+
+            def reply(self, status: int, body):
+                payload = body.encode('utf-8') if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local fake IEX API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--symbols', type=int, default=None)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--replay', default=None, help='directory with recorded IEX responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 503 responses')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    fake = FakeIex(args.fixture, args.symbols, args.latency, args.host, args.port,
+                   replay_dir=args.replay, throttle_rate=args.throttle_rate,
+                   error_rate=args.error_rate, seed=args.seed)
+    print(f'Serving fake IEX on {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -2,25 +2,208 @@
 Contains Iex class which retrieves information from IEX API
 """
 
-from decimal import Decimal
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import app
+from app import codec
+from app.ratelimit import RateLimiter
+from datawell.cache import DatapointCache
+from datawell.recorder import Recorder
 import logging
 from urllib import parse
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+SYMBOLS_BATCH_SIZE = 400
+DATAPOINTS_BATCH_SIZE = 10
+# Too Many Requests is paced by RATE_LIMITER, so its retries don't sleep on their own,
+# server errors slow RATE_LIMITER down and back off with full jitter on top of it
+RETRY_TRIES = 8
+
+RATE_LIMITER = RateLimiter(rate=app.IEX_RATE_LIMIT, burst=app.IEX_RATE_BURST)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class IexServerError(app.AppException):
+    """
+    IEX answered with 5xx, retried with backoff.
+    """
+
+
+def get_session(pool_size: int = None, pool_hosts: int = None,
+                pool_block: bool = None) -> requests.Session:
+    """
+    Returns keep-alive session shared by all Iex instances and worker threads.
+    Connections are pooled per host, so batch calls reuse TCP+TLS connections
+    instead of doing a handshake for every request.
+    Session is created on the first call, pass any parameter to rebuild it.
+    :param pool_size: max connections kept per host, app.HTTP_POOL_SIZE by default
+    :param pool_hosts: number of per-host pools to keep, app.HTTP_POOL_HOSTS by default
+    :param pool_block: when True never open more than pool_size connections per host
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        rebuild = any(p is not None for p in (pool_size, pool_hosts, pool_block))
+        if _session is not None and rebuild:
+            _session.close()
+            _session = None
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=pool_hosts or app.HTTP_POOL_HOSTS,
+                pool_maxsize=pool_size or app.HTTP_POOL_SIZE,
+                pool_block=app.HTTP_POOL_BLOCK if pool_block is None else pool_block
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    """
+    Closes shared session and drops all pooled connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def connection_stats() -> dict:
+    """
+    Counts requests sent through the shared session and connections opened for them.
+    :return: dict with requests, new connections and reused connections counters
+    """
+    stats = {'requests': 0, 'new_connections': 0, 'reused_connections': 0}
+    session = _session
+    if session is None:
+        return stats
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['new_connections'] += pool.num_connections
+    stats['reused_connections'] = stats['requests'] - stats['new_connections']
+    return stats
+
+
+class _AsyncClient(object):
+    """
+    Minimal async GET client used by Iex.get_symbols_batch_async.
+    Uses aiohttp when it is installed, otherwise runs requests through
+    the shared keep-alive session in executor threads, in which case
+    real concurrency is capped by app.HTTP_POOL_SIZE.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.session = None
+        self.executor = None
+
+    async def __aenter__(self):
+        if aiohttp:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=app.HTTP_CONNECT_TIMEOUT,
+                    sock_read=app.HTTP_READ_TIMEOUT
+                )
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=min(self.concurrency, app.HTTP_POOL_SIZE))
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.session:
+            await self.session.close()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    async def get(self, url: str):
+        """
+        :return: tuple of response status code and body bytes
+        """
+        if self.session:
+            async with self.session.get(url) as response:
+                return response.status, await response.read()
+
+        def sync_get():
+            response = get_session().get(
+                url=url,
+                timeout=(app.HTTP_CONNECT_TIMEOUT, app.HTTP_READ_TIMEOUT)
+            )
+            return response.status_code, response.content
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, sync_get)
+
 
 class Iex(object):
 
-    def __init__(self, symbols: dict = {}, log_level=logging.INFO):
+    def __init__(self, symbols: dict = {}, log_level=logging.INFO,
+                 async_retrieval: bool = None, fetch: bool = True,
+                 cache: DatapointCache = None, recorder: Recorder = None):
+        """
+        :param symbols: dict of symbols to populate, all IEX symbols if empty
+        :param log_level: logging level
+        :param async_retrieval: use get_symbols_batch_async, app.ASYNC_RETRIEVAL by default
+        :param fetch: populate Symbols with datapoints right away, pass False
+            to stream them with iter_symbols_batch instead
+        :param cache: DatapointCache to reuse datapoints which have not expired from,
+            one at app.DATAPOINT_CACHE by default, no caching if that is not set
+        :param recorder: Recorder to save IEX responses with, one at app.IEX_RECORD_DIR
+            by default, nothing is recorded if that is not set
+        """
         self.log_level = log_level
         self.dict_symbols = {}
         self.Logger = app.get_logger(__name__, level=self.log_level)
+        self.cache = cache or DatapointCache.from_config()
+        self.recorder = recorder or Recorder.from_config()
         self.Symbols = symbols if symbols else self.get_stocks()
         self.datapoints = [
             'advanced-stats', 'cash-flow', 'book',
             'dividends', 'company', 'financials'
         ]
-        self.get_symbols_batch(datapoints=self.datapoints,symbols=self.Symbols)
+        if not fetch:
+            return
+        if async_retrieval is None:
+            async_retrieval = app.ASYNC_RETRIEVAL
+        if async_retrieval:
+            self.get_symbols_batch_async(datapoints=self.datapoints, symbols=self.Symbols)
+        else:
+            self.get_symbols_batch(datapoints=self.datapoints,symbols=self.Symbols)
+        self.log_stats()
+
+    def log_stats(self):
+        """
+        Logs shared connection pool and rate limiter counters.
+        """
+        stats = connection_stats()
+        self.Logger.info(
+            f'IEX connections: {stats}',
+            extra={"message_info": {"Type": "Iex connections", **stats}}
+        )
+        stats = RATE_LIMITER.stats()
+        self.Logger.info(
+            f'IEX rate limiter: {stats}',
+            extra={"message_info": {"Type": "Iex rate limiter", **stats}}
+        )
 
     def get_symbols(self):
         return list(self.Symbols.values())
@@ -77,7 +260,7 @@ class Iex(object):
             }
             [
                 self.dict_symbols.update(
-                    {stock.get("symbol"): app.remove_empty_strings(stock)}
+                    {stock.get("symbol"): stock}
                 ) for stock in self.load_from_iex(self.__make_uri(uri_special_bones))
             ]
             return self.dict_symbols
@@ -87,40 +270,191 @@ class Iex(object):
             ex = app.AppException(e, message)
             raise ex
 
-    @app.retry(app.AppException, logger=app.get_logger(__name__))
-    @app.dict_cleanup
-    @app.func_time(logger=app.get_logger(__name__))
+    @staticmethod
+    def retry_delay(error: app.AppException, attempt: int) -> float:
+        """
+        :param attempt: number of retries made so far, starting at 0
+        :return: seconds to sleep before retrying request failed with error
+        """
+        if isinstance(error, IexServerError):
+            return app.backoff_delay(attempt, app.IEX_BACKOFF_BASE, app.IEX_BACKOFF_CAP)
+        return 0
+
     def load_from_iex(self, uri_skeleton: list):
         """
-        Connects to the specified IEX endpoint and gets the data you requested.
+        Connects to the specified IEX endpoint and gets the data you requested,
+        retries up to RETRY_TRIES times, see retry_delay.
         :type uri: str with the endpoint to query
         :return Dict() with the answer from the endpoint, Exception otherwise
         """
+        for attempt in range(RETRY_TRIES):
+            try:
+                return self.__load_from_iex(uri_skeleton)
+            except app.AppException as e:
+                if attempt == RETRY_TRIES - 1:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                self.Logger.warning(f'{e.Message}, Retrying in {delay:.2f} seconds...')
+                time.sleep(delay)
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def __load_from_iex(self, uri_skeleton: list):
         try:
             self.Logger.info(f'Now retrieveing from {uri_skeleton[0]}', extra={"message_info": {"Type": "Iex request.", "url_info": uri_skeleton[1]}})
-            response = requests.get(url=uri_skeleton[0])
+            RATE_LIMITER.acquire()
+            response = get_session().get(
+                url=uri_skeleton[0],
+                timeout=(app.HTTP_CONNECT_TIMEOUT, app.HTTP_READ_TIMEOUT)
+            )
+            if self.recorder is not None:
+                self.recorder.save(uri_skeleton[1], response.status_code, response.content)
             response.raise_for_status()
-            company_info = response.json(parse_float=Decimal)
-            self.Logger.debug(f'Got response: {company_info}')
+            company_info = codec.loads(response.content)
+            self.Logger.debug('Got response: %s', company_info)
             return company_info
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 429:
-                raise app.AppException(e, message="Too Many Requests")
-            if response.status_code == 404 and response.text == 'Unknown symbol':
-                self.Logger.warning(f'Unknown symbol error while retrieving {uri}')
-            else:
-                self.Logger.error(
-                    f'Encountered an error: {response.status_code}'
-                    f'( {response.text} ) while retrieving {uri}')
-                raise e
-
-    @app.batchify(param_to_slice='datapoints', size=10)
-    @app.batchify(param_to_slice='symbols', size=400,
-    multiprocess=True)
+            self.__handle_http_error(uri_skeleton, response.status_code, response.text, e)
+
+    async def load_from_iex_async(self, client, uri_skeleton: list):
+        """
+        Async twin of load_from_iex, waits for RATE_LIMITER without blocking the loop.
+        :param client: _AsyncClient to send request with
+        :type uri: str with the endpoint to query
+        :return Dict() with the answer from the endpoint, Exception otherwise
+        """
+        attempt = 0
+        while True:
+            try:
+                self.Logger.info(f'Now retrieveing from {uri_skeleton[0]}', extra={"message_info": {"Type": "Iex request.", "url_info": uri_skeleton[1]}})
+                await RATE_LIMITER.acquire_async()
+                status_code, content = await client.get(uri_skeleton[0])
+                if self.recorder is not None:
+                    self.recorder.save(uri_skeleton[1], status_code, content)
+                if status_code >= 400:
+                    error = requests.exceptions.HTTPError(
+                        f'{status_code} Error for url: {uri_skeleton[0]}')
+                    self.__handle_http_error(
+                        uri_skeleton, status_code, content.decode('utf-8', 'replace'), error)
+                    return None
+                company_info = codec.loads(content)
+                self.Logger.debug('Got response: %s', company_info)
+                return company_info
+            except app.AppException as e:
+                if attempt == RETRY_TRIES - 1:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                attempt += 1
+                self.Logger.warning(f'{e.Message}, Retrying in {delay:.2f} seconds...')
+                await asyncio.sleep(delay)
+
+    def __handle_http_error(self, uri_skeleton: list, status_code: int, text: str, error: Exception):
+        """
+        Decides what to do with IEX error response: Too Many Requests slows down
+        RATE_LIMITER and becomes AppException to be retried, so does server error
+        as IexServerError, unknown symbol is only logged, anything else is raised.
+        """
+        if status_code == 429:
+            RATE_LIMITER.throttle()
+            raise app.AppException(error, message="Too Many Requests")
+        if status_code >= 500:
+            RATE_LIMITER.throttle()
+            raise IexServerError(error, message=f"IEX server error {status_code}")
+        if status_code == 404 and text == 'Unknown symbol':
+            self.Logger.warning(f'Unknown symbol error while retrieving {uri_skeleton[0]}')
+        else:
+            self.Logger.error(
+                f'Encountered an error: {status_code}'
+                f'( {text} ) while retrieving {uri_skeleton[0]}')
+            raise error
+
+    def __batch_uri(self, symbols: dict, datapoints: list):
+        """
+        Makes market batch uri for given symbols and datapoints, see get_symbols_batch.
+        """
+        def array_to_string(data):
+            return ','.join([key for key in data]).lower()
+
+        tickers = array_to_string(symbols)
+        types = array_to_string(datapoints)
+        self.Logger.debug(
+            f'Following tickers: {tickers}'
+            f'will be populated with data from endpoints: {types}.'
+        )
+        uri_special_bones = {
+            "path": "/stock/market/batch",
+            "query": {
+                "symbols": tickers,
+                "types": types,
+                "range": "1m",
+                "last": 5
+            }
+        }
+        return self.__make_uri(uri_special_bones)
+
+    def __plan_batches(self, symbols: dict, datapoints: list) -> list:
+        """
+        Splits symbols x datapoints into market batch requests IEX accepts.
+        With cache, symbols are updated with cached datapoints right away
+        and only expired ones are requested, symbols missing the same datapoints
+        share batches.
+        :return: list of (symbols slice, datapoints slice) tuples
+        """
+        groups = {tuple(datapoints): symbols}
+        if self.cache is not None:
+            groups = {}
+            fresh = self.cache.get_fresh(list(symbols), datapoints)
+            for key, doc in symbols.items():
+                cached = fresh.get(key, {})
+                doc.update({d: val for d, val in cached.items() if val is not None})
+                missing = tuple(d for d in datapoints if d not in cached)
+                if missing:
+                    groups.setdefault(missing, {})[key] = doc
+            hits = sum(len(cached) for cached in fresh.values())
+            self.Logger.info(
+                f'{hits} of {len(symbols) * len(datapoints)} datapoints taken from cache',
+                extra={"message_info": {"Type": "Iex cache", "Hits": hits}}
+            )
+        return [
+            (symbols_slice, datapoints_slice)
+            for missing, group in groups.items()
+            for datapoints_slice in app.split(list(missing), DATAPOINTS_BATCH_SIZE)
+            for symbols_slice in app.split(group, SYMBOLS_BATCH_SIZE)
+        ]
+
+    def __merge_batch(self, symbols: dict, datapoints: list, result: dict):
+        """
+        Updates symbols with datapoints from market batch result and caches them.
+        """
+        if result:
+            [symbols[key].update(val) for key, val in result.items() if key in symbols]
+        if self.cache is not None and result is not None:
+            self.cache.put({
+                key: {d: result.get(key, {}).get(d) for d in datapoints}
+                for key in symbols
+            })
+
     @app.func_time(logger=app.get_logger(__name__))
-    def get_symbols_batch(self, symbols: dict, datapoints: list):
+    def get_symbols_batch(self, symbols: dict, datapoints: list) -> app.BatchResults:
         """
         Updates Symbols dict with specified datapoints.
+        All symbols x datapoints batches run in executor shared by retrieval stage,
+        see load_symbols_batch for a single batch.
+        :param symbols: dict of symbols to populate, self.Symbols if empty
+        :param datapoints: list of IEX endpoints to request
+        :return: BatchResults, AppException if any batch failed
+        """
+        symbols = self.Symbols if not symbols else symbols
+        self.Logger.info("Populate symbols with whole data set.")
+        results = app.get_executor('retrieval').map(
+            lambda batch: self.load_symbols_batch(symbols=batch[0], datapoints=batch[1]),
+            self.__plan_batches(symbols, datapoints)
+        )
+        return results.raise_for_errors('Failed while retrieving batch request data!')
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def load_symbols_batch(self, symbols: dict, datapoints: list):
+        """
+        Updates symbols with specified datapoints in a single market batch request.
         Url example to get data in batch:
         https://sandbox.iexapis.com/stable/stock/market/batch?
         symbols=aapl,fb&types=quote,news,chart&range=1m&last=5&
@@ -141,34 +475,89 @@ class Iex(object):
         and will be applied to each supporting endpoint. For example,
         `last` can be used for the news endpoint to specify the number of articles
         """
-
-        def array_to_string(data):
-            return ','.join([key for key in data]).lower()
-
         try:
-            symbols = self.Symbols if not symbols else symbols
-            tickers = array_to_string(symbols)
-            types = array_to_string(datapoints)
-
-            self.Logger.info("Populate symbols with whole data set.")
-            self.Logger.debug(
-                f'Following tickers: {tickers}'
-                f'will be populated with data from endpoints: {types}.'
-            )
-            uri_special_bones = {
-                "path": "/stock/market/batch",
-                "query": {
-                    "symbols": tickers,
-                    "types": types,
-                    "range": "1m",
-                    "last": 5
-                }
-            }
-            result = self.load_from_iex(self.__make_uri(uri_special_bones))
-            if result:
-                [symbols[key].update(val) for key, val in result.items()]
+            result = self.load_from_iex(self.__batch_uri(symbols, datapoints))
+            self.__merge_batch(symbols, datapoints, result)
 
         except Exception as e:
             message = 'Failed while retrieving batch request data!'
             ex = app.AppException(e, message)
             raise ex
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def get_symbols_batch_async(self, symbols: dict, datapoints: list,
+                                concurrency: int = None) -> app.BatchResults:
+        """
+        Updates Symbols dict with specified datapoints, same as get_symbols_batch,
+        but sends all symbols x datapoints batch requests from one asyncio loop
+        keeping up to `concurrency` of them in flight.
+        :param symbols: dict of symbols to populate, self.Symbols if empty
+        :param datapoints: list of IEX endpoints to request
+        :param concurrency: max requests in flight, app.ASYNC_RETRIEVAL_CONCURRENCY by default
+        :return: BatchResults, AppException if any batch failed
+        """
+        symbols = self.Symbols if not symbols else symbols
+        concurrency = concurrency or app.ASYNC_RETRIEVAL_CONCURRENCY
+        batches = self.__plan_batches(symbols, datapoints)
+        self.Logger.info(
+            f'Populate symbols with whole data set in {len(batches)} '
+            f'async batches, {concurrency} in flight.')
+        results = app.BatchResults(asyncio.run(self.__gather_batches(batches, concurrency)))
+        self.Logger.info(
+            f'async retrieval: {results.stats()}',
+            extra={"message_info": {"Type": "Batch execution", "Stage": "async retrieval", **results.stats()}}
+        )
+        return results.raise_for_errors('Failed while retrieving batch request data!')
+
+    async def __gather_batches(self, batches: list, concurrency: int) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(client, index: int, symbols: dict, datapoints: list):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await self.load_from_iex_async(
+                        client, self.__batch_uri(symbols, datapoints))
+                except Exception as e:
+                    return app.BatchResult(index, error=e, elapsed=time.perf_counter() - start)
+            self.__merge_batch(symbols, datapoints, result)
+            return app.BatchResult(index, value=result, elapsed=time.perf_counter() - start)
+
+        async with _AsyncClient(concurrency) as client:
+            return await asyncio.gather(
+                *(fetch(client, i, s, d) for i, (s, d) in enumerate(batches))
+            )
+
+    def iter_symbols_batch(self, symbols: dict = None, datapoints: list = None):
+        """
+        Streams documents populated with datapoints batch by batch, as soon as each
+        batch is retrieved, instead of collecting whole market in Symbols.
+        Batches run in executor shared by retrieval stage, which only keeps a few of
+        them in flight ahead of the consumer, so a slow consumer slows retrieval down
+        instead of piling documents up in memory.
+        Symbols dict is not modified.
+        :param symbols: dict of symbols to populate, self.Symbols if empty
+        :param datapoints: list of IEX endpoints to request, self.datapoints if empty
+        :return: generator of lists of documents, AppException after the last batch
+            if any of them failed
+        """
+        symbols = symbols or self.Symbols
+        datapoints = datapoints or self.datapoints
+        results = app.BatchResults()
+        for result in app.get_executor('retrieval').as_completed(
+                lambda symbols_slice: self.__fetch_documents(symbols_slice, datapoints),
+                app.split(symbols, SYMBOLS_BATCH_SIZE)):
+            results.append(result)
+            if result.ok:
+                yield result.value
+        self.log_stats()
+        results.raise_for_errors('Failed while retrieving batch request data!')
+
+    def __fetch_documents(self, symbols: dict, datapoints: list) -> list:
+        """
+        Retrieves all datapoints for given symbols into copies of their documents.
+        """
+        documents = {key: dict(val) for key, val in symbols.items()}
+        for symbols_slice, datapoints_slice in self.__plan_batches(documents, datapoints):
+            self.load_symbols_batch(symbols=symbols_slice, datapoints=datapoints_slice)
+        return list(documents.values())
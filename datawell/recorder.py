@@ -0,0 +1,69 @@
+"""
+Contains recorder of IEX traffic: request -> response pairs saved to disk, so runs can be
+replayed offline by datawell.fakeiex
+"""
+import hashlib
+import json
+import os
+import threading
+
+import app
+
+
+class Recorder(object):
+    """
+    Saves every IEX response into its own json file named after the request.
+    Requests are identified by endpoint path and query without token,
+    so recordings made against one IEX host can be replayed on any other.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls):
+        """
+        :return: Recorder writing to app.IEX_RECORD_DIR, None when it's not set
+        """
+        return cls(app.IEX_RECORD_DIR) if app.IEX_RECORD_DIR else None
+
+    @staticmethod
+    def key(path: str, query: dict) -> str:
+        """
+        :param path: endpoint path, e.g. /stock/market/batch
+        :param query: dict of query parameters, token is ignored
+        :return: file name the request is recorded under
+        """
+        params = sorted((k, str(v)) for k, v in query.items() if k != 'token')
+        request = json.dumps([path.rstrip('/'), params])
+        return hashlib.sha1(request.encode('utf-8')).hexdigest() + '.json'
+
+    def save(self, uri_bones: dict, status_code: int, body: bytes):
+        """
+        :param uri_bones: dict of uri components, the way Iex makes them
+        :param status_code: response status code
+        :param body: response body
+        """
+        query = {k: v for k, v in uri_bones['query'].items() if k != 'token'}
+        record = {
+            'path': uri_bones['path'],
+            'query': query,
+            'status': status_code,
+            'body': body.decode('utf-8', 'replace')
+        }
+        file = os.path.join(self.directory, self.key(uri_bones['path'], query))
+        with self._lock, open(file, mode='w') as record_file:
+            json.dump(record, record_file)
+
+    def load(self, path: str, query: dict):
+        """
+        :return: tuple of recorded status code and body bytes, None if request was not recorded
+        """
+        file = os.path.join(self.directory, self.key(path, query))
+        if not os.path.exists(file):
+            return None
+        with open(file, mode='r') as record_file:
+            record = json.load(record_file)
+        return record['status'], record['body'].encode('utf-8')
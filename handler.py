@@ -3,6 +3,7 @@ import os
 import secrets
 
 import app
+from app.pipeline import Pipeline
 from datawell.iex import Iex
 from persistence.dynamostore import DynamoStore
 
@@ -16,9 +17,27 @@ def lambda_handler(event=None, context=None):
     logger = app.get_logger(__name__, level=log_level)
     try:
 
-        datasource = Iex(app.STOCKS, log_level=log_level)
-        dynamostore = DynamoStore(app.TABLE, log_level=log_level)
-        dynamostore.store_documents(documents=datasource.get_symbols())
+        def store(documents: list):
+            results = dynamostore.store_documents(
+                documents=documents).raise_for_errors('Failed to store documents!')
+            failed = [doc['symbol'] for batch in results.values for doc in batch]
+            if failed:
+                logger.error(
+                    f'{len(failed)} documents were not stored: {failed}',
+                    extra={"message_info": {"Type": "Not stored documents", "Tickers": failed}}
+                )
+
+        if app.STREAMING_PIPELINE:
+            datasource = Iex(app.STOCKS, log_level=log_level, fetch=False)
+            dynamostore = DynamoStore(app.TABLE, log_level=log_level)
+            pipeline = Pipeline(sink=store, name='iex-to-dynamodb', log_level=log_level)
+            pipeline.run(datasource.iter_symbols_batch())
+        else:
+            datasource = Iex(app.STOCKS, log_level=log_level)
+            dynamostore = DynamoStore(app.TABLE, log_level=log_level)
+            store(datasource.get_symbols())
+        dynamostore.log_stats()
+        app.scheduler.log_stats()
 
     except app.AppException as e:
         logger.error(e.Message, exc_info=True)
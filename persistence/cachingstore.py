@@ -0,0 +1,234 @@
+"""
+Contains read-through cache of get_filtered_documents results in front of any store
+"""
+import inspect
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import app
+from app import codec
+from persistence import serialization
+from persistence.basestore import BaseStore
+from persistence.serialization import Serializer
+
+
+def _string_date(date) -> str:
+    if date is None or date == '':
+        return None
+    return date.strftime("%Y-%m-%d") if hasattr(date, 'strftime') else str(date)
+
+
+class CachingStore(BaseStore):
+    """
+    Wraps a store with repeatable reads (DynamoStore, S3Store) and caches what its
+    get_filtered_documents returns per symbol and date: in memory LRU of max_entries results,
+    and optionally in sqlite file, which outlives the process. Every tier has its TTL in seconds.
+    store_documents and clean_table go through to the store and drop cached results
+    they may change. Writes made around the wrapper need invalidate().
+    Anything else is passed to the wrapped store as is.
+    """
+
+    def __init__(self, store: BaseStore, max_entries: int = None, ttl: float = None,
+                 disk_path: str = None, disk_ttl: float = None, clock=time.time,
+                 log_level=logging.INFO):
+        """
+        :param store: store to read through and write to
+        :param max_entries: results kept in memory, app.STORE_CACHE_ENTRIES by default
+        :param ttl: seconds results are served from memory, app.STORE_CACHE_TTL by default
+        :param disk_path: sqlite file of disk tier, app.STORE_CACHE_PATH by default, no disk tier when empty
+        :param disk_ttl: seconds results are served from disk, app.STORE_CACHE_DISK_TTL by default
+        :param clock: time source in seconds
+        """
+        self.store = store
+        self.max_entries = app.STORE_CACHE_ENTRIES if max_entries is None else max_entries
+        self.ttl = app.STORE_CACHE_TTL if ttl is None else ttl
+        self.disk_ttl = app.STORE_CACHE_DISK_TTL if disk_ttl is None else disk_ttl
+        self.disk_path = app.STORE_CACHE_PATH if disk_path is None else disk_path
+        self.clock = clock
+        self.Logger = app.get_logger(__name__, level=log_level)
+        self.counters = dict.fromkeys(
+            ('memory_hits', 'disk_hits', 'misses', 'evictions', 'expired', 'invalidated'), 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by invalidate(), reads started before a write don't cache their result
+        self._generation = 0
+        self._signature = inspect.signature(store.get_filtered_documents)
+        # binary format keeps Decimals of DynamoDB documents
+        self._serializer = Serializer('binary', 'zlib')
+        self._db = None
+        if self.disk_path:
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, symbol TEXT, date TEXT, stored REAL, value BLOB)'
+            )
+            self._db.commit()
+
+    def __getattr__(self, name):
+        if name == 'store':
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def __key(self, args: tuple, kwargs: dict) -> tuple:
+        """
+        :return: cache key of the call along with symbol and date it reads, None for any
+        """
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {
+            name: _string_date(value) if hasattr(value, 'strftime') else value
+            for name, value in bound.arguments.items()
+        }
+        symbol = arguments.get('symbol_to_find') or None
+        date = _string_date(arguments.get('target_date'))
+        return codec.dumps(sorted(arguments.items())), symbol, date
+
+    def get_filtered_documents(self, *args, **kwargs):
+        """
+        Returns what the store returns for the same arguments, from cache when it's fresh.
+        Cached documents are shared between calls, don't change them.
+        """
+        key, symbol, date = self.__key(args, kwargs)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, status, documents = entry
+                if now - stored < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return self.__result(status, documents)
+                del self._entries[key]
+                self.counters['expired'] += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT stored, value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if now - row[0] < self.disk_ttl:
+                        status, documents = serialization.loads(row[1])
+                        self.counters['disk_hits'] += 1
+                        self.__remember(key, row[0], status, documents)
+                        return self.__result(status, documents)
+                    self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._db.commit()
+                    self.counters['expired'] += 1
+            self.counters['misses'] += 1
+            generation = self._generation
+
+        result = self.store.get_filtered_documents(*args, **kwargs)
+        # app.Results are cached as their ActionStatus value and documents, lists as None and documents
+        status = None
+        if isinstance(result, app.Results):
+            status = getattr(result.ActionStatus, 'value', result.ActionStatus)
+            result = result.Results
+        documents = list(result)
+        with self._lock:
+            if generation != self._generation:
+                # result may predate a write which went through meanwhile
+                return self.__result(status, documents)
+            self.__remember(key, now, status, documents)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO results (key, symbol, date, stored, value) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, symbol, date, now, self._serializer.dumps([status, documents])))
+                self._db.commit()
+        return self.__result(status, documents)
+
+    def __remember(self, key: str, stored: float, status: int, documents: list):
+        self._entries[key] = (stored, status, documents)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    @staticmethod
+    def __result(status: int, documents: list):
+        if status is None:
+            return list(documents)
+        results = app.Results()
+        results.ActionStatus = app.ActionStatus(status)
+        results.Results = list(documents)
+        return results
+
+    def invalidate(self, documents: list = None):
+        """
+        Drops cached results which may include the documents: ones read by their symbol,
+        by their date, or by neither. Drops everything when documents are not given.
+        """
+        pairs = None if documents is None else {
+            (d.get('symbol'), _string_date(d.get('date'))) for d in documents
+        }
+        with self._lock:
+            self._generation += 1
+            before = len(self._entries)
+            if pairs is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if self.__affected(k, pairs)]:
+                    del self._entries[key]
+            self.counters['invalidated'] += before - len(self._entries)
+            if self._db is None:
+                return
+            if pairs is None:
+                self._db.execute('DELETE FROM results')
+            else:
+                self._db.executemany(
+                    'DELETE FROM results WHERE (symbol IS NULL OR symbol = ?) '
+                    'AND (date IS NULL OR date = ?)', list(pairs))
+            self._db.commit()
+
+    def __affected(self, key: str, pairs: set) -> bool:
+        arguments = dict(codec.loads(key, cleanup=False))
+        symbol = arguments.get('symbol_to_find') or None
+        date = _string_date(arguments.get('target_date'))
+        if not arguments.keys() & {'symbol_to_find', 'target_date'}:
+            # reads of other stores can't be matched to documents
+            return True
+        return any((symbol is None or symbol == s) and (date is None or date == d) for s, d in pairs)
+
+    def store_documents(self, *args, **kwargs):
+        """
+        Writes documents through to the store and drops cached results they change.
+        """
+        documents = kwargs['documents'] if 'documents' in kwargs else args[0]
+        try:
+            return self.store.store_documents(*args, **kwargs)
+        finally:
+            self.invalidate(documents)
+
+    def clean_table(self, *args, **kwargs):
+        try:
+            return self.store.clean_table(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def stats(self) -> dict:
+        """
+        :return: dict with hits per tier, misses, evictions from memory, expired and invalidated results
+        """
+        with self._lock:
+            hits = self.counters['memory_hits'] + self.counters['disk_hits']
+            reads = hits + self.counters['misses']
+            return {
+                **self.counters,
+                'hits': hits,
+                'hit_ratio': round(hits / reads, 3) if reads else 0.0,
+                'entries': len(self._entries)
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        self.Logger.info(
+            f'Store cache: {stats}',
+            extra={"message_info": {"Type": "Store cache", **stats}}
+        )
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
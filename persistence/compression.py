@@ -0,0 +1,46 @@
+"""
+Contains compression of large document attributes into binary blobs.
+Blob is MAGIC, one byte of codec id, then compressed compact json of the attribute value,
+so it can be recognized and decompressed on read whatever the writer settings were.
+"""
+import bz2
+import lzma
+import zlib
+
+import app
+from app import codec
+
+MAGIC = b'\x1fIX'
+CODECS = {
+    'zlib': (1, zlib.compress, zlib.decompress),
+    'lzma': (2, lzma.compress, lzma.decompress),
+    'bz2': (3, bz2.compress, bz2.decompress),
+}
+_DECOMPRESSORS = {codec_id: decompress for codec_id, _, decompress in CODECS.values()}
+
+
+def compress_value(value, codec_name: str = 'zlib') -> bytes:
+    """
+    :param value: json serializable attribute value
+    :param codec_name: one of CODECS
+    :return: blob with header and compressed json
+    """
+    if codec_name not in CODECS:
+        raise app.AppException(ValueError, f'Unknown compression codec {codec_name}, use one of {list(CODECS)}')
+    codec_id, compress, _ = CODECS[codec_name]
+    return MAGIC + bytes([codec_id]) + compress(codec.dumps(value).encode('utf-8'))
+
+
+def is_compressed(blob) -> bool:
+    return isinstance(blob, (bytes, bytearray)) and bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+def decompress_value(blob: bytes):
+    """
+    :param blob: blob made by compress_value
+    :return: attribute value with ints and floats
+    """
+    codec_id = blob[len(MAGIC)]
+    if codec_id not in _DECOMPRESSORS:
+        raise app.AppException(ValueError, f'Unknown compression codec id {codec_id}')
+    return codec.loads(_DECOMPRESSORS[codec_id](bytes(blob[len(MAGIC) + 1:])), cleanup=False)
@@ -1,16 +1,65 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import queue
+import threading
+import time
+import zlib
 import boto3
 import app
+from app import codec
 import logging
-from sys import getsizeof
 from boto3.dynamodb.conditions import Key
 from persistence.basestore import BaseStore
+from persistence import compression, itemsize
+from persistence.governor import WriteGovernor
+
+# partition key of sharded layout, f'{date}#{shard}' where shard is computed from the symbol
+SHARD_KEY = 'date_shard'
+# stage of app.scheduler reads fan out on, apart from 'persistence' so reads can feed writes
+READ_STAGE = 'reads'
+# epoch seconds DynamoDB TTL deletes the item after, stamped when retention is set
+TTL_ATTRIBUTE = 'expires_at'
+_DONE = object()
+# bytes of item size limit kept for attributes added on write, e.g. SHARD_KEY and TTL_ATTRIBUTE
+ITEM_BYTES_RESERVE = 1024
+
+
+def pack_documents(documents: list, size: int):
+    """
+    batchify splitter: packs documents into batches of up to `size` items
+    and DynamoDB request bytes limit, oversized documents come one per batch.
+    """
+    return itemsize.pack(documents, max_items=size,
+                         max_item_bytes=itemsize.MAX_ITEM_BYTES - ITEM_BYTES_RESERVE)
 
 
 class DynamoStore(BaseStore):
-    def __init__(self, table_name: str, part_key: str = "date", sort_key: str = "symbol", log_level=logging.INFO):
+    def __init__(self, table_name: str, part_key: str = "date", sort_key: str = "symbol", log_level=logging.INFO,
+                 governor: WriteGovernor = None, shards: int = None, ttl_days: float = None,
+                 compress: list = None, compress_threshold: int = None, compress_codec: str = None):
+        """
+        :param governor: WriteGovernor to pace writes with, one with app.DYNAMO_WCU budgets
+            by default, writes are not paced if that is not set
+        :param shards: number of partition key values every date is spread over, app.DYNAMO_SHARDS
+            by default, 0 keeps date itself as partition key
+        :param ttl_days: days items are kept after they are written, app.DYNAMO_TTL_DAYS by default,
+            0 keeps them forever. DynamoDB deletes expired items itself, without consuming WCU
+        :param compress: attributes to store as compressed binary, e.g. ['financials', 'cash-flow'],
+            app.DYNAMO_COMPRESS by default. Reads decompress them whatever this setting is
+        :param compress_threshold: bytes an attribute value has to be over to get compressed,
+            app.DYNAMO_COMPRESS_THRESHOLD by default
+        :param compress_codec: one of persistence.compression.CODECS, app.DYNAMO_COMPRESS_CODEC by default
+        """
         self.log_level = log_level
         self.table_name = table_name
+        self.part_key = part_key
+        self.sort_key = sort_key
+        self.shards = app.DYNAMO_SHARDS if shards is None else shards
+        self.hash_key = SHARD_KEY if self.shards else part_key
+        self.ttl_days = app.DYNAMO_TTL_DAYS if ttl_days is None else ttl_days
+        self.compress = app.DYNAMO_COMPRESS if compress is None else compress
+        self.compress_threshold = (
+            app.DYNAMO_COMPRESS_THRESHOLD if compress_threshold is None else compress_threshold)
+        self.compress_codec = compress_codec or app.DYNAMO_COMPRESS_CODEC
         self.Logger = app.get_logger(__name__, level=self.log_level)
         # Initialize both client and resource along with the class for usage in methods
         self.dynamo_client = boto3.client(
@@ -28,6 +77,26 @@ class DynamoStore(BaseStore):
         except self.dynamo_resource.meta.client.exceptions.ResourceNotFoundException:
             self.Logger.info(f'Table {table_name} doesn\'t exist.')
             self.create_table(table_name, part_key, sort_key)
+        else:
+            table_hash_key = next(k['AttributeName'] for k in self.table.key_schema if k['KeyType'] == 'HASH')
+            if table_hash_key != self.hash_key:
+                raise app.AppException(
+                    ValueError(f'{table_name} is partitioned by {table_hash_key}'),
+                    f'Table {table_name} has another key layout, use migrate_from to copy it '
+                    f'into a new table with {self.shards} shards')
+        self.governor = governor or WriteGovernor.from_config()
+
+    def log_stats(self):
+        """
+        Logs consumed and achieved write capacity per table and index.
+        """
+        if self.governor is None:
+            return
+        for name, stats in self.governor.stats().items():
+            self.Logger.info(
+                f'DynamoDB {name} writes: {stats}',
+                extra={"message_info": {"Type": "DynamoDB capacity", "Budget": name, **stats}}
+            )
 
     @app.func_time(logger=app.get_logger(__name__))
     def create_table(self, table_name, part_key: str, sort_key: str):
@@ -41,6 +110,7 @@ class DynamoStore(BaseStore):
 
         waiter = self.dynamo_client.get_waiter('table_exists')
         self.Logger.info(f'Creating DynamoDB table {table_name}...')
+        shard_key = [{'AttributeName': SHARD_KEY, 'AttributeType': 'S'}] if self.shards else []
         self.dynamo_resource.create_table(
             TableName=table_name,
             AttributeDefinitions=[
@@ -52,10 +122,11 @@ class DynamoStore(BaseStore):
                     'AttributeName': sort_key,
                     'AttributeType': 'S',
                 },
+                *shard_key
             ],
             KeySchema=[
                 {
-                    'AttributeName': part_key,
+                    'AttributeName': self.hash_key,
                     'KeyType': 'HASH',
                 },
                 {
@@ -98,77 +169,241 @@ class DynamoStore(BaseStore):
                 'MaxAttempts': 10
             }
         )
+        if self.ttl_days:
+            self.enable_ttl()
+
+    def shard(self, date: str, symbol: str) -> str:
+        """
+        :return: partition key value of the symbol at the date in sharded layout
+        """
+        return f'{date}#{zlib.crc32(symbol.encode("utf-8")) % self.shards}'
+
+    def key(self, date: str, symbol: str) -> dict:
+        """
+        :return: primary key of the symbol at the date in table layout
+        """
+        if self.shards:
+            return {SHARD_KEY: self.shard(date, symbol), self.sort_key: symbol}
+        return {self.part_key: date, self.sort_key: symbol}
+
+    def to_item(self, document: dict) -> dict:
+        compressed = {
+            name: compression.compress_value(document[name], self.compress_codec)
+            for name in self.compress
+            if name in document and itemsize.value_size(document[name]) > self.compress_threshold
+        }
+        item = codec.to_dynamo({**document, **compressed} if compressed else document)
+        if self.shards:
+            item[SHARD_KEY] = self.shard(document[self.part_key], document[self.sort_key])
+        if self.ttl_days:
+            item[TTL_ATTRIBUTE] = int(time.time() + self.ttl_days * 24 * 3600)
+        return item
+
+    @staticmethod
+    def from_item(item: dict) -> dict:
+        document = codec.from_dynamo(item)
+        document.pop(SHARD_KEY, None)
+        document.pop(TTL_ATTRIBUTE, None)
+        for name, value in document.items():
+            # boto3 reads binary attributes as Binary wrapping bytes
+            blob = getattr(value, 'value', value)
+            if compression.is_compressed(blob):
+                document[name] = compression.decompress_value(blob)
+        return document
+
+    def enable_ttl(self):
+        """
+        Turns on DynamoDB TTL on TTL_ATTRIBUTE, so items stamped with ttl_days expire by themselves.
+        """
+        self.Logger.info(f'Enabling TTL on {TTL_ATTRIBUTE} of {self.table_name}')
+        self.dynamo_client.update_time_to_live(
+            TableName=self.table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': TTL_ATTRIBUTE})
 
-    @app.batchify(param_to_slice='documents', size=25,
-        multiprocess=True)
-    @app.retry(
-        app.AppException,
-        logger=app.get_logger(__name__),
-        backoff=1
-    )
+    @app.batchify(param_to_slice='documents', size=itemsize.MAX_BATCH_ITEMS,
+        multiprocess=True, stage='persistence', splitter=pack_documents)
     @app.func_time(logger=app.get_logger(__name__))
     def store_documents(self, documents: list):
         """
-        Persists list of dict() provided into the Dynamo table of the repo
+        Persists list of dict() provided into the Dynamo table of the repo.
+        Documents come packed into batches by count and bytes, see pack_documents,
+        items over DynamoDB item size limit go to store_oversized instead.
+        Only items DynamoDB left unprocessed or throttled are resubmitted,
+        with full jitter backoff, up to app.DYNAMO_WRITE_TRIES attempts.
         :param documents:
-        :return: ActionStatus with SUCCESS when stored successfully,
-            ERROR if failed, AppException if AWS Error: No access etc
-        """
-        requests = [
-            {'PutRequest': {'Item': Item}} 
-            for Item in documents
-        ]
-        ticks = [d['symbol'] for d in documents]
-        size = getsizeof(requests)
-        exceptions = self.dynamo_client.exceptions
-        errors = (exceptions.ProvisionedThroughputExceededException)
+        :return: list of documents which are still not stored after all attempts,
+            empty when stored successfully, AppException if AWS Error: No access etc
+        """
+        requests, oversized = [], []
+        size = 0
+        for document in documents:
+            item = self.to_item(document)
+            item_bytes = itemsize.item_size(item)
+            if item_bytes > itemsize.MAX_ITEM_BYTES:
+                oversized.append(document)
+                continue
+            requests.append({'PutRequest': {'Item': item}})
+            size += item_bytes
+        ticks = [r['PutRequest']['Item']['symbol'] for r in requests]
 
         self.Logger.info(
             f'Writing batch of {ticks} into dynamodb '
             f'with size {size} bytes',
-            extra={"message_info": {"Type": "DynamoDB write", "Tickers": ticks, "Size": size}}
+            extra={"message_info": {"Type": "DynamoDB write", "Tickers": ticks,
+                                    "Size": size, "Items": len(requests)}}
         )
-        
-        try:
-            response = self.dynamo_resource.batch_write_item(
-                RequestItems={self.table_name: requests},
-                ReturnConsumedCapacity = 'INDEXES')
-            
-            self.Logger.debug(f'{response}')
-            
-            if response['UnprocessedItems']:
-                raise RuntimeError('UnprocessedItems in batch write')
-        except errors as ex:
-            raise app.AppException(ex, f'dynamodb throughput exceed')
 
-        return True
+        failed = self.store_oversized(oversized) if oversized else []
+        if requests:
+            failed += [self.from_item(r['PutRequest']['Item']) for r in self.__write_batch(requests)]
+        if failed:
+            self.Logger.error(
+                f'Failed to write {[d["symbol"] for d in failed]} into dynamodb '
+                f'after {app.DYNAMO_WRITE_TRIES} attempts',
+                extra={"message_info": {"Type": "DynamoDB write failed",
+                                        "Tickers": [d['symbol'] for d in failed]}}
+            )
+        return failed
+
+    def store_oversized(self, documents: list) -> list:
+        """
+        Handles documents which are over DynamoDB item size limit even on their own.
+        They can't be written as they are, so they are reported and returned as not stored.
+        :return: list of documents which are not stored
+        """
+        self.Logger.error(
+            f'Documents {[d["symbol"] for d in documents]} are over '
+            f'{itemsize.MAX_ITEM_BYTES} bytes DynamoDB item limit',
+            extra={"message_info": {"Type": "DynamoDB oversized items",
+                                    "Tickers": [d['symbol'] for d in documents],
+                                    "Sizes": [itemsize.item_size(self.to_item(d)) for d in documents]}}
+        )
+        return documents
+
+    @app.batchify(param_to_slice='keys', size=25,
+        multiprocess=True, stage='persistence')
+    def delete_documents(self, keys: list):
+        """
+        Deletes items by their primary keys, retrying the way store_documents does.
+        :param keys: list of primary keys as dicts, see key()
+        :return: list of keys which are still not deleted after all attempts
+        """
+        requests = [{'DeleteRequest': {'Key': key}} for key in keys]
+        return [r['DeleteRequest']['Key'] for r in self.__write_batch(requests)]
+
+    def __write_batch(self, requests: list) -> list:
+        """
+        Sends up to 25 put or delete requests with batch_write_item. Only requests DynamoDB
+        left unprocessed or throttled are resubmitted, with full jitter backoff,
+        up to app.DYNAMO_WRITE_TRIES attempts.
+        :return: list of requests still unprocessed after all attempts
+        """
+        exceptions = self.dynamo_client.exceptions
+        errors = (exceptions.ProvisionedThroughputExceededException)
+        for attempt in range(app.DYNAMO_WRITE_TRIES):
+            if attempt:
+                time.sleep(app.backoff_delay(
+                    attempt - 1, app.DYNAMO_BACKOFF_BASE, app.DYNAMO_BACKOFF_CAP))
+            estimate = self.governor.acquire(requests) if self.governor else None
+            try:
+                response = self.dynamo_resource.batch_write_item(
+                    RequestItems={self.table_name: requests},
+                    ReturnConsumedCapacity='INDEXES')
+            except errors as ex:
+                if self.governor:
+                    self.governor.throttle()
+                self.Logger.warning(f'dynamodb throughput exceed: {ex}, Retrying {len(requests)} items...')
+                continue
+            except Exception as ex:
+                raise app.AppException(ex, 'Failed to write data to dynamodb!')
+
+            self.Logger.debug(f'{response}')
+            if self.governor:
+                self.governor.reconcile(estimate, response.get('ConsumedCapacity'))
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return []
+            self.Logger.warning(f'{len(requests)} unprocessed items in batch write, Retrying...')
+        return requests
 
     @app.func_time(logger=app.get_logger(__name__))
-    def clean_table(self, symbols_to_remove: list):
+    def clean_table(self, symbols_to_remove: list = None,
+                    start_date: datetime.date = None, end_date: datetime.date = None):
         """
-        Use this one to either clean specific stocks from the db or delete the table if symbols_to_remove is empty.
-        :param symbols_to_remove: list of dicts each containing 'symbol' string
+        Use this one to either clean specific stocks and/or dates from the db or delete the table
+        if symbols_to_remove is empty and no dates are given. Items to delete are looked up
+        in parallel on the 'reads' pool and deleted in parallel batches of 25.
+        :param symbols_to_remove: list of tickers to delete, all tickers if empty
+        :param start_date: first date to delete as datetime.date or 'YYYY-MM-DD' string
+        :param end_date: last date to delete, included
+        :return: number of items deleted
         """
+        start_date, end_date = (
+            d.strftime("%Y-%m-%d") if hasattr(d, 'strftime') else d
+            for d in (start_date, end_date)
+        )
         try:
-            with self.table.batch_writer() as batch:
-                if symbols_to_remove:
-                    for symbol in symbols_to_remove:
-                        date_list = []
-                        item_list = self.table.query(
-                            IndexName='Reverse_index',
-                            KeyConditionExpression=Key('symbol').eq(symbol)
-                        )['Items']
-                        for item in item_list:
-                            date_list.append(item["date"])
-                        for date in date_list:
-                            batch.delete_item(Key={"date": date, "symbol": symbol})
-                else:
-                    self.table.delete()
+            if not symbols_to_remove and not (start_date or end_date):
+                if symbols_to_remove is None:
+                    raise ValueError('Neither symbols nor dates to clean are given')
+                self.table.delete()
+                return 0
+            keys = [
+                {self.hash_key: item[self.hash_key], self.sort_key: item[self.sort_key]}
+                for item in self.__iter_keys(symbols_to_remove, start_date, end_date)
+            ]
+            self.Logger.info(f'Deleting {len(keys)} items from {self.table_name}')
+            failed = [key for batch in self.delete_documents(keys=keys).raise_for_errors(
+                'Failed to delete items!').values for key in batch]
+            if failed:
+                raise RuntimeError(f'{len(failed)} items were not deleted')
+            return len(keys)
         except Exception as e:
             message = 'Failed to clean table'
             ex = app.AppException(e, message)
             raise ex
 
+    def __iter_keys(self, symbols: list, start_date: str, end_date: str):
+        """
+        Streams items with key attributes only: from Reverse_index per symbol, from date
+        partitions per day of the range, or from a parallel scan for open date ranges.
+        """
+        names = {f'#k{i}': k for i, k in enumerate(dict.fromkeys([self.hash_key, self.sort_key, self.part_key]))}
+        projection = {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+        if start_date and end_date:
+            dates = Key(self.part_key).between(start_date, end_date)
+        elif start_date or end_date:
+            dates = Key(self.part_key).gte(start_date) if start_date else Key(self.part_key).lte(end_date)
+        else:
+            dates = None
+        if symbols:
+            requests = []
+            for symbol in dict.fromkeys(symbols):
+                condition = Key(self.sort_key).eq(symbol)
+                requests.append({
+                    'IndexName': 'Reverse_index',
+                    'KeyConditionExpression': condition & dates if dates is not None else condition,
+                    **projection
+                })
+            return self.__iter_parallel(requests, self.table.query)
+        if start_date and end_date:
+            first = datetime.strptime(start_date, "%Y-%m-%d").date()
+            days = (datetime.strptime(end_date, "%Y-%m-%d").date() - first).days + 1
+            partitions = [
+                f'{first + timedelta(days=day)}#{shard}' if self.shards else f'{first + timedelta(days=day)}'
+                for day in range(max(0, days))
+                for shard in range(self.shards or 1)
+            ]
+            return self.__iter_parallel([
+                {'KeyConditionExpression': Key(self.hash_key).eq(partition), **projection}
+                for partition in partitions
+            ], self.table.query)
+        return self.__iter_parallel([
+            {'Segment': segment, 'TotalSegments': app.DYNAMO_SCAN_SEGMENTS,
+             'FilterExpression': dates, **projection}
+            for segment in range(app.DYNAMO_SCAN_SEGMENTS)
+        ], self.table.scan)
+
     @app.func_time(logger=app.get_logger(__name__))
     def get_filtered_documents(self, symbol_to_find: str = None, target_date: datetime.date = None):
         """
@@ -179,28 +414,222 @@ class DynamoStore(BaseStore):
         :return: a list of dicts() each containing data available for a stock
             for a given period of time
         """
-        getInfo = {'Items': []}
+        return list(self.iter_filtered_documents(symbol_to_find, target_date))
+
+    def iter_filtered_documents(self, symbol_to_find: str = None, target_date: datetime.date = None):
+        """
+        Streams documents matching given ticker and/or date, see get_filtered_documents.
+        Ticker reads query Reverse_index, date reads query the date partition (every shard of it in sharded layout),
+        reads without ticker and date scan the whole table in app.DYNAMO_SCAN_SEGMENTS
+        parallel segments. All reads follow pagination to the end.
+        :return: generator of dicts() each containing data available for a stock
+        """
         self.Logger.info(f'''Looking for the info with provided peremeters:
             symbol = {symbol_to_find} and date = {target_date}''')
+        string_date = target_date.strftime("%Y-%m-%d") if target_date is not None else None
         try:
             if symbol_to_find is not None:
-                if target_date is not None:
-                    string_date = target_date.strftime("%Y-%m-%d")
-                    symbol_expression = Key('symbol').eq(symbol_to_find)
-                    date_expression = Key('date').eq(string_date)
-                    getInfo = self.table.query(
-                        KeyConditionExpression=symbol_expression,
-                        FilterExpression=date_expression)
+                if string_date is not None:
+                    item = self.table.get_item(Key=self.key(string_date, symbol_to_find)).get('Item')
+                    items = [item] if item else []
                 else:
-                    symbol_expression = Key('symbol').eq(symbol_to_find)
-                    getInfo = self.table.query(
-                        KeyConditionExpression=symbol_expression)
+                    items = self.__iter_items(
+                        self.table.query, IndexName='Reverse_index',
+                        KeyConditionExpression=Key(self.sort_key).eq(symbol_to_find))
+            elif string_date is not None:
+                if self.shards:
+                    items = self.__iter_parallel([
+                        {'KeyConditionExpression': Key(SHARD_KEY).eq(f'{string_date}#{shard}')}
+                        for shard in range(self.shards)
+                    ], self.table.query)
+                else:
+                    items = self.__iter_items(
+                        self.table.query, KeyConditionExpression=Key(self.part_key).eq(string_date))
             else:
-                if target_date is not None:
-                    string_date = target_date.strftime("%Y-%m-%d")
-                    date_expression = Key('date').eq(string_date)
-                    getInfo = self.table.scan(FilterExpression=date_expression)
-            return getInfo['Items']
+                items = self.__iter_parallel([
+                    {'Segment': segment, 'TotalSegments': app.DYNAMO_SCAN_SEGMENTS}
+                    for segment in range(app.DYNAMO_SCAN_SEGMENTS)
+                ], self.table.scan)
+            for item in items:
+                yield self.from_item(item)
+        except app.AppException:
+            raise
         except Exception as e:
-            raise app.AppException(e, message="""Unexpected behaviour during
+            raise app.AppException(e, message=f"""Unexpected behaviour during
                 the request to the DynamoDB. {e}""")
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def get_time_series(self, symbols: list, start: datetime.date = None, end: datetime.date = None) -> dict:
+        """
+        Reads history of every symbol between two dates from Reverse_index, symbols in parallel.
+        :param symbols: list of tickers
+        :param start: first date as datetime.date or 'YYYY-MM-DD' string, open range if empty
+        :param end: last date, included, open range if empty
+        :return: dict of lists of documents in date order per symbol,
+            symbols without documents have empty lists
+        """
+        start, end = (
+            d.strftime("%Y-%m-%d") if hasattr(d, 'strftime') else d
+            for d in (start, end)
+        )
+        if start and end:
+            dates = Key(self.part_key).between(start, end)
+        elif start or end:
+            dates = Key(self.part_key).gte(start) if start else Key(self.part_key).lte(end)
+        else:
+            dates = None
+        symbols = list(dict.fromkeys(symbols))
+        self.Logger.info(f'Reading time series of {len(symbols)} symbols from {start} to {end}')
+
+        def read(symbol: str) -> list:
+            condition = Key(self.sort_key).eq(symbol)
+            if dates is not None:
+                condition = condition & dates
+            return [self.from_item(item) for item in self.__iter_items(
+                self.table.query, IndexName='Reverse_index',
+                KeyConditionExpression=condition, ScanIndexForward=True)]
+
+        results = app.get_executor(READ_STAGE, app.MAX_PERSISTENCE_THREADS).map(
+            read, symbols
+        ).raise_for_errors(f'Failed to read time series from {self.table_name}!')
+        return dict(zip(symbols, results.values))
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def batch_get_documents(self, keys: list, datapoints: list = None) -> list:
+        """
+        Reads many documents by their keys with parallel BatchGetItem calls of 100 keys,
+        keys DynamoDB leaves unprocessed are requested again with full jitter backoff.
+        :param keys: list of (date, symbol) tuples, date as 'YYYY-MM-DD' string or datetime.date
+        :param datapoints: list of document attributes to read, e.g. ['advanced-stats'],
+            documents always have date and symbol, all attributes are read if empty
+        :return: list of dicts() found, in no particular order, missing keys are skipped
+        """
+        keys = list(dict.fromkeys(
+            (date if isinstance(date, str) else date.strftime("%Y-%m-%d"), symbol)
+            for date, symbol in keys
+        ))
+        projection = {}
+        if datapoints:
+            attributes = list(dict.fromkeys([self.part_key, self.sort_key, *datapoints]))
+            names = {f'#a{i}': attribute for i, attribute in enumerate(attributes)}
+            projection = {
+                'ProjectionExpression': ', '.join(names),
+                'ExpressionAttributeNames': names
+            }
+        self.Logger.info(f'Reading {len(keys)} documents with datapoints {datapoints or "all"}')
+        results = app.get_executor(READ_STAGE, app.MAX_PERSISTENCE_THREADS).map(
+            lambda chunk: self.__batch_get(chunk, projection), app.split(keys, 100)
+        ).raise_for_errors(f'Failed to read documents from {self.table_name}!')
+        return [document for documents in results.values for document in documents]
+
+    def __batch_get(self, keys: list, projection: dict) -> list:
+        """
+        Reads up to 100 keys, retrying unprocessed ones up to app.DYNAMO_READ_TRIES attempts.
+        """
+        request = {'Keys': [self.key(date, symbol) for date, symbol in keys], **projection}
+        errors = (self.dynamo_client.exceptions.ProvisionedThroughputExceededException)
+        items = []
+        for attempt in range(app.DYNAMO_READ_TRIES):
+            if attempt:
+                time.sleep(app.backoff_delay(
+                    attempt - 1, app.DYNAMO_BACKOFF_BASE, app.DYNAMO_BACKOFF_CAP))
+            try:
+                response = self.dynamo_resource.batch_get_item(
+                    RequestItems={self.table_name: request})
+            except errors as ex:
+                self.Logger.warning(f'dynamodb throughput exceed: {ex}, Retrying {len(request["Keys"])} keys...')
+                continue
+            items.extend(response['Responses'].get(self.table_name, []))
+            request = response.get('UnprocessedKeys', {}).get(self.table_name)
+            if not request:
+                return [self.from_item(item) for item in items]
+            self.Logger.warning(f'{len(request["Keys"])} unprocessed keys in batch get, Retrying...')
+        raise app.AppException(
+            RuntimeError(f'{len(request["Keys"])} keys unprocessed after {app.DYNAMO_READ_TRIES} attempts'),
+            f'Failed to read documents from {self.table_name}!')
+
+    def __pages(self, operation, **kwargs):
+        """
+        Calls table query or scan until DynamoDB has no more pages.
+        :return: generator of Items lists, one per page
+        """
+        while True:
+            response = operation(**kwargs)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def __iter_items(self, operation, **kwargs):
+        for page in self.__pages(operation, **kwargs):
+            yield from page
+
+    def __iter_parallel(self, requests: list, operation):
+        """
+        Pages through every request on the 'reads' pool at once. Pages are passed through
+        a queue of two pages per worker, so readers wait for slow consumer instead of
+        piling the table up in memory.
+        :param requests: list of kwargs of table query or scan, one per worker
+        :param operation: table query or scan
+        :return: generator of items in order pages arrive
+        """
+        pool = app.get_executor(READ_STAGE, app.MAX_PERSISTENCE_THREADS).pool
+        pages = queue.Queue(maxsize=2 * min(len(requests), pool.size))
+        closed = threading.Event()
+
+        def offer(page) -> bool:
+            while not closed.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read(kwargs: dict):
+            try:
+                for page in self.__pages(operation, **kwargs):
+                    if not offer(page):
+                        return
+            except Exception as e:
+                offer(e)
+            finally:
+                offer(_DONE)
+
+        for kwargs in requests:
+            pool.submit(read, kwargs)
+        remaining = len(requests)
+        try:
+            while remaining:
+                page = pages.get()
+                if page is _DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise app.AppException(page, f'Failed to read {self.table_name}!')
+                else:
+                    yield from page
+        finally:
+            closed.set()
+
+    @app.func_time(logger=app.get_logger(__name__))
+    def migrate_from(self, source_table: str) -> int:
+        """
+        Copies every item of another table into this one, e.g. from unsharded table
+        into a sharded one. Source table is read page by page and left intact.
+        :param source_table: name of DynamoDB table to copy from
+        :return: number of documents copied, AppException if some of them could not be stored
+        """
+        source = self.dynamo_resource.Table(source_table)
+        copied = 0
+        for items in self.__pages(source.scan):
+            documents = [self.from_item(item) for item in items]
+            results = self.store_documents(documents=documents).raise_for_errors(
+                f'Failed to copy documents from {source_table}!')
+            failed = [doc for batch in results.values for doc in batch]
+            if failed:
+                raise app.AppException(
+                    RuntimeError(f'{len(failed)} documents not stored'),
+                    f'Failed to copy documents from {source_table}!')
+            copied += len(documents)
+            self.Logger.info(f'Copied {copied} documents from {source_table} into {self.table_name}')
+        return copied
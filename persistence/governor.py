@@ -0,0 +1,148 @@
+"""
+Contains DynamoDB write governor which paces batch writes to provisioned write capacity
+"""
+import math
+import threading
+import time
+
+import app
+from app.ratelimit import RateLimiter
+from persistence import itemsize
+
+TABLE = 'table'
+
+
+class WriteGovernor(object):
+    """
+    Keeps batch writes just under write capacity units (WCU) provisioned for the table
+    and each of its global secondary indexes. Every budget is a RateLimiter of WCU per second:
+    a batch reserves its estimated WCU from all of them before it's sent, then the estimate
+    is reconciled with ConsumedCapacity DynamoDB returned for it.
+    """
+
+    def __init__(self, table_wcu: float, index_wcu: dict = None,
+                 utilization: float = None, clock=time.monotonic):
+        """
+        :param table_wcu: WCU provisioned for the table
+        :param index_wcu: dict of WCU provisioned per global secondary index
+        :param utilization: share of provisioned WCU to use, app.DYNAMO_WRITE_UTILIZATION by default
+        :param clock: monotonic time source in seconds
+        """
+        utilization = app.DYNAMO_WRITE_UTILIZATION if utilization is None else utilization
+        self.budgets = {TABLE: table_wcu, **(index_wcu or {})}
+        self.clock = clock
+        self.buckets = {
+            name: RateLimiter(rate=wcu * utilization, burst=max(1, wcu * utilization),
+                              min_rate=max(0.1, wcu * utilization / 10),
+                              increase=wcu * utilization / 10, clock=clock)
+            for name, wcu in self.budgets.items()
+        }
+        self.consumed = {name: 0.0 for name in self.budgets}
+        self._lock = threading.Lock()
+        self._started = None
+        self._finished = None
+
+    @classmethod
+    def from_config(cls, index_names: list = ('Reverse_index',)):
+        """
+        :return: WriteGovernor with app.DYNAMO_WCU and app.DYNAMO_INDEX_WCU budgets,
+            None when DYNAMO_WCU is not set
+        """
+        if not app.DYNAMO_WCU:
+            return None
+        index_wcu = app.DYNAMO_INDEX_WCU or app.DYNAMO_WCU
+        return cls(app.DYNAMO_WCU, {name: index_wcu for name in index_names})
+
+    @classmethod
+    def from_table(cls, dynamo_client, table_name: str):
+        """
+        :return: WriteGovernor with budgets provisioned for the table and its indexes,
+            None for on-demand tables which have no budget to pace to
+        """
+        table = dynamo_client.describe_table(TableName=table_name)['Table']
+        table_wcu = table.get('ProvisionedThroughput', {}).get('WriteCapacityUnits', 0)
+        if not table_wcu:
+            return None
+        index_wcu = {
+            index['IndexName']: index['ProvisionedThroughput']['WriteCapacityUnits']
+            for index in table.get('GlobalSecondaryIndexes', [])
+        }
+        return cls(table_wcu, index_wcu)
+
+    @staticmethod
+    def estimate(requests: list) -> float:
+        """
+        :param requests: batch_write_item PutRequests and DeleteRequests
+        :return: WCU the writes are expected to consume: 1 per started KB of every put item,
+            1 per deleted item, whose size is not known until reconcile()
+        """
+        return float(sum(
+            math.ceil(itemsize.item_size(r['PutRequest']['Item']) / 1024) or 1
+            if 'PutRequest' in r else 1
+            for r in requests
+        ))
+
+    def acquire(self, requests: list) -> float:
+        """
+        Blocks current thread until every budget has capacity for the batch.
+        :return: estimated WCU of the batch, pass it to reconcile() along with response
+        """
+        estimate = self.estimate(requests)
+        wait = max(bucket.reserve(estimate) for bucket in self.buckets.values())
+        if wait:
+            time.sleep(wait)
+        with self._lock:
+            if self._started is None:
+                self._started = self.clock()
+        return estimate
+
+    def reconcile(self, estimate: float, consumed_capacity: list):
+        """
+        Charges budgets with WCU batch actually consumed instead of estimated ones.
+        :param estimate: value acquire() returned for the batch
+        :param consumed_capacity: ConsumedCapacity of batch_write_item response,
+            estimate is charged when it's missing
+        """
+        if not consumed_capacity:
+            consumed = dict.fromkeys(self.budgets, estimate)
+            consumed_capacity = []
+        else:
+            consumed = dict.fromkeys(self.budgets, 0.0)
+        for capacity in consumed_capacity:
+            consumed[TABLE] += capacity.get('Table', {}).get('CapacityUnits', 0.0)
+            for name, index in capacity.get('GlobalSecondaryIndexes', {}).items():
+                if name in consumed:
+                    consumed[name] += index.get('CapacityUnits', 0.0)
+        for name, bucket in self.buckets.items():
+            difference = consumed[name] - estimate
+            if difference > 0:
+                bucket.reserve(difference)
+            elif difference < 0:
+                bucket.release(-difference)
+        with self._lock:
+            for name, units in consumed.items():
+                self.consumed[name] += units
+            self._finished = self.clock()
+
+    def throttle(self):
+        """
+        Signals DynamoDB refused writes for exceeding capacity, slows down all budgets.
+        """
+        for bucket in self.buckets.values():
+            bucket.throttle()
+
+    def stats(self) -> dict:
+        """
+        :return: dict with provisioned, consumed and achieved WCU per second per budget
+        """
+        with self._lock:
+            elapsed = (self._finished or 0) - (self._started or 0)
+            return {
+                name: {
+                    'provisioned_wcu': self.budgets[name],
+                    'consumed_wcu': round(self.consumed[name], 1),
+                    'wcu_per_second': round(self.consumed[name] / elapsed, 2) if elapsed > 0 else 0.0,
+                    'throttled': self.buckets[name].throttled
+                }
+                for name in self.budgets
+            }
@@ -0,0 +1,68 @@
+"""
+Contains DynamoDB item size estimation and batch packing by item count and bytes
+"""
+from decimal import Decimal
+
+# DynamoDB limits
+MAX_ITEM_BYTES = 400 * 1024
+MAX_BATCH_ITEMS = 25
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+
+def value_size(value) -> int:
+    """
+    :return: bytes DynamoDB bills for the attribute value: utf-8 length of strings,
+        1 byte per 2 significant digits plus 1 of numbers, 3 bytes plus 1 per element
+        (and key length in maps) of lists and maps
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        number = Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
+        if not number.is_finite():
+            return 1
+        return (len(number.normalize().as_tuple().digits) + 1) // 2 + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(k.encode('utf-8')) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + value_size(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return sum(value_size(v) for v in value)
+    if hasattr(value, 'value'):
+        # boto3.dynamodb.types.Binary
+        return len(value.value)
+    return len(str(value).encode('utf-8'))
+
+
+def item_size(item: dict) -> int:
+    """
+    :return: bytes of the item as DynamoDB counts them against MAX_ITEM_BYTES and capacity units
+    """
+    return sum(len(name.encode('utf-8')) + value_size(value) for name, value in item.items())
+
+
+def pack(items: list, max_items: int = MAX_BATCH_ITEMS, max_bytes: int = MAX_BATCH_BYTES,
+         max_item_bytes: int = MAX_ITEM_BYTES, sizer=item_size):
+    """
+    Packs items into batches in their order, each batch up to max_items and max_bytes.
+    Items over max_item_bytes can't be written as they are, so they come in batches of their own.
+    :param sizer: function returning item size in bytes
+    :return: generator of lists of items
+    """
+    batch, batch_bytes = [], 0
+    for item in items:
+        size = sizer(item)
+        if size > max_item_bytes:
+            yield [item]
+            continue
+        if batch and (len(batch) >= max_items or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(item)
+        batch_bytes += size
+    if batch:
+        yield batch
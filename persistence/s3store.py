@@ -1,16 +1,51 @@
 import boto3
+import gzip
+import json
 import logging
+import threading
+import time
+import zlib
 import app
-import botocore
+from app import codec
+from concurrent.futures import wait
 from sys import getsizeof
 from pickle import dumps, loads
+from uuid import uuid1
+from persistence import serialization
 from persistence.basestore import BaseStore
+from persistence.serialization import Serializer
+
+LAYOUTS = ('objects', 'snapshot')
+# snapshot layout keys: {SNAPSHOT_PREFIX}{date}/part-{time}-{id}.jsonl.gz and part-{time}-{id}.index.json next to it
+SNAPSHOT_PREFIX = 'snapshots/'
+PART_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.index.json'
+READ_STAGE = 'reads'
+UPLOAD_STAGE = 'uploads'
+# S3 multipart upload limit, only the last part may be smaller
+MIN_PART_SIZE = 5 * 1024 * 1024
+
 
 class S3Store(BaseStore):
-    def __init__(self, bucket_name: str, log_level=logging.INFO):
+    def __init__(self, bucket_name: str, log_level=logging.INFO, layout: str = None,
+                 serializer: str = None):
+        """
+        :param bucket_name: S3 bucket to keep documents in
+        :param layout: 'objects' keeps every document in its own {date}/{symbol} object,
+            'snapshot' packs documents of a date into gzipped json lines parts with
+            per-symbol offset index, app.S3_LAYOUT by default
+        :param serializer: persistence.serialization spec of objects layout documents,
+            'pickle' for headerless pickles, app.S3_SERIALIZER by default.
+            Documents of any serializer are read back.
+        """
         self.log_level = log_level
         self.bucket_name = bucket_name
+        self.layout = layout or app.S3_LAYOUT
+        serializer = serializer or app.S3_SERIALIZER
+        self.serializer = None if serializer == 'pickle' else Serializer.from_spec(serializer)
         self.Logger = app.get_logger(__name__, level=self.log_level)
+        if self.layout not in LAYOUTS:
+            raise app.AppException(ValueError, f'Unknown S3 layout {self.layout}, use one of {LAYOUTS}')
 
         self.s3_client = boto3.client(
             's3',
@@ -23,12 +58,22 @@ class S3Store(BaseStore):
             endpoint_url=app.S3_URI
         )
     
+    def store_documents(self, documents: list):
+        """
+        Persists list of dict() provided into the bucket in store layout
+        :param documents:
+        :return: BatchResults of batches or parts written
+        """
+        if self.layout == 'snapshot':
+            return self.store_snapshot(documents)
+        return self.store_objects(documents=documents)
+
     @app.batchify(param_to_slice='documents', size=25,
-        multiprocess=True)
+        multiprocess=True, stage='persistence')
     @app.func_time(logger=app.get_logger(__name__))
-    def store_documents(self, documents: list):
+    def store_objects(self, documents: list):
         """
-        Persists list of dict() provided into the Dynamo table of the repo
+        Persists every document as its own {date}/{symbol} object
         :param documents:
         """
 
@@ -46,55 +91,323 @@ class S3Store(BaseStore):
                 object = self.s3_res.Object(
                     self.bucket_name, f'{Item["date"]}/{Item["symbol"]}'
                 )
-                object.put(Body=dumps(Item))
+                object.put(Body=self.serializer.dumps(Item) if self.serializer else dumps(Item))
             
         except Exception as ex:
             raise app.AppException(ex, f'Failed to write data to s3!')
 
         return True
 
+    @app.func_time(logger=app.get_logger(__name__))
+    def store_snapshot(self, documents: list) -> app.BatchResults:
+        """
+        Writes documents of every date as one new part of the date snapshot: gzipped json lines,
+        one gzip member per document, so any document can be read alone with a ranged GET
+        at offset and length kept in the part index.
+        :param documents:
+        :return: BatchResults with index of every part written
+        """
+        dates = {}
+        for document in documents:
+            dates.setdefault(document['date'], []).append(document)
+        return app.get_executor('persistence').map(
+            lambda date_documents: self.__write_part(*date_documents), dates.items()
+        ).raise_for_errors('Failed to write snapshot to s3!')
+
+    def __write_part(self, date: str, documents: list) -> dict:
+        with self.snapshot_writer(date) as writer:
+            for document in documents:
+                writer.write(document)
+        return writer.index
+
+    def snapshot_writer(self, date: str, part_size: int = None, parts_in_flight: int = None):
+        """
+        Opens writer of a new snapshot part of the date, documents are uploaded while they're written.
+        :return: SnapshotWriter, use it as context manager or call close()
+        """
+        return SnapshotWriter(self.s3_client, self.bucket_name,
+                              f'{SNAPSHOT_PREFIX}{date}/part-{time.time_ns():020d}-{uuid1().hex}',
+                              part_size=part_size, parts_in_flight=parts_in_flight,
+                              log_level=self.log_level)
+
+    def __snapshot_indexes(self, target_date: str) -> list:
+        """
+        :return: indexes of all parts of the date, of all dates if it's empty,
+            newest part first by LastModified and by part name, which starts with write time
+        """
+        prefix = f'{SNAPSHOT_PREFIX}{target_date}/' if target_date else SNAPSHOT_PREFIX
+        elements = (e for e in self.__list_objects(prefix) if e['Key'].endswith(INDEX_SUFFIX))
+        indexes = list(self.__download(lambda element: {
+            **json.loads(self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=element['Key'])['Body'].read()),
+            'modified': element['LastModified']
+        }, elements))
+        return sorted(indexes, key=lambda index: (index['modified'], index['part']), reverse=True)
+
+    @staticmethod
+    def __latest(indexes: list) -> dict:
+        """
+        Parts of re-runs and retries of a date hold their own copies of its symbols,
+        only the copy of the newest part is read.
+        :param indexes: indexes newest first
+        :return: dict of index holding the latest copy per (date, symbol)
+        """
+        latest = {}
+        for index in indexes:
+            date = index['part'][len(SNAPSHOT_PREFIX):].split('/', 1)[0]
+            for symbol in index['symbols']:
+                latest.setdefault((date, symbol), index)
+        return latest
+
+    def __read_member(self, index_symbol: tuple) -> dict:
+        index, symbol = index_symbol
+        offset, length = index['symbols'][symbol]
+        member = self.s3_client.get_object(
+            Bucket=self.bucket_name, Key=index['part'],
+            Range=f'bytes={offset}-{offset + length - 1}')['Body'].read()
+        return codec.loads(gzip.decompress(member), cleanup=False)
+
+    @staticmethod
+    def __members(body, chunk_size: int = 64 * 1024):
+        """
+        :param body: streaming body of a part
+        :return: generator of offset and decompressed content of every gzip member of the part
+        """
+        decompressor, content, start, consumed = zlib.decompressobj(31), [], 0, 0
+        for chunk in iter(lambda: body.read(chunk_size), b''):
+            while chunk:
+                content.append(decompressor.decompress(chunk))
+                if not decompressor.eof:
+                    consumed += len(chunk)
+                    break
+                end = consumed + len(chunk) - len(decompressor.unused_data)
+                yield start, b''.join(content)
+                chunk = decompressor.unused_data
+                decompressor, content, start, consumed = zlib.decompressobj(31), [], end, end
+
+    def __read_part(self, index: dict, offsets: set):
+        """
+        Streams documents of the part which start at the offsets.
+        """
+        body = self.s3_client.get_object(Bucket=self.bucket_name, Key=index['part'])['Body']
+        for offset, member in self.__members(body):
+            if offset in offsets:
+                yield codec.loads(member, cleanup=False)
+
+    def __read_snapshot(self, symbol_to_find: str, target_date: str):
+        """
+        Reads latest copy of every document of snapshot layout: ranged GETs of the symbol member
+        in parallel, otherwise one streaming read per part of the date, a part at a time.
+        :return: generator of documents
+        """
+        indexes = self.__snapshot_indexes(target_date)
+        latest = self.__latest(indexes)
+        if symbol_to_find:
+            yield from self.__download(self.__read_member, (
+                (index, symbol) for (_, symbol), index in latest.items() if symbol == symbol_to_find
+            ))
+            return
+        # offsets of members every part holds the latest copy of
+        offsets = {}
+        for (_, symbol), index in latest.items():
+            offsets.setdefault(index['part'], set()).add(index['symbols'][symbol][0])
+        for index in indexes:
+            if index['part'] in offsets:
+                yield from self.__read_part(index, offsets[index['part']])
+
+    def __list_objects(self, prefix: str):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def __get_document(self, key: str) -> list:
+        """
+        :return: list with the document of objects layout, empty if there is no such key
+        """
+        try:
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)['Body'].read()
+        except self.s3_client.exceptions.NoSuchKey:
+            self.Logger.warning(f'Requested Item {key} does not exists')
+            return []
+        self.Logger.debug(f'retrieve {key}')
+        return [serialization.loads(body) if serialization.is_serialized(body) else loads(body)]
+
+    def __download(self, fn, batches):
+        """
+        Runs fn(batch) on the 'reads' pool with at most 2 x pool size downloads in flight.
+        :return: generator of fn values in order downloads complete
+        """
+        for result in app.get_executor(READ_STAGE, app.MAX_PERSISTENCE_THREADS).as_completed(fn, batches):
+            if not result.ok:
+                raise app.AppException(result.error, f'Failed to read from s3 bucket {self.bucket_name}!')
+            yield result.value
+
+    def iter_filtered_documents(self,
+            symbol_to_find: str = None,
+            target_date: str = ''
+        ):
+        """
+        Streams documents of the symbol and date, either may be empty to match any.
+        Known date and symbol is a single GET of objects layout, otherwise keys are
+        listed and downloaded in parallel.
+        :return: generator of documents in order downloads complete
+        """
+        if self.layout == 'snapshot':
+            yield from self.__read_snapshot(symbol_to_find, target_date)
+            return
+        if symbol_to_find and target_date:
+            yield from self.__get_document(f'{target_date}/{symbol_to_find}')
+            return
+        keys = (
+            key for key in (e['Key'] for e in self.__list_objects(f'{target_date}/' if target_date else ''))
+            if not key.startswith(SNAPSHOT_PREFIX)
+            and (not symbol_to_find or key.rsplit('/', 1)[-1] == symbol_to_find)
+        )
+        for documents in self.__download(self.__get_document, keys):
+            yield from documents
+
     @app.func_time(logger=app.get_logger(__name__))
     def get_filtered_documents(self, 
             symbol_to_find: str = None, 
             target_date: str = ''
         ):
         appResults = app.Results()
+        appResults.Results = list(self.iter_filtered_documents(symbol_to_find, target_date))
+        return appResults
 
-        paginator = self.s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(
-            Bucket=self.bucket_name,
-            Prefix=target_date
-        )
-        content = []
-        reqitem = f'{target_date}/{symbol_to_find}'
+    def clean_table():
+        return False
+
+
+class SnapshotWriter(object):
+    """
+    Streams one snapshot part to S3: every document is compressed into its own gzip member
+    as it's written, members are buffered into parts of part_size bytes, which are sent
+    with multipart upload on the 'uploads' pool. At most parts_in_flight parts are kept
+    in memory, write() blocks until one of them is uploaded. Part index is written on close().
+    """
+
+    def __init__(self, s3_client, bucket_name: str, part: str, part_size: int = None,
+                 parts_in_flight: int = None, log_level=logging.INFO):
+        """
+        :param part: part key without suffix
+        :param part_size: bytes of every uploaded part, app.S3_PART_SIZE by default, MIN_PART_SIZE at least
+        :param parts_in_flight: parts uploaded at once, app.S3_PARTS_IN_FLIGHT by default
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = part + PART_SUFFIX
+        self.index_key = part + INDEX_SUFFIX
+        self.part_size = max(MIN_PART_SIZE, part_size or app.S3_PART_SIZE)
+        self.parts_in_flight = parts_in_flight or app.S3_PARTS_IN_FLIGHT
+        self.index = {'part': self.key, 'symbols': {}}
+        self.bytes_written = 0
+        self.documents = 0
+        self.Logger = app.get_logger(__name__, level=log_level)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._slots = threading.Semaphore(self.parts_in_flight)
+        self._lock = threading.Lock()
+        self._bytes_uploaded = 0
+        self._closed = False
+
+    @property
+    def bytes_uploaded(self) -> int:
+        """
+        :return: compressed bytes S3 has acknowledged so far
+        """
+        with self._lock:
+            return self._bytes_uploaded
+
+    def write(self, document: dict):
+        member = gzip.compress((codec.dumps(document) + '\n').encode('utf-8'))
+        self.index['symbols'][document['symbol']] = [self.bytes_written, len(member)]
+        self._buffer += member
+        self.bytes_written += len(member)
+        self.documents += 1
+        if len(self._buffer) >= self.part_size:
+            self.__flush()
+
+    def __flush(self):
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise app.AppException(future.exception(), f'Failed to upload part of {self.key}!')
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key,
+                ContentType='application/x-ndjson', ContentEncoding='gzip')['UploadId']
+        body, self._buffer = bytes(self._buffer), bytearray()
+        self._slots.acquire()
+        pool = app.get_executor(UPLOAD_STAGE, app.S3_PARTS_IN_FLIGHT).pool
+        self._futures.append(pool.submit(self.__upload_part, len(self._futures) + 1, body))
+
+    def __upload_part(self, number: int, body: bytes) -> dict:
         try:
-            # if we have more than 1000 keys need to paginate
-            [content.extend(page['Contents']) for page in pages]
-            for element in content:
-                # skip elements that not expected
-                if reqitem not in element['Key']:
-                    continue
-                if (symbol_to_find and
-                    not element['Key'].endswith(symbol_to_find)):
-                    continue
-                object = self.s3_res.Object(
-                    self.bucket_name, element['Key']
-                )
-                self.Logger.info(f'retrieve {element["Key"]}')
-                appResults.Results.append(
-                    loads(object.get()['Body'].read())
-                )
+            etag = self.s3_client.upload_part(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                PartNumber=number, Body=body)['ETag']
+            with self._lock:
+                self._bytes_uploaded += len(body)
+            return {'PartNumber': number, 'ETag': etag}
+        finally:
+            self._slots.release()
 
-        except botocore.exceptions.ClientError as e:
-            if e.response['Error']['Code'] == "404":
-                self.Logger.warn(
-                    f"Requested Item {reqitem} does not exists"
-                )
+    def close(self) -> dict:
+        """
+        Uploads the rest of the part and its index.
+        :return: part index
+        """
+        if self._closed:
+            return self.index
+        self._closed = True
+        try:
+            if self._upload_id is None:
+                # small part fits into single put
+                body = bytes(self._buffer)
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=self.key, Body=body,
+                    ContentType='application/x-ndjson', ContentEncoding='gzip')
+                with self._lock:
+                    self._bytes_uploaded += len(body)
             else:
-                # Something else has gone wrong.
-                raise
-        return appResults
-            
+                if self._buffer:
+                    self.__flush()
+                parts = [future.result() for future in self._futures]
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts})
+            self.s3_client.put_object(
+                Bucket=self.bucket_name, Key=self.index_key,
+                Body=json.dumps(self.index).encode('utf-8'), ContentType='application/json')
+        except Exception as ex:
+            self.abort()
+            raise app.AppException(ex, f'Failed to write snapshot to s3!')
+        self.Logger.info(
+            f'Wrote {self.documents} documents into s3 part {self.key} '
+            f'with size {self.bytes_written} bytes in {len(self._futures) or 1} parts',
+            extra={"message_info": {"Type": "S3 snapshot write", "Part": self.key,
+                                    "Documents": self.documents, "Size": self.bytes_written,
+                                    "Parts": len(self._futures) or 1}}
+        )
+        return self.index
 
-    def clean_table():
-        return False
+    def abort(self):
+        """
+        Drops parts uploaded so far, nothing of the part is left in the bucket.
+        """
+        self._closed = True
+        wait(self._futures)
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,227 @@
+"""
+Contains versioned document serialization shared by stores.
+Blob is MAGIC, then one byte each of VERSION, format id and compression id, then the payload,
+so any blob can be decoded whatever serializer wrote it.
+Formats: 'json' is compact json, Decimals become ints and floats;
+'binary' is compact tagged binary keeping Decimals, bytes and ints as they are.
+Compression is 'none' or any of persistence.compression.CODECS.
+"""
+import struct
+from decimal import Decimal
+
+import app
+from app import codec
+from persistence import compression
+
+MAGIC = b'IXS'
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 3
+NO_COMPRESSION = 'none'
+
+# tags of binary format values
+_NONE, _TRUE, _FALSE, _INT, _BIG_INT, _FLOAT, _DECIMAL, _STR, _BYTES, _LIST, _MAP = b'NTFiIfdsblm'
+_DOUBLE = struct.Struct('>d')
+
+
+def _write_size(out: bytearray, size: int):
+    # unsigned LEB128 varint
+    while size > 0x7f:
+        out.append(size & 0x7f | 0x80)
+        size >>= 7
+    out.append(size)
+
+
+def _read_size(data: bytes, pos: int) -> tuple:
+    size, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        size |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return size, pos
+        shift += 7
+
+
+def _write_str(out: bytearray, value: str):
+    encoded = value.encode('utf-8')
+    _write_size(out, len(encoded))
+    out += encoded
+
+
+def _encode(out: bytearray, value):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, str):
+        out.append(_STR)
+        _write_str(out, value)
+    elif isinstance(value, int):
+        if -(1 << 62) <= value < (1 << 62):
+            out.append(_INT)
+            # zigzag keeps small negative numbers short
+            _write_size(out, (value << 1) ^ (value >> 63))
+        else:
+            out.append(_BIG_INT)
+            _write_str(out, str(value))
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, Decimal):
+        out.append(_DECIMAL)
+        _write_str(out, str(value))
+    elif isinstance(value, dict):
+        out.append(_MAP)
+        _write_size(out, len(value))
+        for key, item in value.items():
+            _write_str(out, key)
+            _encode(out, item)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_size(out, len(value))
+        for item in value:
+            _encode(out, item)
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(_BYTES)
+        _write_size(out, len(value))
+        out += value
+    else:
+        raise app.AppException(TypeError, f'Object of type {type(value).__name__} can not be serialized')
+
+
+def _decode(data: bytes, pos: int) -> tuple:
+    tag = data[pos]
+    pos += 1
+    if tag == _STR:
+        size, pos = _read_size(data, pos)
+        return data[pos:pos + size].decode('utf-8'), pos + size
+    if tag == _INT:
+        number, pos = _read_size(data, pos)
+        return (number >> 1) ^ -(number & 1), pos
+    if tag == _MAP:
+        count, pos = _read_size(data, pos)
+        value = {}
+        for _ in range(count):
+            size, pos = _read_size(data, pos)
+            key = data[pos:pos + size].decode('utf-8')
+            value[key], pos = _decode(data, pos + size)
+        return value, pos
+    if tag == _LIST:
+        count, pos = _read_size(data, pos)
+        value = []
+        for _ in range(count):
+            item, pos = _decode(data, pos)
+            value.append(item)
+        return value, pos
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + _DOUBLE.size
+    if tag == _DECIMAL or tag == _BIG_INT:
+        size, pos = _read_size(data, pos)
+        text = data[pos:pos + size].decode('ascii')
+        return (Decimal(text) if tag == _DECIMAL else int(text)), pos + size
+    if tag == _BYTES:
+        size, pos = _read_size(data, pos)
+        return bytes(data[pos:pos + size]), pos + size
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    raise app.AppException(ValueError, f'Unknown binary tag {tag} at {pos - 1}')
+
+
+def _binary_dumps(obj) -> bytes:
+    out = bytearray()
+    _encode(out, obj)
+    return bytes(out)
+
+
+def _binary_loads(data: bytes):
+    value, _ = _decode(data, 0)
+    return value
+
+
+FORMATS = {
+    'json': (1, lambda obj: codec.dumps(obj).encode('utf-8'),
+             lambda data: codec.loads(data, cleanup=False)),
+    'binary': (2, _binary_dumps, _binary_loads),
+}
+_FORMATS_BY_ID = {format_id: (name, loads) for name, (format_id, _, loads) in FORMATS.items()}
+_COMPRESSIONS_BY_ID = {
+    0: (NO_COMPRESSION, lambda data: data),
+    **{codec_id: (name, decompress) for name, (codec_id, _, decompress) in compression.CODECS.items()}
+}
+
+
+class Serializer(object):
+    """
+    Encodes documents into blobs with header in the format and compression it's created with,
+    decodes blobs of any format and compression.
+    """
+
+    def __init__(self, format_name: str = 'binary', compression_name: str = NO_COMPRESSION):
+        """
+        :param format_name: one of FORMATS
+        :param compression_name: 'none' or one of persistence.compression.CODECS
+        """
+        if format_name not in FORMATS:
+            raise app.AppException(
+                ValueError, f'Unknown serialization format {format_name}, use one of {list(FORMATS)}')
+        if compression_name != NO_COMPRESSION and compression_name not in compression.CODECS:
+            raise app.AppException(
+                ValueError, f'Unknown compression {compression_name}, use none or one of {list(compression.CODECS)}')
+        self.format = format_name
+        self.compression = compression_name
+        format_id, self._dumps, _ = FORMATS[format_name]
+        if compression_name == NO_COMPRESSION:
+            compression_id, self._compress = 0, None
+        else:
+            compression_id, self._compress, _ = compression.CODECS[compression_name]
+        self.header = MAGIC + bytes([VERSION, format_id, compression_id])
+
+    @classmethod
+    def from_spec(cls, spec: str):
+        """
+        :param spec: format and optional compression, e.g. 'binary' or 'json+zlib'
+        """
+        format_name, _, compression_name = spec.partition('+')
+        return cls(format_name, compression_name or NO_COMPRESSION)
+
+    @property
+    def spec(self) -> str:
+        return self.format if self.compression == NO_COMPRESSION else f'{self.format}+{self.compression}'
+
+    def dumps(self, obj) -> bytes:
+        payload = self._dumps(obj)
+        return self.header + (self._compress(payload) if self._compress else payload)
+
+    @staticmethod
+    def loads(blob: bytes):
+        return loads(blob)
+
+    def __repr__(self):
+        return f'Serializer({self.spec!r})'
+
+
+def is_serialized(blob) -> bool:
+    return isinstance(blob, (bytes, bytearray)) and bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+def loads(blob: bytes):
+    """
+    :param blob: blob made by any Serializer
+    :return: decoded document
+    """
+    if not is_serialized(blob) or len(blob) < HEADER_SIZE:
+        raise app.AppException(ValueError, 'Not a serialized document, header is missing')
+    version, format_id, compression_id = blob[len(MAGIC):HEADER_SIZE]
+    if version > VERSION:
+        raise app.AppException(ValueError, f'Serialization version {version} is newer than supported {VERSION}')
+    if format_id not in _FORMATS_BY_ID or compression_id not in _COMPRESSIONS_BY_ID:
+        raise app.AppException(ValueError, f'Unknown serialization format {format_id} or compression {compression_id}')
+    _, decompress = _COMPRESSIONS_BY_ID[compression_id]
+    _, format_loads = _FORMATS_BY_ID[format_id]
+    return format_loads(decompress(bytes(blob[HEADER_SIZE:])))
@@ -1,15 +1,28 @@
+import base64
 import boto3
 import logging
 import app
-import json
+from app import codec
 from uuid import uuid1
+from persistence import serialization
 from persistence.basestore import BaseStore
+from persistence.serialization import Serializer
+
+# message bodies are text, so serialized blobs are sent base64 encoded
+BASE64_MAGIC = base64.b64encode(serialization.MAGIC).decode('ascii')
 
 class sqsStore(BaseStore):
 
-    def __init__(self, name: str='sqsStore', log_level=logging.INFO):
+    def __init__(self, name: str='sqsStore', log_level=logging.INFO, serializer: str = None):
+        """
+        :param serializer: persistence.serialization spec of message bodies,
+            'json' for plain json text, app.SQS_SERIALIZER by default.
+            Bodies of any serializer are read back.
+        """
         self.log_level = log_level
         self.Logger = app.get_logger(__name__, level=self.log_level)
+        serializer = serializer or app.SQS_SERIALIZER
+        self.serializer = None if serializer == 'json' else Serializer.from_spec(serializer)
         self.sqs_client = boto3.client(
             'sqs',
             region_name=app.REGION,
@@ -30,7 +43,7 @@ class sqsStore(BaseStore):
         entries = [
             { 
                 'Id': str(uuid1()),
-                'MessageBody': json.dumps(doc)
+                'MessageBody': self.encode(doc)
             }
             for doc in documents
         ]
@@ -45,6 +58,17 @@ class sqsStore(BaseStore):
         results.Results = ids
         return results
 
+    def encode(self, document: dict) -> str:
+        if self.serializer is None:
+            return codec.dumps(document)
+        return base64.b64encode(self.serializer.dumps(document)).decode('ascii')
+
+    @staticmethod
+    def decode(body: str) -> dict:
+        if body.startswith(BASE64_MAGIC):
+            return serialization.loads(base64.b64decode(body))
+        return codec.loads(body, cleanup=False)
+
     def get_filtered_documents(self, numberOfMessages: int):
         """
         Returns a list of documents matching given ticker and/or date
@@ -63,7 +87,7 @@ class sqsStore(BaseStore):
                 QueueUrl=self.sqs_queue_url,
                 MaxNumberOfMessages=numberOfMessages
             )
-            [sqs_messages.append(json.loads(message['Body'])) for message in get_documents['Messages']]
+            [sqs_messages.append(self.decode(message['Body'])) for message in get_documents['Messages']]
             results.Results = sqs_messages
             results.ActionStatus = 0
         except Exception as e:
@@ -0,0 +1,403 @@
+import decimal
+import glob
+import json
+import threading
+import time
+from unittest import TestCase
+import app
+from app import codec
+from app.batch import BatchExecutor
+from app.pipeline import Pipeline
+from app.ratelimit import RateLimiter
+from app.scheduler import Scheduler, WorkerPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(rate=10, burst=5, clock=self.clock)
+
+    def test_reserve_WithinBurst_ExpectNoWait(self):
+        # ACT
+        waits = [self.limiter.reserve() for _ in range(5)]
+
+        # ASSERT
+        self.assertEqual(waits, [0.0] * 5)
+
+    def test_reserve_OverBurst_ExpectWaitByRate(self):
+        # ARRANGE
+        [self.limiter.reserve() for _ in range(5)]
+
+        # ACT
+        waits = [self.limiter.reserve() for _ in range(3)]
+
+        # ASSERT
+        self.assertEqual([round(w, 3) for w in waits], [0.1, 0.2, 0.3])
+
+    def test_throttle_CalledTwiceWithinCooldown_ExpectRateHalvedOnce(self):
+        # ACT
+        self.limiter.throttle()
+        self.limiter.throttle()
+
+        # ASSERT
+        self.assertEqual(self.limiter.rate, 5)
+        self.assertEqual(self.limiter.throttled, 1)
+
+    def test_throttle_ThenTimePasses_ExpectRateRecoversUpToMax(self):
+        # ARRANGE
+        self.limiter.throttle()
+
+        # ACT
+        self.clock.now += 2
+        self.limiter.reserve()
+        recovering = self.limiter.rate
+        self.clock.now += 60
+        self.limiter.reserve()
+
+        # ASSERT
+        self.assertEqual(recovering, 7)
+        self.assertEqual(self.limiter.rate, 10)
+
+    def test_release_AfterOverReserve_ExpectTokensBackUpToBurst(self):
+        # ARRANGE
+        self.limiter.reserve(8)
+
+        # ACT
+        self.limiter.release(20)
+        wait = self.limiter.reserve(5)
+
+        # ASSERT
+        self.assertEqual(wait, 0.0)
+        self.assertEqual(self.limiter.reserve(), 0.1)
+
+    def test_throttle_NeverBelowMinRate(self):
+        # ACT
+        for _ in range(10):
+            self.limiter.throttle()
+            self.clock.now += 1
+
+        # ASSERT
+        self.assertGreaterEqual(self.limiter.rate, self.limiter.min_rate)
+
+
+class TestBackoff(TestCase):
+    def test_backoff_delay_PassGrowingAttempts_ExpectDelaysWithinExponentialLimitAndCap(self):
+        # ACT
+        delays = [[app.backoff_delay(attempt, base=0.1, cap=1) for _ in range(200)]
+                  for attempt in range(6)]
+
+        # ASSERT
+        for attempt, attempt_delays in enumerate(delays):
+            limit = min(1, 0.1 * 2 ** attempt)
+            self.assertTrue(all(0 <= d <= limit for d in attempt_delays))
+            self.assertGreater(max(attempt_delays), limit / 2)
+
+
+class TestPipeline(TestCase):
+
+    def test_run_PassSource_ExpectEveryItemSunk(self):
+        # ARRANGE
+        sunk = []
+        pipeline = Pipeline(sink=sunk.append, queue_size=2, sink_workers=1)
+
+        # ACT
+        stats = pipeline.run(range(10))
+
+        # ASSERT
+        self.assertEqual(sunk, list(range(10)))
+        self.assertEqual(stats['produced'], 10)
+        self.assertEqual(stats['consumed'], 10)
+
+    def test_run_SlowSink_ExpectProducerHeldByQueueSize(self):
+        # ARRANGE
+        produced = []
+        lock = threading.Lock()
+        ahead = []
+
+        def source():
+            for i in range(6):
+                produced.append(i)
+                yield i
+
+        def sink(item):
+            time.sleep(0.05)
+            with lock:
+                ahead.append(len(produced) - item)
+
+        pipeline = Pipeline(sink=sink, queue_size=1, sink_workers=1)
+
+        # ACT
+        pipeline.run(source())
+
+        # ASSERT
+        self.assertLessEqual(max(ahead), 3, 'Producer should not run ahead of the queue')
+        self.assertGreater(pipeline.stats['blocked_seconds'], 0)
+
+    def test_run_SinkFails_ExpectAppExceptionAfterAllItems(self):
+        # ARRANGE
+        sunk = []
+
+        def sink(item):
+            if item == 3:
+                raise ValueError('boom')
+            sunk.append(item)
+
+        pipeline = Pipeline(sink=sink, queue_size=2, sink_workers=2)
+
+        # ACT / ASSERT
+        with self.assertRaises(app.AppException):
+            pipeline.run(range(6))
+        self.assertEqual(sorted(sunk), [0, 1, 2, 4, 5])
+        self.assertEqual(len(pipeline.errors), 1)
+
+
+class TestBatchExecutor(TestCase):
+
+    def setUp(self):
+        self.executor = BatchExecutor('test', max_workers=4, max_in_flight=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_map_PassBatches_ExpectValuesInOrder(self):
+        # ACT
+        results = self.executor.map(lambda b: sum(b), [[1, 2], [3], [4, 5, 6]])
+
+        # ASSERT
+        self.assertEqual(results.values, [3, 3, 15])
+        self.assertEqual([r.index for r in results], [0, 1, 2])
+
+    def test_map_BatchFails_ExpectErrorCollectedAndOthersCompleted(self):
+        # ARRANGE
+        def fn(batch):
+            if batch == 2:
+                raise ValueError('boom')
+            return batch
+
+        # ACT
+        results = self.executor.map(fn, range(5))
+
+        # ASSERT
+        self.assertEqual(results.values, [0, 1, 3, 4])
+        self.assertEqual(len(results.errors), 1)
+        self.assertIsInstance(results[2].error, ValueError)
+        with self.assertRaises(app.AppException):
+            results.raise_for_errors()
+
+    def test_as_completed_SlowBatches_ExpectNoMoreThanMaxInFlight(self):
+        # ARRANGE
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def fn(batch):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return batch
+
+        # ACT
+        results = list(self.executor.as_completed(fn, range(8)))
+
+        # ASSERT
+        self.assertEqual(sorted(r.value for r in results), list(range(8)))
+        self.assertLessEqual(peak[0], 2)
+
+    def test_batchify_DecoratedFunction_ExpectResultPerSlice(self):
+        # ARRANGE
+        @app.batchify(param_to_slice='data', size=2, multiprocess=True, stage='test-batchify')
+        def total(data: list):
+            return sum(data)
+
+        # ACT
+        results = total(data=[1, 2, 3, 4, 5])
+
+        # ASSERT
+        self.assertEqual(results.values, [3, 7, 5])
+        self.assertEqual(results.stats()['batches'], 3)
+
+
+class TestScheduler(TestCase):
+
+    def test_pool_ConfiguredStage_ExpectConfiguredSize(self):
+        # ARRANGE
+        scheduler = Scheduler({'retrieval': 3})
+
+        # ACT
+        pool = scheduler.pool('retrieval')
+
+        # ASSERT
+        self.assertEqual(pool.size, 3)
+        self.assertIs(scheduler.pool('retrieval'), pool)
+        pool.shutdown()
+
+    def test_resize_GrowAndShrink_ExpectThreadsFollow(self):
+        # ARRANGE
+        pool = WorkerPool('test-resize', 2)
+
+        # ACT
+        pool.resize(5)
+        grown = pool.size
+        pool.resize(1)
+        futures = [pool.submit(lambda x: x * 2, i) for i in range(5)]
+        values = [f.result(timeout=5) for f in futures]
+        time.sleep(0.05)
+
+        # ASSERT
+        self.assertEqual(grown, 5)
+        self.assertEqual(values, [0, 2, 4, 6, 8])
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(len(pool._threads), 1)
+        pool.shutdown()
+
+    def test_stats_BusyPool_ExpectQueueDepthAndUtilization(self):
+        # ARRANGE
+        pool = WorkerPool('test-stats', 1)
+        release = threading.Event()
+        futures = [pool.submit(release.wait) for _ in range(3)]
+        time.sleep(0.05)
+
+        # ACT
+        stats = pool.stats()
+        release.set()
+        [f.result(timeout=5) for f in futures]
+
+        # ASSERT
+        self.assertEqual(stats['active'], 1)
+        self.assertEqual(stats['queued'], 2)
+        self.assertEqual(stats['utilization'], 1.0)
+        pool.shutdown()
+
+
+    def test_shutdown_MoreTasksThanThreads_ExpectEveryQueuedTaskCompleted(self):
+        # ARRANGE
+        pool = WorkerPool('test-shutdown', 1)
+        futures = [pool.submit(time.sleep, 0.05) for _ in range(4)]
+
+        # ACT
+        pool.shutdown(wait=True)
+
+        # ASSERT
+        self.assertTrue(all(f.done() and not f.cancelled() for f in futures),
+                        'queued tasks should run before threads stop')
+        self.assertEqual(pool.size, 0)
+        with self.assertRaises(app.AppException):
+            pool.submit(time.sleep, 0)
+
+    def test_submit_PoolShrunkToZero_ExpectAppException(self):
+        # ARRANGE
+        pool = WorkerPool('test-empty', 1)
+
+        # ACT
+        pool.resize(0)
+
+        # ASSERT
+        with self.assertRaises(app.AppException):
+            pool.submit(time.sleep, 0)
+        pool.shutdown()
+
+
+class TestCleanup(TestCase):
+
+    def test_loads_clean_PassReferenceDictWithEmptyValue_ExpectReferenceDict(self):
+        # ARRANGE
+        with open('tests/fixtures/ref_dict_toclean.json', mode='rb') as src_file:
+            raw = src_file.read()
+        ref_dict = self.read_fixture('tests/fixtures/ref_dict.json')
+
+        # ACT
+        res_dict = app.loads_clean(raw)
+
+        # ASSERT
+        self.assertDictEqual(res_dict, ref_dict)
+
+    def test_loads_clean_PassFixtures_ExpectSameAsRemoveEmptyStrings(self):
+        for file in glob.glob('tests/fixtures/*.json'):
+            with self.subTest(file=file):
+                # ARRANGE
+                with open(file, mode='rb') as src_file:
+                    raw = src_file.read()
+
+                # ACT
+                cleaned = app.loads_clean(raw)
+
+                # ASSERT
+                self.assertEqual(cleaned, app.remove_empty_strings(self.read_fixture(file)))
+
+    def test_loads_clean_PassNestedEmptiesInLists_ExpectPruned(self):
+        # ARRANGE
+        raw = '[{"a": ""}, [[], [{}]], 0, false, null, "", {"b": [{"c": []}], "d": 1}]'
+
+        # ACT
+        cleaned = app.loads_clean(raw)
+
+        # ASSERT
+        self.assertEqual(cleaned, [0, False, {'d': 1}])
+
+    def test_loads_clean_PassDuplicateKeys_ExpectLastValueWins(self):
+        # ACT
+        cleaned = app.loads_clean('{"a": 1, "a": "", "b": 2}')
+
+        # ASSERT
+        self.assertEqual(cleaned, {'b': 2})
+
+    def read_fixture(self, file: str):
+        with open(file, mode='r') as src_file:
+            return json.load(src_file, parse_float=decimal.Decimal)
+
+
+class TestCodec(TestCase):
+
+    def test_loads_EveryBackend_ExpectSameCleanedFloats(self):
+        # ARRANGE
+        with open('tests/fixtures/ALTM.response.json', mode='rb') as src_file:
+            raw = src_file.read()
+        expected = app.remove_empty_strings(json.loads(raw))
+
+        for backend in self.available_backends():
+            with self.subTest(backend=backend):
+                # ACT
+                decoded = codec.loads(raw, backend=backend)
+
+                # ASSERT
+                self.assertEqual(decoded, expected)
+
+    def test_dumps_PassDecimals_ExpectNumbers(self):
+        # ARRANGE
+        doc = {'price': decimal.Decimal('12.5'), 'volume': decimal.Decimal('100'), 'name': 'A'}
+
+        for backend in self.available_backends():
+            with self.subTest(backend=backend):
+                # ACT
+                encoded = codec.dumps(doc, backend=backend)
+
+                # ASSERT
+                self.assertEqual(json.loads(encoded), {'price': 12.5, 'volume': 100, 'name': 'A'})
+
+    def test_to_dynamo_ThenFromDynamo_ExpectDecimalsInBetweenAndSameDocBack(self):
+        # ARRANGE
+        doc = {'a': 1.1, 'b': [2, 0.5, {'c': 3.25}], 'd': 'x', 'e': True}
+
+        # ACT
+        stored = codec.to_dynamo(doc)
+        restored = codec.from_dynamo(stored)
+
+        # ASSERT
+        self.assertEqual(stored['a'], decimal.Decimal('1.1'))
+        self.assertEqual(stored['b'][2]['c'], decimal.Decimal('3.25'))
+        self.assertEqual(restored, doc)
+
+    def available_backends(self):
+        return ['stdlib'] + (['orjson'] if codec.orjson else [])
@@ -0,0 +1,179 @@
+import decimal
+import os
+import tempfile
+from unittest import TestCase, mock
+import app
+from persistence.basestore import BaseStore
+from persistence.cachingstore import CachingStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryStore(BaseStore):
+    """
+    Store keeping documents in a list, counts reads that reach it.
+    """
+
+    def __init__(self, documents: list, wrap_results: bool = False):
+        self.documents = list(documents)
+        self.wrap_results = wrap_results
+        self.reads = 0
+
+    def store_documents(self, documents: list):
+        self.documents.extend(documents)
+        return []
+
+    def get_filtered_documents(self, symbol_to_find: str = None, target_date: str = None):
+        self.reads += 1
+        documents = [
+            d for d in self.documents
+            if symbol_to_find in (None, d['symbol']) and target_date in (None, d['date'])
+        ]
+        if not self.wrap_results:
+            return documents
+        results = app.Results()
+        results.ActionStatus = app.ActionStatus.SUCCESS
+        results.Results = documents
+        return results
+
+    def clean_table(self):
+        self.documents = []
+
+
+def document(symbol: str, date: str) -> dict:
+    return {'symbol': symbol, 'date': date, 'price': decimal.Decimal('10.25')}
+
+
+class TestCachingStore(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = MemoryStore([document('AAPL', '2020-02-11'), document('MSFT', '2020-02-11'),
+                                  document('AAPL', '2020-02-12')])
+        self.cache = CachingStore(self.store, max_entries=2, ttl=60, disk_path='', clock=self.clock)
+
+    def test_get_filtered_documents_RepeatedRead_ExpectServedFromMemory(self):
+        # ACT
+        first = self.cache.get_filtered_documents('AAPL')
+        second = self.cache.get_filtered_documents(symbol_to_find='AAPL')
+
+        # ASSERT
+        self.assertEqual(first, second)
+        self.assertEqual(self.store.reads, 1)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_get_filtered_documents_OverMaxEntries_ExpectLeastRecentlyUsedEvicted(self):
+        # ARRANGE
+        self.cache.get_filtered_documents('AAPL')
+        self.cache.get_filtered_documents('MSFT')
+        self.cache.get_filtered_documents('AAPL')
+
+        # ACT
+        self.cache.get_filtered_documents(target_date='2020-02-12')
+        self.cache.get_filtered_documents('AAPL')
+        self.cache.get_filtered_documents('MSFT')
+
+        # ASSERT
+        stats = self.cache.stats()
+        self.assertEqual(self.store.reads, 4, 'MSFT should be read again after eviction')
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['entries'], 2)
+
+    def test_get_filtered_documents_AfterTtl_ExpectReadFromStore(self):
+        # ARRANGE
+        self.cache.get_filtered_documents('AAPL')
+
+        # ACT
+        self.clock.now = 61
+        self.cache.get_filtered_documents('AAPL')
+
+        # ASSERT
+        self.assertEqual(self.store.reads, 2)
+        self.assertEqual(self.cache.stats()['expired'], 1)
+
+    def test_store_documents_WriteThrough_ExpectAffectedResultsInvalidated(self):
+        # ARRANGE
+        cache = CachingStore(self.store, max_entries=10, ttl=60, disk_path='', clock=self.clock)
+        cache.get_filtered_documents('AAPL')
+        cache.get_filtered_documents('MSFT')
+        cache.get_filtered_documents(target_date='2020-02-12')
+
+        # ACT
+        cache.store_documents([document('AAPL', '2020-02-13')])
+        aapl = cache.get_filtered_documents('AAPL')
+        cache.get_filtered_documents('MSFT')
+        cache.get_filtered_documents(target_date='2020-02-12')
+
+        # ASSERT
+        self.assertEqual(len(aapl), 3, 'written document should be read back')
+        self.assertEqual(self.store.reads, 4, 'only AAPL result should be read again')
+        self.assertEqual(cache.stats()['invalidated'], 1)
+
+    def test_get_filtered_documents_WriteBetweenReadAndCaching_ExpectStaleResultNotCached(self):
+        # ARRANGE
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CachingStore(self.store, max_entries=10, ttl=60, clock=self.clock,
+                                 disk_path=os.path.join(directory, 'results.sqlite'))
+            read = self.store.get_filtered_documents
+
+            def read_then_write(*args, **kwargs):
+                # another thread writes through the cache after the store answered
+                documents = read(*args, **kwargs)
+                cache.store_documents([document('AAPL', '2020-02-13')])
+                return documents
+
+            with mock.patch.object(self.store, 'get_filtered_documents', side_effect=read_then_write):
+                stale = cache.get_filtered_documents('AAPL')
+
+            # ACT
+            fresh = cache.get_filtered_documents('AAPL')
+            cache.close()
+
+        # ASSERT
+        self.assertEqual(len(stale), 2)
+        self.assertEqual(len(fresh), 3, 'result read before the write should not be cached')
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_init_EmptyDiskPath_ExpectNoDiskTierWhateverConfigSays(self):
+        # ARRANGE
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(app, 'STORE_CACHE_PATH', os.path.join(directory, 'results.sqlite')):
+            # ACT
+            without_disk = CachingStore(self.store, disk_path='')
+            with_disk = CachingStore(self.store)
+            with_disk.close()
+
+            # ASSERT
+            self.assertIsNone(without_disk._db)
+            self.assertEqual(with_disk.disk_path, app.STORE_CACHE_PATH)
+
+    def test_get_filtered_documents_DiskTier_ExpectResultsOutliveProcessWithDecimals(self):
+        # ARRANGE
+        store = MemoryStore(self.store.documents, wrap_results=True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            writer = CachingStore(store, disk_path=path, disk_ttl=3600, clock=self.clock)
+            writer.get_filtered_documents('AAPL', '2020-02-11')
+            writer.close()
+
+            # ACT
+            reader = CachingStore(store, disk_path=path, disk_ttl=3600, clock=self.clock)
+            get_it_back = reader.get_filtered_documents('AAPL', '2020-02-11')
+            reader.store_documents([document('AAPL', '2020-02-11')])
+            after_write = reader.get_filtered_documents('AAPL', '2020-02-11')
+            reader.close()
+
+        # ASSERT
+        self.assertIsInstance(get_it_back, app.Results)
+        self.assertEqual(get_it_back.Results, [document('AAPL', '2020-02-11')])
+        self.assertIsInstance(get_it_back.Results[0]['price'], decimal.Decimal)
+        self.assertEqual(len(after_write.Results), 2, 'disk result should be invalidated by write')
+        self.assertEqual(reader.stats()['disk_hits'], 1)
+        self.assertEqual(store.reads, 2)
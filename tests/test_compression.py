@@ -0,0 +1,44 @@
+import json
+from unittest import TestCase
+import app
+from persistence import compression
+
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        with open('tests/fixtures/companies_dump.json', mode='r') as companies_file:
+            self.companies = json.load(companies_file)
+
+    def test_compress_value_EveryCodec_ExpectValueBackAfterDecompression(self):
+        # ARRANGE
+        value = self.companies['AAL']
+
+        for codec_name in compression.CODECS:
+            with self.subTest(codec=codec_name):
+                # ACT
+                blob = compression.compress_value(value, codec_name)
+
+                # ASSERT
+                self.assertTrue(compression.is_compressed(blob))
+                self.assertEqual(compression.decompress_value(blob), value)
+
+    def test_compress_value_PassLargeDatapoint_ExpectSmallerBlob(self):
+        # ARRANGE
+        value = [self.companies['AAL']] * 10
+
+        # ACT
+        blob = compression.compress_value(value)
+
+        # ASSERT
+        self.assertLess(len(blob), len(json.dumps(value)) / 4)
+
+    def test_is_compressed_PassPlainBytes_ExpectFalse(self):
+        # ASSERT
+        self.assertFalse(compression.is_compressed(b'plain bytes'))
+        self.assertFalse(compression.is_compressed('\x1fIX text'))
+
+    def test_compress_value_PassUnknownCodec_ExpectAppException(self):
+        # ASSERT
+        with self.assertRaises(app.AppException):
+            compression.compress_value({}, 'snappy')
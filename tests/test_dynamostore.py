@@ -2,11 +2,13 @@ import decimal
 import json
 from unittest import TestCase
 from unittest.mock import patch
-from persistence.dynamostore import DynamoStore
+from persistence.dynamostore import DynamoStore, SHARD_KEY
 from boto3.dynamodb.conditions import Key
 from collections.abc import MutableMapping
 import boto3
 import app
+import datetime
+import time
 
 table_name = 'CompaniesIntegrationTesting'
 dynamo_db_client = boto3.client('dynamodb', endpoint_url=app.DYNAMO_URI)
@@ -64,6 +66,75 @@ class TestDynamoStore(TestCase):
         self.assertDictEqual(get_it_back, serialized_doc,
                              'Stored document not equal')
 
+    def test_store_documents_WithUnprocessedItems_ExpectOnlyThemResubmitted(self):
+        # ARRANGE
+        documents = [{'symbol': s, 'date': '2020-02-11'} for s in ('AA', 'AACG', 'AAMC')]
+        unprocessed = {'PutRequest': {'Item': documents[1]}}
+        responses = [
+            {'UnprocessedItems': {table_name: [unprocessed]}},
+            {'UnprocessedItems': {}}
+        ]
+
+        # ACT
+        with patch.object(dynamo_store.dynamo_resource, 'batch_write_item',
+                          side_effect=responses) as mock, \
+                patch.object(app, 'DYNAMO_BACKOFF_BASE', 0):
+            results = dynamo_store.store_documents(documents=documents)
+
+        # ASSERT
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(mock.call_args.kwargs['RequestItems'], {table_name: [unprocessed]})
+        self.assertEqual(results.values, [[]])
+
+    def test_store_documents_WithItemsNeverProcessed_ExpectThemReturnedAsFailed(self):
+        # ARRANGE
+        documents = [{'symbol': 'AA', 'date': '2020-02-11'}]
+        response = {'UnprocessedItems': {table_name: [{'PutRequest': {'Item': documents[0]}}]}}
+
+        # ACT
+        with patch.object(dynamo_store.dynamo_resource, 'batch_write_item',
+                          return_value=response) as mock, \
+                patch.object(app, 'DYNAMO_BACKOFF_BASE', 0):
+            results = dynamo_store.store_documents(documents=documents)
+
+        # ASSERT
+        self.assertEqual(mock.call_count, app.DYNAMO_WRITE_TRIES)
+        self.assertEqual(results.values, [documents])
+
+    def test_store_documents_PassOversizedDocument_ExpectItReturnedAndOthersStored(self):
+        # ARRANGE
+        documents = [
+            {'symbol': 'AA', 'date': '2020-02-11'},
+            {'symbol': 'AAL', 'date': '2020-02-11', 'financials': 'x' * 500 * 1024},
+            {'symbol': 'AAMC', 'date': '2020-02-11'}
+        ]
+
+        # ACT
+        results = dynamo_store.store_documents(documents=documents)
+
+        # ASSERT
+        self.assertEqual([doc for batch in results.values for doc in batch], [documents[1]])
+        self.assertTrue(self.item_exists('AA', '2020-02-11'))
+        self.assertTrue(self.item_exists('AAMC', '2020-02-11'))
+        self.assertFalse(self.item_exists('AAL', '2020-02-11'))
+
+    def test_store_documents_WithCompressedAttributes_ExpectBinaryStoredAndDocumentReadBack(self):
+        # ARRANGE
+        store = DynamoStore(table_name=table_name, compress=['financials', 'company'], compress_threshold=64)
+        document = {
+            'symbol': 'AA', 'date': '2020-02-11', 'company': {'name': 'Alcoa'},
+            'financials': [{'revenue': 1.5, 'cash': 10} for _ in range(20)]
+        }
+
+        # ACT
+        store.store_documents(documents=[document])
+
+        # ASSERT
+        item = dynamo_db_table.get_item(Key={'symbol': 'AA', 'date': '2020-02-11'})['Item']
+        self.assertIsInstance(item['financials'], boto3.dynamodb.types.Binary)
+        self.assertEqual(item['company'], {'name': 'Alcoa'})
+        self.assertEqual(dynamo_store.get_filtered_documents('AA', datetime.date(2020, 2, 11)), [document])
+
     def test_clean_table_PassListWithOneExistingSymbol_ExpectSymbolDeletedFromDB(self):
         # ARRANGE:
         self.load_companies('tests/fixtures/companies_dump.json')
@@ -99,6 +170,74 @@ class TestDynamoStore(TestCase):
         for symbol_to_be_deleted in symbols_to_be_deleted:
             self.assertFalse(self.item_exists(symbol_to_be_deleted, date), f'Item {symbol_to_be_deleted} should be deleted')
 
+    def test_clean_table_PassDateRange_ExpectOnlyDatesInRangeDeleted(self):
+        # ARRANGE
+        self.load_companies_on_dates(['2020-02-10', '2020-02-11', '2020-02-12', '2020-02-13'])
+
+        # ACT
+        deleted = dynamo_store.clean_table(start_date=datetime.date(2020, 2, 11), end_date='2020-02-12')
+
+        # ASSERT
+        dates = {item['date'] for item in dynamo_db_table.scan()['Items']}
+        self.assertEqual(dates, {'2020-02-10', '2020-02-13'})
+        self.assertEqual(deleted, 2 * len(self.read_fixture('tests/fixtures/companies_dump.json')))
+
+    def test_clean_table_PassSymbolsAndOpenDateRange_ExpectSymbolsDeletedFromStartDate(self):
+        # ARRANGE
+        self.load_companies_on_dates(['2020-02-10', '2020-02-11', '2020-02-12'])
+
+        # ACT
+        dynamo_store.clean_table(symbols_to_remove=['AA', 'AAL'], start_date='2020-02-11')
+
+        # ASSERT
+        remaining = {(item['symbol'], item['date']) for item in dynamo_db_table.scan()['Items']}
+        self.assertIn(('AA', '2020-02-10'), remaining)
+        self.assertNotIn(('AA', '2020-02-11'), remaining)
+        self.assertNotIn(('AAL', '2020-02-12'), remaining)
+        self.assertIn(('A', '2020-02-12'), remaining)
+
+    def test_clean_table_PassEndDateOnly_ExpectOlderDatesDeleted(self):
+        # ARRANGE
+        self.load_companies_on_dates(['2020-02-10', '2020-02-11', '2020-02-12'])
+
+        # ACT
+        dynamo_store.clean_table(end_date='2020-02-11')
+
+        # ASSERT
+        dates = {item['date'] for item in dynamo_db_table.scan()['Items']}
+        self.assertEqual(dates, {'2020-02-12'})
+
+    def test_clean_table_PassNothing_ExpectAppExceptionAndTableKept(self):
+        # ACT
+        with patch.object(dynamo_store.table, 'delete') as mock, \
+                self.assertRaises(app.AppException):
+            dynamo_store.clean_table()
+
+        # ASSERT
+        mock.assert_not_called()
+
+    def test_store_documents_WithTtlDays_ExpectItemsStampedWithExpiry(self):
+        # ARRANGE
+        store = DynamoStore(table_name=table_name, ttl_days=2)
+        document = {'symbol': 'AA', 'date': '2020-02-11'}
+
+        # ACT
+        store.store_documents(documents=[document])
+
+        # ASSERT
+        item = dynamo_db_table.get_item(Key=document)['Item']
+        self.assertAlmostEqual(int(item['expires_at']), time.time() + 2 * 24 * 3600, delta=60)
+        self.assertEqual(store.get_filtered_documents('AA', datetime.date(2020, 2, 11)), [document])
+
+    def test_enable_ttl_ExpectTtlEnabledOnExpiryAttribute(self):
+        # ACT
+        dynamo_store.enable_ttl()
+
+        # ASSERT
+        ttl = dynamo_db_client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+        self.assertIn(ttl['TimeToLiveStatus'], ('ENABLING', 'ENABLED'))
+        self.assertEqual(ttl['AttributeName'], 'expires_at')
+
     def test_clean_table_PassEmptyListOfSymbols_ExpectTableDeleteMethodCalled(self):
         # ARRANGE:
         self.load_companies('tests/fixtures/companies_dump.json')
@@ -110,6 +249,136 @@ class TestDynamoStore(TestCase):
         # ASSERT
         mock.assert_called()
 
+    def test_get_filtered_documents_PassDateWithManyPages_ExpectAllPagesRead(self):
+        # ARRANGE
+        self.load_companies('tests/fixtures/companies_dump.json')
+        query = dynamo_db_table.query
+
+        # ACT
+        with patch.object(dynamo_store.table, 'query',
+                          side_effect=lambda **kwargs: query(Limit=2, **kwargs)) as mock:
+            documents = dynamo_store.get_filtered_documents(target_date=datetime.date(2020, 2, 11))
+
+        # ASSERT
+        self.assertEqual(len(documents), self.get_number_of_items_in_table())
+        self.assertGreater(mock.call_count, 1)
+
+    def test_iter_filtered_documents_PassNothing_ExpectWholeTableScannedInSegments(self):
+        # ARRANGE
+        self.load_companies('tests/fixtures/companies_dump.json')
+        scan = dynamo_db_table.scan
+
+        # ACT
+        with patch.object(dynamo_store.table, 'scan',
+                          side_effect=lambda **kwargs: scan(Limit=1, **kwargs)) as mock:
+            documents = list(dynamo_store.iter_filtered_documents())
+
+        # ASSERT
+        self.assertEqual(sorted(d['symbol'] for d in documents),
+                         sorted(self.read_fixture('tests/fixtures/companies_dump.json')))
+        segments = {call.kwargs['Segment'] for call in mock.call_args_list}
+        self.assertEqual(segments, set(range(app.DYNAMO_SCAN_SEGMENTS)))
+
+    def test_iter_filtered_documents_StopEarly_ExpectNoReadersLeftBlocked(self):
+        # ARRANGE
+        self.load_companies('tests/fixtures/companies_dump.json')
+        scan = dynamo_db_table.scan
+
+        # ACT
+        with patch.object(dynamo_store.table, 'scan',
+                          side_effect=lambda **kwargs: scan(Limit=1, **kwargs)):
+            documents = dynamo_store.iter_filtered_documents()
+            first = next(documents)
+            documents.close()
+        pool = app.get_executor('reads').pool
+        for _ in range(50):
+            if not pool.stats()['active']:
+                break
+            time.sleep(0.1)
+
+        # ASSERT
+        self.assertIn('symbol', first)
+        self.assertEqual(pool.stats()['active'], 0)
+
+    def test_batch_get_documents_PassKeysAndDatapoints_ExpectOnlyProjectedAttributes(self):
+        # ARRANGE
+        self.load_companies('tests/fixtures/companies_dump.json')
+        keys = [('2020-02-11', 'AAL'), (datetime.date(2020, 2, 11), 'AA'), ('2020-02-11', 'NONE')]
+
+        # ACT
+        documents = dynamo_store.batch_get_documents(keys, datapoints=['company'])
+
+        # ASSERT
+        self.assertEqual(sorted(d['symbol'] for d in documents), ['AA', 'AAL'])
+        for document in documents:
+            self.assertEqual(set(document), {'date', 'symbol', 'company'})
+
+    def test_batch_get_documents_PassMoreThanHundredKeys_ExpectChunksOfHundred(self):
+        # ARRANGE
+        keys = [('2020-02-11', f'S{i}') for i in range(250)]
+
+        # ACT
+        with patch.object(dynamo_store.dynamo_resource, 'batch_get_item',
+                          return_value={'Responses': {table_name: []}}) as mock:
+            dynamo_store.batch_get_documents(keys)
+
+        # ASSERT
+        sizes = sorted(len(call.kwargs['RequestItems'][table_name]['Keys'])
+                       for call in mock.call_args_list)
+        self.assertEqual(sizes, [50, 100, 100])
+
+    def test_batch_get_documents_WithUnprocessedKeys_ExpectOnlyThemRequestedAgain(self):
+        # ARRANGE
+        unprocessed = {'Keys': [{'date': '2020-02-11', 'symbol': 'AA'}]}
+        responses = [
+            {'Responses': {table_name: [{'date': '2020-02-11', 'symbol': 'AAL'}]},
+             'UnprocessedKeys': {table_name: unprocessed}},
+            {'Responses': {table_name: [{'date': '2020-02-11', 'symbol': 'AA'}]},
+             'UnprocessedKeys': {}}
+        ]
+
+        # ACT
+        with patch.object(dynamo_store.dynamo_resource, 'batch_get_item',
+                          side_effect=responses) as mock, \
+                patch.object(app, 'DYNAMO_BACKOFF_BASE', 0):
+            documents = dynamo_store.batch_get_documents([('2020-02-11', 'AAL'), ('2020-02-11', 'AA')])
+
+        # ASSERT
+        self.assertEqual(mock.call_args.kwargs['RequestItems'], {table_name: unprocessed})
+        self.assertEqual(sorted(d['symbol'] for d in documents), ['AA', 'AAL'])
+
+    def test_get_time_series_PassSymbolsAndDateRange_ExpectDocumentsInDateOrder(self):
+        # ARRANGE
+        companies = self.read_fixture('tests/fixtures/companies_dump.json')
+        dates = ['2020-03-02', '2020-02-28', '2020-03-01', '2020-02-27', '2020-03-03']
+        for date in dates:
+            for symbol in ('AA', 'AAL'):
+                dynamo_db_table.put_item(Item={**companies[symbol], 'date': date})
+
+        # ACT
+        series = dynamo_store.get_time_series(
+            ['AAL', 'AA', 'NONE'], start=datetime.date(2020, 2, 28), end='2020-03-02')
+
+        # ASSERT
+        self.assertEqual(list(series), ['AAL', 'AA', 'NONE'])
+        for symbol in ('AA', 'AAL'):
+            self.assertEqual([d['date'] for d in series[symbol]],
+                             ['2020-02-28', '2020-03-01', '2020-03-02'])
+            self.assertTrue(all(d['symbol'] == symbol for d in series[symbol]))
+        self.assertEqual(series['NONE'], [])
+
+    def test_get_filtered_documents_PassSymbol_ExpectAllDatesFromReverseIndex(self):
+        # ARRANGE
+        companies = self.read_fixture('tests/fixtures/companies_dump.json')
+        for date in ('2020-02-11', '2020-02-12'):
+            dynamo_db_table.put_item(Item={**companies['AAL'], 'date': date})
+
+        # ACT
+        documents = dynamo_store.get_filtered_documents(symbol_to_find='AAL')
+
+        # ASSERT
+        self.assertEqual([d['date'] for d in documents], ['2020-02-11', '2020-02-12'])
+
     def test_remove_empty_strings_PassReferenceDictWithEmptyValue_ExpectReferenceDictWithoutEmptyValues(self):
         # ARRANGE
         src_dict = self.read_fixture('tests/fixtures/ref_dict_toclean.json')
@@ -141,6 +410,13 @@ class TestDynamoStore(TestCase):
         for company in companies.values():
             dynamo_db_table.put_item(Item=company)
 
+    def load_companies_on_dates(self, dates: list):
+        companies = self.read_fixture('tests/fixtures/companies_dump.json')
+        with dynamo_db_table.batch_writer() as batch:
+            for date in dates:
+                for company in companies.values():
+                    batch.put_item(Item={**company, 'date': date})
+
     def get_number_of_items_in_table(self):
         return len(dynamo_db_table.scan()['Items'])
 
@@ -166,3 +442,89 @@ class TestDynamoStore(TestCase):
                     return self.has_empty_value_in_list(value)
             else:
                 return True
+
+
+class TestShardedDynamoStore(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = DynamoStore(table_name=f'{table_name}Sharded', shards=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.table.delete()
+
+    def setUp(self):
+        with open('tests/fixtures/companies_dump.json', mode='r') as companies_file:
+            self.companies = json.load(companies_file)
+
+    def tearDown(self) -> None:
+        with self.store.table.batch_writer() as batch:
+            for item in self.store.table.scan()['Items']:
+                batch.delete_item(Key={SHARD_KEY: item[SHARD_KEY], 'symbol': item['symbol']})
+
+    def test_store_documents_PassValidDocs_ExpectDateSpreadOverShards(self):
+        # ACT
+        self.store.store_documents(documents=list(self.companies.values()))
+
+        # ASSERT
+        shards = {item[SHARD_KEY] for item in self.store.table.scan()['Items']}
+        self.assertGreater(len(shards), 1)
+        self.assertTrue(all(shard.startswith('2020-02-11#') for shard in shards))
+
+    def test_get_filtered_documents_PassDate_ExpectDocumentsOfAllShards(self):
+        # ARRANGE
+        self.store.store_documents(documents=list(self.companies.values()))
+
+        # ACT
+        documents = self.store.get_filtered_documents(target_date=datetime.date(2020, 2, 11))
+
+        # ASSERT
+        self.assertDictEqual({d['symbol']: d for d in documents}, self.companies)
+
+    def test_get_filtered_documents_PassSymbolAndDate_ExpectOneDocument(self):
+        # ARRANGE
+        self.store.store_documents(documents=list(self.companies.values()))
+
+        # ACT
+        documents = self.store.get_filtered_documents(
+            symbol_to_find='AAL', target_date=datetime.date(2020, 2, 11))
+
+        # ASSERT
+        self.assertEqual(documents, [self.companies['AAL']])
+
+    def test_get_filtered_documents_PassSymbol_ExpectItFoundThroughReverseIndex(self):
+        # ARRANGE
+        self.store.store_documents(documents=list(self.companies.values()))
+
+        # ACT
+        documents = self.store.get_filtered_documents(symbol_to_find='AAL')
+
+        # ASSERT
+        self.assertEqual(documents, [self.companies['AAL']])
+
+    def test_clean_table_PassDateRange_ExpectEveryShardOfDatesCleaned(self):
+        # ARRANGE
+        for date in ('2020-02-11', '2020-02-12'):
+            self.store.store_documents(documents=[{**c, 'date': date} for c in self.companies.values()])
+
+        # ACT
+        self.store.clean_table(start_date='2020-02-12', end_date='2020-02-12')
+
+        # ASSERT
+        dates = {item['date'] for item in self.store.table.scan()['Items']}
+        self.assertEqual(dates, {'2020-02-11'})
+
+    def test_migrate_from_PassUnshardedTable_ExpectAllDocumentsCopied(self):
+        # ARRANGE
+        unsharded = DynamoStore(table_name=f'{table_name}Unsharded', shards=0)
+        self.addCleanup(unsharded.table.delete)
+        unsharded.store_documents(documents=list(self.companies.values()))
+
+        # ACT
+        copied = self.store.migrate_from(unsharded.table_name)
+
+        # ASSERT
+        self.assertEqual(copied, len(self.companies))
+        documents = self.store.get_filtered_documents(target_date=datetime.date(2020, 2, 11))
+        self.assertDictEqual({d['symbol']: d for d in documents}, self.companies)
@@ -0,0 +1,105 @@
+from unittest import TestCase, mock
+from persistence.governor import WriteGovernor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def put_requests(count: int, size: int):
+    return [{'PutRequest': {'Item': {'symbol': f'S{i}', 'blob': 'x' * size}}} for i in range(count)]
+
+
+def consumed_capacity(table: float, index: float):
+    return [{
+        'TableName': 'Companies',
+        'CapacityUnits': table + index,
+        'Table': {'CapacityUnits': table},
+        'GlobalSecondaryIndexes': {'Reverse_index': {'CapacityUnits': index}}
+    }]
+
+
+class TestWriteGovernor(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.governor = WriteGovernor(
+            table_wcu=10, index_wcu={'Reverse_index': 10}, utilization=1.0, clock=self.clock)
+
+    def test_estimate_PassItemsOfFewKilobytes_ExpectUnitPerStartedKilobyte(self):
+        # ACT
+        estimate = WriteGovernor.estimate(put_requests(count=3, size=2500))
+
+        # ASSERT
+        self.assertEqual(estimate, 9)
+
+    def test_acquire_OverBudget_ExpectWaitForCapacity(self):
+        # ARRANGE
+        self.governor.acquire(put_requests(count=10, size=10))
+
+        # ACT
+        with mock.patch('persistence.governor.time.sleep') as sleep:
+            self.governor.acquire(put_requests(count=5, size=10))
+
+        # ASSERT
+        sleep.assert_called_once_with(0.5)
+
+    def test_reconcile_CheaperThanEstimated_ExpectCapacityGivenBack(self):
+        # ARRANGE
+        estimate = self.governor.acquire(put_requests(count=10, size=10))
+        self.governor.reconcile(estimate, consumed_capacity(table=5, index=5))
+
+        # ACT
+        with mock.patch('persistence.governor.time.sleep') as sleep:
+            self.governor.acquire(put_requests(count=5, size=10))
+
+        # ASSERT
+        sleep.assert_not_called()
+
+    def test_stats_AfterWrites_ExpectAchievedWcuPerSecondPerBudget(self):
+        # ARRANGE
+        for _ in range(4):
+            estimate = self.governor.acquire(put_requests(count=1, size=10))
+            self.clock.now += 1
+            self.governor.reconcile(estimate, consumed_capacity(table=8, index=4))
+
+        # ACT
+        stats = self.governor.stats()
+
+        # ASSERT
+        self.assertEqual(stats['table']['consumed_wcu'], 32)
+        self.assertEqual(stats['table']['wcu_per_second'], 8)
+        self.assertEqual(stats['Reverse_index']['wcu_per_second'], 4)
+
+    def test_from_table_PassProvisionedTable_ExpectTableAndIndexBudgets(self):
+        # ARRANGE
+        client = mock.Mock()
+        client.describe_table.return_value = {'Table': {
+            'ProvisionedThroughput': {'WriteCapacityUnits': 100},
+            'GlobalSecondaryIndexes': [{
+                'IndexName': 'Reverse_index',
+                'ProvisionedThroughput': {'WriteCapacityUnits': 50}
+            }]
+        }}
+
+        # ACT
+        governor = WriteGovernor.from_table(client, 'Companies')
+
+        # ASSERT
+        self.assertEqual(governor.budgets, {'table': 100, 'Reverse_index': 50})
+
+    def test_from_table_PassOnDemandTable_ExpectNoGovernor(self):
+        # ARRANGE
+        client = mock.Mock()
+        client.describe_table.return_value = {'Table': {
+            'ProvisionedThroughput': {'WriteCapacityUnits': 0}}}
+
+        # ACT
+        governor = WriteGovernor.from_table(client, 'Companies')
+
+        # ASSERT
+        self.assertIsNone(governor)
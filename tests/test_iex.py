@@ -1,7 +1,12 @@
 from unittest import TestCase, mock
 from datawell.iex import Iex
+from datawell.cache import DatapointCache
+from datawell.fakeiex import DATAPOINTS, FakeIex
+from datawell.recorder import Recorder
+from app.ratelimit import RateLimiter
 import app
 import json
+import tempfile
 
 
 class MockIEX:
@@ -28,3 +33,155 @@ class TestIEX(TestCase):
 
         # ASSERT
         self.assertDictEqual(companies, self.IexTest.Symbols)
+
+
+class TestIEXRetrieval(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fake_iex = FakeIex().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake_iex.stop()
+
+    def setUp(self):
+        patcher = mock.patch.object(app, 'BASE_API_URL', self.fake_iex.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_symbols_batch_PassFixtureSymbols_ExpectDatapointsPopulated(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+
+        # ACT
+        datasource = Iex(symbols=self.fake_iex.ref_data_dict(), async_retrieval=False)
+
+        # ASSERT
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_get_symbols_batch_async_PassFixtureSymbols_ExpectSameAsThreadPath(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+
+        # ACT
+        datasource = Iex(symbols=self.fake_iex.ref_data_dict(), async_retrieval=True)
+
+        # ASSERT
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_get_symbols_batch_async_WithoutAiohttp_ExpectSameAsThreadPath(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+
+        # ACT
+        with mock.patch('datawell.iex.aiohttp', None):
+            datasource = Iex(symbols=self.fake_iex.ref_data_dict(), async_retrieval=True)
+
+        # ASSERT
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_iter_symbols_batch_PassFixtureSymbols_ExpectDocumentsStreamedAndSymbolsUntouched(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+        symbols = self.fake_iex.ref_data_dict()
+        datasource = Iex(symbols=symbols, fetch=False)
+
+        # ACT
+        streamed = [doc for batch in datasource.iter_symbols_batch() for doc in batch]
+
+        # ASSERT
+        self.assertDictEqual({doc['symbol']: doc for doc in streamed}, expected)
+        self.assertDictEqual(datasource.Symbols, self.fake_iex.ref_data_dict())
+
+    def test_get_symbols_batch_WithWarmCache_ExpectOnlyExpiredDatapointsRequested(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+        cache = DatapointCache(':memory:', ttls={'company': 3600, 'financials': 3600})
+        Iex(symbols=self.fake_iex.ref_data_dict(), cache=cache)
+        self.fake_iex.batch_requests.clear()
+
+        # ACT
+        datasource = Iex(symbols=self.fake_iex.ref_data_dict(), cache=cache)
+
+        # ASSERT
+        requested_types = {t for _, types in self.fake_iex.batch_requests for t in types}
+        self.assertEqual(
+            requested_types, {'advanced-stats', 'cash-flow', 'book', 'dividends'})
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_iter_symbols_batch_WithWarmCache_ExpectCachedDatapointsInDocuments(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+        cache = DatapointCache(':memory:', ttls={d: 3600 for d in DATAPOINTS})
+        Iex(symbols=self.fake_iex.ref_data_dict(), cache=cache)
+        self.fake_iex.batch_requests.clear()
+        datasource = Iex(symbols=self.fake_iex.ref_data_dict(), fetch=False, cache=cache)
+
+        # ACT
+        streamed = [doc for batch in datasource.iter_symbols_batch() for doc in batch]
+
+        # ASSERT
+        self.assertEqual(self.fake_iex.batch_requests, [])
+        self.assertDictEqual({doc['symbol']: doc for doc in streamed}, expected)
+
+    def test_get_symbols_batch_RecordThenReplay_ExpectSameDocumentsOffline(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+        records = tempfile.TemporaryDirectory()
+        self.addCleanup(records.cleanup)
+        Iex(symbols=self.fake_iex.ref_data_dict(), recorder=Recorder(records.name))
+
+        # ACT
+        with FakeIex(fixture=None, replay_dir=records.name) as replay, \
+                mock.patch.object(app, 'BASE_API_URL', replay.url):
+            datasource = Iex(symbols=self.fake_iex.ref_data_dict())
+
+        # ASSERT
+        self.assertGreater(replay.replayed_count, 0)
+        self.assertEqual(replay.replayed_count, replay.requests_count)
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_get_symbols_batch_WithInjectedFaults_ExpectRetriedToSameDocuments(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+        limiter = RateLimiter(rate=1000, burst=100)
+
+        # ACT
+        with FakeIex(throttle_rate=0.3, error_rate=0.2, seed=7) as faulty, \
+                mock.patch.object(app, 'BASE_API_URL', faulty.url), \
+                mock.patch('datawell.iex.RATE_LIMITER', limiter):
+            datasource = Iex(symbols=faulty.ref_data_dict(), async_retrieval=True)
+
+        # ASSERT
+        self.assertGreater(faulty.faults_count, 0)
+        self.assertGreater(limiter.stats()['throttled'], 0)
+        self.assertDictEqual(datasource.Symbols, expected)
+
+    def test_get_symbols_batch_WithServerErrors_ExpectRequestRateDropsAndRetriesBackOff(self):
+        # ARRANGE
+        expected = self.read_cleaned_fixture()
+
+        for async_retrieval in (False, True):
+            with self.subTest(async_retrieval=async_retrieval):
+                limiter = RateLimiter(rate=1000, burst=100)
+
+                # ACT
+                with FakeIex(error_rate=0.3, seed=3) as faulty, \
+                        mock.patch.object(app, 'BASE_API_URL', faulty.url), \
+                        mock.patch.object(app, 'IEX_BACKOFF_BASE', 0.01), \
+                        mock.patch('datawell.iex.RATE_LIMITER', limiter), \
+                        mock.patch.object(app, 'backoff_delay', wraps=app.backoff_delay) as backoff:
+                    datasource = Iex(symbols=faulty.ref_data_dict(), async_retrieval=async_retrieval)
+
+                # ASSERT
+                self.assertGreater(faulty.faults_count, 0)
+                self.assertGreater(limiter.stats()['throttled'], 0)
+                self.assertLess(limiter.stats()['rate'], 1000, 'server errors should slow requests down')
+                self.assertEqual(backoff.call_count, faulty.faults_count,
+                                 'every server error should back off before retry')
+                self.assertDictEqual(datasource.Symbols, expected)
+
+    def read_cleaned_fixture(self):
+        with open('tests/fixtures/companies_dump.json', mode='r') as companies_file:
+            companies = json.load(companies_file)
+        return {k: app.remove_empty_strings(v) for k, v in companies.items()}
@@ -0,0 +1,77 @@
+import json
+from decimal import Decimal
+from unittest import TestCase
+from persistence import itemsize
+
+
+class TestItemSize(TestCase):
+
+    def test_item_size_PassScalars_ExpectDynamoDBSizingRules(self):
+        # ARRANGE
+        item = {'symbol': 'AAL', 'price': Decimal('12.50'), 'volume': 1000, 'active': True, 'note': None}
+
+        # ACT
+        size = itemsize.item_size(item)
+
+        # ASSERT
+        # names 6+5+6+6+4, 'AAL' 3, 12.5 -> 3 digits 3, 1000 -> 1 digit 2, bool 1, null 1
+        self.assertEqual(size, 27 + 3 + 3 + 2 + 1 + 1)
+
+    def test_item_size_PassNestedMapsAndLists_ExpectOverheadPerContainerAndElement(self):
+        # ARRANGE
+        item = {'m': {'ab': 'xy', 'l': [1, 'z']}}
+
+        # ACT
+        size = itemsize.item_size(item)
+
+        # ASSERT
+        # 'm' 1 + map 3 + ('ab' 1+2+2) + ('l' 1+1 + list 3 + (1+2) + (1+1))
+        self.assertEqual(size, 1 + 3 + 5 + 2 + 3 + 3 + 2)
+
+    def test_item_size_PassFloatAndDecimal_ExpectSameSize(self):
+        # ASSERT
+        self.assertEqual(itemsize.value_size(0.125), itemsize.value_size(Decimal('0.125')))
+
+    def test_pack_PassSmallItems_ExpectBatchesOfMaxItems(self):
+        # ARRANGE
+        items = [{'symbol': f'S{i}'} for i in range(60)]
+
+        # ACT
+        batches = list(itemsize.pack(items))
+
+        # ASSERT
+        self.assertEqual([len(b) for b in batches], [25, 25, 10])
+
+    def test_pack_PassItemsOverByteLimit_ExpectBatchesFilledUpToBytes(self):
+        # ARRANGE
+        items = [{'blob': 'x' * 96} for _ in range(10)]
+
+        # ACT
+        batches = list(itemsize.pack(items, max_bytes=350))
+
+        # ASSERT
+        self.assertEqual([len(b) for b in batches], [3, 3, 3, 1])
+        self.assertEqual([i for b in batches for i in b], items)
+
+    def test_pack_PassOversizedItem_ExpectItAloneInItsBatch(self):
+        # ARRANGE
+        items = [{'n': 1}, {'blob': 'x' * 500}, {'n': 2}]
+
+        # ACT
+        batches = list(itemsize.pack(items, max_item_bytes=400))
+
+        # ASSERT
+        self.assertEqual(batches, [[items[1]], [items[0], items[2]]])
+
+    def test_item_size_PassFixtures_ExpectCloseToSerializedSize(self):
+        # ARRANGE
+        with open('tests/fixtures/companies_dump.json', mode='r') as companies_file:
+            companies = json.load(companies_file)
+
+        # ACT
+        for symbol, company in companies.items():
+            with self.subTest(symbol=symbol):
+                serialized = len(json.dumps(company, separators=(',', ':')))
+
+                # ASSERT
+                self.assertLess(itemsize.item_size(company), serialized * 1.1)
@@ -1,7 +1,9 @@
 import decimal
 import json
+import os
 from unittest import TestCase
 from unittest.mock import patch
+from persistence import serialization
 from persistence.s3store import S3Store
 from botocore.exceptions import ClientError
 from collections.abc import MutableMapping
@@ -116,12 +118,136 @@ class TestS3Store(TestCase):
         self.assertEqual(len(get_it_back.Results), 0,
                 "function should return empty results")
 
+    def test_get_documents_SymbolAndDate_ExpectDirectGetWithoutListing(self):
+        # ARRANGE
+        serialized_doc = app.remove_empty_strings(self.read_fixture('tests/fixtures/AEB.response.json'))
+        s3store.store_documents(documents=[serialized_doc])
+
+        # ACT:
+        with patch.object(s3store.s3_client, 'list_objects_v2') as list_objects:
+            get_it_back = s3store.get_filtered_documents('AEB', '2020-02-11')
+            nothing_back = s3store.get_filtered_documents('AE', '2020-02-11')
+
+        # ASSERT:
+        list_objects.assert_not_called()
+        self.assertDictEqual(get_it_back.Results[0], serialized_doc, 'Stored document not equal')
+        self.assertEqual(len(nothing_back.Results), 0, 'function should return empty results')
+
+    def test_store_documents_BinarySerializer_ExpectHeaderAndReadBackAlongPickles(self):
+        # ARRANGE
+        binary_store = S3Store(bucket_name, serializer='binary+zlib')
+        aeb, aame = (app.remove_empty_strings(self.read_fixture(f'tests/fixtures/{symbol}.response.json'))
+                     for symbol in ('AEB', 'AAME'))
+        s3store.store_documents(documents=[aame])
+
+        # ACT:
+        binary_store.store_documents(documents=[aeb])
+        raw = s3_resource.Object(bucket_name, '2020-02-11/AEB').get()['Body'].read()
+        get_it_back = binary_store.get_filtered_documents(target_date='2020-02-11')
+
+        # ASSERT:
+        self.assertTrue(raw.startswith(serialization.MAGIC), 'document should have serialization header')
+        self.assertCountEqual(get_it_back.Results, [aeb, aame], 'both objects should be read back')
+
+    def test_iter_documents_DateOnly_ExpectEveryDocumentOfDateStreamed(self):
+        # ARRANGE
+        documents = [
+            {**app.remove_empty_strings(self.read_fixture('tests/fixtures/AEB.response.json')),
+             'symbol': f'S{i}'}
+            for i in range(40)
+        ]
+        s3store.store_documents(documents=documents)
+        s3_resource.Object(bucket_name, '2020-02-12/S0').put(Body=dumps(documents[0]))
+
+        # ACT:
+        streamed = s3store.iter_filtered_documents(target_date='2020-02-11')
+        first = next(streamed)
+        get_it_back = [first, *streamed]
+
+        # ASSERT:
+        self.assertIn(first, documents)
+        self.assertCountEqual([d['symbol'] for d in get_it_back], [d['symbol'] for d in documents],
+                              'every document of the date should be read once')
+
+    def test_get_documents_SnapshotLayoutSymbolAndDate_ExpectReadWithRangedGet(self):
+        # ARRANGE
+        store = S3Store(bucket_name, layout='snapshot')
+        documents = [self.read_fixture(f'tests/fixtures/{symbol}.response.json', parse_float=float)
+                     for symbol in ('AEB', 'AAME')]
+
+        # ACT:
+        with patch.object(store.s3_client, 'get_object', wraps=store.s3_client.get_object) as get_object:
+            store.store_documents(documents)
+            get_it_back = store.get_filtered_documents('AAME', '2020-02-11')
+
+        # ASSERT:
+        self.assertEqual(len(get_it_back.Results), 1, 'function should return the symbol only')
+        self.assertDictEqual(get_it_back.Results[0], documents[1], 'Stored document not equal')
+        self.assertTrue(
+            any(c.kwargs['Key'].endswith('.jsonl.gz') and c.kwargs['Range'].startswith('bytes=')
+                for c in get_object.call_args_list if 'Range' in c.kwargs),
+            'document should be read with ranged GET')
+
+    def test_get_documents_SnapshotLayoutDateOnly_ExpectAllDocumentsOfDate(self):
+        # ARRANGE
+        store = S3Store(bucket_name, layout='snapshot')
+        documents = [self.read_fixture(f'tests/fixtures/{symbol}.response.json', parse_float=float)
+                     for symbol in ('AEB', 'AAME')]
+        store.store_documents(documents[:1])
+        store.store_documents(documents[1:])
+
+        # ACT:
+        get_it_back = store.get_filtered_documents(target_date='2020-02-11')
+        nothing_back = store.get_filtered_documents('A', '2020-02-11')
+
+        # ASSERT:
+        self.assertCountEqual(get_it_back.Results, documents, 'all parts of the date should be read')
+        self.assertEqual(len(nothing_back.Results), 0, 'function should return empty results')
+
+    def test_get_documents_SnapshotLayoutDateStoredTwice_ExpectLatestCopyOnce(self):
+        # ARRANGE
+        store = S3Store(bucket_name, layout='snapshot')
+        aeb, aame = (self.read_fixture(f'tests/fixtures/{symbol}.response.json', parse_float=float)
+                     for symbol in ('AEB', 'AAME'))
+        store.store_documents([aeb, aame, {**aame, 'rerun': 0}])
+        # re-run of the same day
+        store.store_documents([{**aeb, 'rerun': 1}])
+
+        # ACT:
+        symbol_back = store.get_filtered_documents('AEB', '2020-02-11')
+        day_back = store.get_filtered_documents(target_date='2020-02-11')
+
+        # ASSERT:
+        self.assertEqual(symbol_back.Results, [{**aeb, 'rerun': 1}], 'latest part should win')
+        self.assertCountEqual(day_back.Results, [{**aeb, 'rerun': 1}, {**aame, 'rerun': 0}],
+                              'every symbol should be read once, latest copy of it')
+
+    def test_snapshot_writer_DocumentsOverPartSize_ExpectMultipartUploadReadBack(self):
+        # ARRANGE
+        store = S3Store(bucket_name, layout='snapshot')
+        document = app.remove_empty_strings(
+            self.read_fixture('tests/fixtures/AEB.response.json', parse_float=float))
+        documents = [{**document, 'symbol': f'S{i}', 'noise': os.urandom(512 * 1024).hex()}
+                     for i in range(24)]
+
+        # ACT:
+        with patch.object(store.s3_client, 'upload_part', wraps=store.s3_client.upload_part) as upload_part:
+            with store.snapshot_writer('2020-02-11', parts_in_flight=2) as writer:
+                for d in documents:
+                    writer.write(d)
+        get_it_back = store.get_filtered_documents('S7', '2020-02-11')
+
+        # ASSERT:
+        self.assertGreater(upload_part.call_count, 1, 'part should be uploaded in several parts')
+        self.assertEqual(writer.bytes_uploaded, writer.bytes_written, 'every byte should be uploaded')
+        self.assertDictEqual(get_it_back.Results[0], documents[7], 'Stored document not equal')
+
     def item_exists(self, date: str, symbol: str):
         try:
             return loads(s3_resource.Object(bucket_name, f'{date}/{symbol}').get().read())
         except s3_resource.meta.client.exceptions.NoSuchKey:
             return False
 
-    def read_fixture(self, file: str):
+    def read_fixture(self, file: str, parse_float=decimal.Decimal):
         with open(file, mode='r') as companies_file:
-            return json.load(companies_file, parse_float=decimal.Decimal)
+            return json.load(companies_file, parse_float=parse_float)
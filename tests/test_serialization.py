@@ -0,0 +1,65 @@
+import decimal
+import json
+from unittest import TestCase
+import app
+from persistence import serialization
+from persistence.serialization import Serializer
+
+
+class TestSerialization(TestCase):
+
+    def setUp(self):
+        with open('tests/fixtures/AEB.response.json', mode='r') as fixture:
+            self.document = json.load(fixture, parse_float=decimal.Decimal)
+
+    def test_dumps_EveryFormatAndCompression_ExpectDocumentBack(self):
+        # ARRANGE
+        specs = [f'{f}+{c}' for f in serialization.FORMATS for c in ('none', 'zlib', 'lzma', 'bz2')]
+
+        for spec in specs:
+            with self.subTest(spec=spec):
+                # ACT
+                blob = Serializer.from_spec(spec).dumps(self.document)
+
+                # ASSERT
+                self.assertTrue(serialization.is_serialized(blob))
+                self.assertEqual(serialization.loads(blob), self.document)
+
+    def test_dumps_BinaryFormat_ExpectTypesKept(self):
+        # ARRANGE
+        document = {'price': decimal.Decimal('0.1'), 'volume': -12345678901234567890123,
+                    'ratio': 0.5, 'small': -3, 'raw': b'\x00\x01', 'flags': [True, False, None],
+                    'name': 'Ünïcode'}
+
+        # ACT
+        get_it_back = serialization.loads(Serializer('binary').dumps(document))
+
+        # ASSERT
+        self.assertEqual(get_it_back, document)
+        self.assertIsInstance(get_it_back['price'], decimal.Decimal)
+
+    def test_dumps_BinaryFormat_ExpectSmallerThanJson(self):
+        # ACT
+        binary = Serializer('binary').dumps(self.document)
+        json_blob = Serializer('json').dumps(self.document)
+
+        # ASSERT
+        self.assertLess(len(binary), len(json_blob))
+
+    def test_loads_NewerVersion_ExpectAppException(self):
+        # ARRANGE
+        blob = bytearray(Serializer('json').dumps(self.document))
+        blob[len(serialization.MAGIC)] = serialization.VERSION + 1
+
+        # ASSERT
+        with self.assertRaises(app.AppException):
+            serialization.loads(bytes(blob))
+        with self.assertRaises(app.AppException):
+            serialization.loads(b'{"no": "header"}')
+
+    def test_from_spec_UnknownFormat_ExpectAppException(self):
+        # ASSERT
+        with self.assertRaises(app.AppException):
+            Serializer.from_spec('pickle')
+        with self.assertRaises(app.AppException):
+            Serializer.from_spec('json+snappy')
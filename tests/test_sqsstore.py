@@ -55,7 +55,7 @@ class TestSQSStore(TestCase):
             'Queue has more than 1 message'
         )
         self.assertDictEqual(
-            json.loads(get_it_back['Messages'][0]['Body']), 
+            json.loads(get_it_back['Messages'][0]['Body'], parse_float=decimal.Decimal),
             serialized_doc, 'Stored document not equal'
         )
 
@@ -90,6 +90,26 @@ class TestSQSStore(TestCase):
             serialized_doc, 'Stored document not equal'
         )
 
+    def test_store_BinarySerializer_ExpectBase64BodyReadBackWithDecimals(self):
+        # ARRANGE
+        serialized_doc = app.remove_empty_strings(
+            self.read_fixture('tests/fixtures/AEB.response.json')
+        )
+        binary_store = sqsStore(name=name, serializer='binary+zlib')
+
+        # ACT:
+        binary_store.store_documents(documents=[serialized_doc])
+        get_object = sqs_store.get_filtered_documents(numberOfMessages=1)
+
+        # ASSERT:
+        self.assertEqual(get_object.ActionStatus, 0,
+            'Store function should return Success ActionStatus'
+        )
+        self.assertDictEqual(
+            get_object.Results[0],
+            serialized_doc, 'Stored document not equal'
+        )
+
     def read_fixture(self, file: str):
         with open(file, mode='r') as companies_file:
             return json.load(companies_file, parse_float=decimal.Decimal)
\ No newline at end of file